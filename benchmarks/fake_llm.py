@@ -0,0 +1,135 @@
+#fake_llm.py
+#Offline stand-in for the LLM vendor APIs, used by the load tests.
+#Serves the OpenAI chat completions API (also used for DeepSeek and Llama) and the Anthropic
+#messages API, with and without streaming, after a configurable delay.
+#run with: python benchmarks/fake_llm.py --port 8090 --latency-ms 800 --tokens-per-second 80
+
+import argparse, asyncio, json, random, time, uuid
+from aiohttp import web
+
+REPLY = ("A query scoped to one partition is served by a single physical partition, "
+         "so it costs fewer request units than a cross-partition query. ").split(" ")
+
+class FakeLLM:
+    def __init__(self, latency_ms: float, jitter_ms: float, tokens_per_second: float, output_tokens: int):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+
+    def _words(self, max_tokens: int):
+        count = min(self.output_tokens, max_tokens or self.output_tokens)
+        return [REPLY[i % len(REPLY)] for i in range(count)]
+
+    async def _first_token_delay(self):
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        await asyncio.sleep(max(0.0, delay) / 1000)
+
+    async def _token_delay(self):
+        if self.tokens_per_second > 0:
+            await asyncio.sleep(1 / self.tokens_per_second)
+
+    @staticmethod
+    def _prompt_tokens(messages, system="") -> int:
+        text = (system or "") + "".join(str(m.get("content", "")) for m in messages)
+        return max(1, len(text) // 4)
+
+    async def chat_completions(self, request: web.Request):
+        body = await request.json()
+        words = self._words(body.get("max_tokens") or body.get("max_completion_tokens"))
+        usage = {
+            "prompt_tokens": self._prompt_tokens(body.get("messages", [])),
+            "completion_tokens": len(words),
+            "total_tokens": 0,
+            "prompt_tokens_details": {"cached_tokens": 0}
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        await self._first_token_delay()
+
+        if not body.get("stream"):
+            # Without streaming the whole generation time passes before the response
+            await asyncio.sleep(len(words) / self.tokens_per_second if self.tokens_per_second > 0 else 0)
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words)}}],
+                "usage": usage
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in words:
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": body.get("model"),
+                     "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await self._token_delay()
+        final = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                 "model": body.get("model"), "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                 "usage": usage}
+        await response.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+        await response.write_eof()
+        return response
+
+    async def messages(self, request: web.Request):
+        body = await request.json()
+        words = self._words(body.get("max_tokens"))
+        usage = {"input_tokens": self._prompt_tokens(body.get("messages", []), str(body.get("system", ""))),
+                 "output_tokens": len(words), "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+        message_id = f"msg_{uuid.uuid4().hex}"
+        await self._first_token_delay()
+
+        if not body.get("stream"):
+            await asyncio.sleep(len(words) / self.tokens_per_second if self.tokens_per_second > 0 else 0)
+            return web.json_response({
+                "id": message_id, "type": "message", "role": "assistant", "model": body.get("model"),
+                "content": [{"type": "text", "text": " ".join(words)}],
+                "stop_reason": "end_turn", "stop_sequence": None, "usage": usage
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def event(name, data):
+            await response.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+
+        await event("message_start", {"type": "message_start", "message": {
+            "id": message_id, "type": "message", "role": "assistant", "model": body.get("model"), "content": [],
+            "stop_reason": None, "stop_sequence": None, "usage": {**usage, "output_tokens": 0}}})
+        await event("content_block_start", {"type": "content_block_start", "index": 0,
+                                             "content_block": {"type": "text", "text": ""}})
+        for word in words:
+            await event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                 "delta": {"type": "text_delta", "text": word + " "}})
+            await self._token_delay()
+        await event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        await event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+                                      "usage": {"output_tokens": len(words)}})
+        await event("message_stop", {"type": "message_stop"})
+        await response.write_eof()
+        return response
+
+def create_app(fake: FakeLLM) -> web.Application:
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", fake.chat_completions)
+    app.router.add_post("/chat/completions", fake.chat_completions)
+    app.router.add_post("/v1/messages", fake.messages)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=800, help="time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    parser.add_argument("--output-tokens", type=int, default=120)
+    args = parser.parse_args()
+    fake = FakeLLM(args.latency_ms, args.jitter_ms, args.tokens_per_second, args.output_tokens)
+    web.run_app(create_app(fake), host="127.0.0.1", port=args.port, access_log=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#fake_redis.py
+#Local stand-in for a Redis server, for running the shared cache (CACHE_BACKEND=redis) without one.
+#Speaks enough of the RESP2 protocol for utilities/sharedcache.py: PING, GET, MGET, SET with EX/PX,
+#INCR/INCRBY, EXPIRE, DEL, EXISTS, FLUSHALL, PUBLISH, SUBSCRIBE and UNSUBSCRIBE.
+#run with: python benchmarks/fake_redis.py --port 6379
+
+import argparse, asyncio, time
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.subscribers = {}
+
+    def _get(self, key: bytes):
+        entry = self.values.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self.values[key]
+            return None
+        return value
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscriptions = set()
+        try:
+            while True:
+                command = await read_command(reader)
+                if command is None:
+                    break
+                name, args = command[0].upper(), command[1:]
+                if name == b"PING":
+                    writer.write(b"+PONG\r\n")
+                elif name == b"GET":
+                    writer.write(bulk(self._get(args[0])))
+                elif name == b"MGET":
+                    writer.write(b"*%d\r\n" % len(args) + b"".join(bulk(self._get(key)) for key in args))
+                elif name in (b"INCR", b"INCRBY"):
+                    value = int(self._get(args[0]) or 0) + (int(args[1]) if name == b"INCRBY" else 1)
+                    expires_at = self.values[args[0]][1] if args[0] in self.values else None
+                    self.values[args[0]] = (b"%d" % value, expires_at)
+                    writer.write(integer(value))
+                elif name == b"EXPIRE":
+                    value = self._get(args[0])
+                    if value is not None:
+                        self.values[args[0]] = (value, time.monotonic() + float(args[1]))
+                    writer.write(integer(0 if value is None else 1))
+                elif name == b"SET":
+                    expires_at = None
+                    options = [a.upper() for a in args[2:]]
+                    if b"EX" in options:
+                        expires_at = time.monotonic() + float(args[2 + options.index(b"EX") + 1])
+                    if b"PX" in options:
+                        expires_at = time.monotonic() + float(args[2 + options.index(b"PX") + 1]) / 1000
+                    self.values[args[0]] = (args[1], expires_at)
+                    writer.write(b"+OK\r\n")
+                elif name == b"DEL":
+                    removed = sum(1 for key in args if self.values.pop(key, None) is not None)
+                    writer.write(integer(removed))
+                elif name == b"EXISTS":
+                    writer.write(integer(sum(1 for key in args if self._get(key) is not None)))
+                elif name == b"FLUSHALL":
+                    self.values.clear()
+                    writer.write(b"+OK\r\n")
+                elif name == b"PUBLISH":
+                    receivers = list(self.subscribers.get(args[0], ()))
+                    for receiver in receivers:
+                        receiver.write(array([b"message", args[0], args[1]]))
+                    writer.write(integer(len(receivers)))
+                elif name == b"SUBSCRIBE":
+                    for channel in args:
+                        subscriptions.add(channel)
+                        self.subscribers.setdefault(channel, set()).add(writer)
+                        writer.write(array([b"subscribe", channel, len(subscriptions)]))
+                elif name == b"UNSUBSCRIBE":
+                    for channel in args or list(subscriptions):
+                        subscriptions.discard(channel)
+                        self.subscribers.get(channel, set()).discard(writer)
+                        writer.write(array([b"unsubscribe", channel, len(subscriptions)]))
+                elif name in (b"CLIENT", b"SELECT"):
+                    writer.write(b"+OK\r\n")
+                else:
+                    writer.write(f"-ERR unknown command '{name.decode()}'\r\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscriptions:
+                self.subscribers.get(channel, set()).discard(writer)
+            writer.close()
+
+async def read_command(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # Inline command, as sent by redis-cli or telnet
+        return line.strip().split()
+    parts = []
+    for _ in range(int(line[1:])):
+        length = int((await reader.readline())[1:])
+        parts.append((await reader.readexactly(length + 2))[:-2])
+    return parts
+
+def bulk(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+def integer(value: int) -> bytes:
+    return b":%d\r\n" % value
+
+def array(items) -> bytes:
+    return b"*%d\r\n" % len(items) + b"".join(integer(i) if isinstance(i, int) else bulk(i) for i in items)
+
+async def serve(port: int):
+    fake = FakeRedis()
+    server = await asyncio.start_server(fake.handle, "127.0.0.1", port)
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(serve(args.port))
+
+if __name__ == "__main__":
+    main()
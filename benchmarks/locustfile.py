@@ -0,0 +1,94 @@
+#locustfile.py
+#Load test scenarios: login, chat, save, list, search, bootstrap and public conversation views.
+#Normally started by benchmarks/run.py, which also starts the app and the fake LLM server.
+#run by hand with: locust -f benchmarks/locustfile.py --host http://127.0.0.1:8001
+
+import os, random, uuid
+from datetime import datetime
+from locust import HttpUser, between, task
+
+USERS = int(os.getenv("BENCH_USERS", "50"))
+PASSWORD = os.getenv("BENCH_PASSWORD", "bench-password")
+MODEL = os.getenv("BENCH_MODEL", "gpt-4o-mini")
+
+# Magic links published by the simulated users, viewed by everyone
+public_links = []
+
+class ChatUser(HttpUser):
+    wait_time = between(0.5, 2)
+
+    def on_start(self):
+        self.email = f"bench{random.randrange(USERS)}@example.com"
+        self.login()
+        self.saved = []
+        conversation_id = self.save()
+        if conversation_id:
+            response = self.client.put(f"/api/publish-conversation/{conversation_id}", json={"published": True},
+                                       headers=self.headers, name="/api/publish-conversation/[id]")
+            if response.ok and response.json().get("magiclink"):
+                public_links.append(response.json()["magiclink"])
+
+    def login(self):
+        response = self.client.post("/api/token", data={"username": self.email, "password": PASSWORD})
+        self.headers = {"Authorization": f"Bearer {response.json().get('access_token', '')}"} if response.ok else {}
+
+    def messages(self, count: int):
+        history = []
+        for n in range(count):
+            history.append({
+                "role": "user" if n % 2 == 0 else "assistant",
+                "content": f"Benchmark message {n}: how do partition keys affect request units?",
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        return history
+
+    @task(1)
+    def login_task(self):
+        self.login()
+
+    @task(4)
+    def chat(self):
+        self.client.post("/chat", data={
+            "message": "How do partition keys affect request units?",
+            "conversation": "[]",
+            "model": MODEL,
+            "temperature": "0.7",
+            "max_tokens": "200",
+            "system_prompt": "You are a helpful assistant."
+        }, headers=self.headers)
+
+    @task(1)
+    def save(self):
+        response = self.client.post("/api/conversations", json={
+            "name": f"Benchmark {uuid.uuid4().hex[:8]}",
+            "folder": "Benchmarks",
+            "messages": self.messages(20)
+        }, headers=self.headers)
+        if response.ok:
+            self.saved.append(response.json()["id"])
+            return response.json()["id"]
+        return None
+
+    @task(3)
+    def list_conversations(self):
+        self.client.get("/api/conversations", headers=self.headers)
+
+    @task(2)
+    def get_conversation(self):
+        if self.saved:
+            self.client.get(f"/api/conversation/{random.choice(self.saved)}", headers=self.headers,
+                            name="/api/conversation/[id]")
+
+    @task(1)
+    def search(self):
+        self.client.post("/api/conversations/search", json={"query": "partition"}, headers=self.headers)
+
+    @task(1)
+    def bootstrap(self):
+        self.client.get("/api/bootstrap", headers=self.headers)
+
+    @task(3)
+    def public_view(self):
+        if public_links:
+            self.client.get(f"/public-conversation/{random.choice(public_links)}",
+                            name="/public-conversation/[link]")
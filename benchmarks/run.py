@@ -0,0 +1,143 @@
+#run.py
+#Offline load test: starts the fake LLM server and the app on the in-memory repository, runs the
+#locust scenarios headless and reports p50/p95/p99 latency and throughput per endpoint.
+#The result is compared with benchmarks/baseline.json; --update-baseline replaces it.
+#run with: pip install -r benchmarks/requirements.txt && python benchmarks/run.py --duration 60s
+
+import argparse, csv, json, os, subprocess, sys, tempfile, time, urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import seed
+
+def wait_for(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout} seconds")
+
+def app_environment(args, seed_file: str) -> dict:
+    fake_llm = f"http://127.0.0.1:{args.llm_port}"
+    env = dict(os.environ)
+    env.update({
+        "REPOSITORY_BACKEND": "memory",
+        "REPOSITORY_SEED_FILE": seed_file,
+        "ENVIRONMENT": "benchmark",
+        "SECRET_KEY": "benchmark-secret",
+        "ALGORITHM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+        "MAIL_PORT": "587",
+        "MODEL": seed.BENCH_MODEL,
+        "SYSTEM_PROMPT_SUPPORTED": "Yes",
+        "SYSTEM_PROMPT": "You are a helpful assistant.",
+        "TEMPERATURE": "0.7",
+        "MAX_TOKENS": "200",
+        "OPENAI_API_KEY": "benchmark", "OPENAI_BASE_URL": f"{fake_llm}/v1",
+        "ANTHROPIC_API_KEY": "benchmark", "ANTHROPIC_BASE_URL": fake_llm,
+        "DEEPSEEK_API_KEY": "benchmark", "DEEPSEEK_URL": f"{fake_llm}/v1",
+        "LLAMA_API_KEY": "benchmark", "LLAMA_URL": f"{fake_llm}/v1",
+        "GEMINI_API_KEY": "benchmark",
+        "RATE_LIMIT_USER_RPM": "100000",
+        "RATE_LIMIT_USER_TPM": "100000000",
+        "RESPONSE_CACHE_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+        "BENCH_USERS": str(args.seed_users)
+    })
+    return env
+
+def read_stats(csv_prefix: str) -> dict:
+    results = {}
+    with open(f"{csv_prefix}_stats.csv") as f:
+        for row in csv.DictReader(f):
+            name = row["Name"] if row["Name"] == "Aggregated" else f"{row['Type']} {row['Name']}"
+            results[name] = {
+                "requests": int(row["Request Count"]),
+                "failures": int(row["Failure Count"]),
+                "p50_ms": float(row["50%"] or 0),
+                "p95_ms": float(row["95%"] or 0),
+                "p99_ms": float(row["99%"] or 0),
+                "rps": float(row["Requests/s"] or 0)
+            }
+    return results
+
+def report(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    print(f"{'endpoint':<44}{'requests':>9}{'fail':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>8}  baseline p95")
+    for name, stats in sorted(results.items(), key=lambda item: item[0] == "Aggregated"):
+        previous = baseline.get(name, {}).get("p95_ms")
+        note = ""
+        if previous:
+            change = stats["p95_ms"] / previous - 1 if previous else 0
+            note = f"{previous:.0f} ({change:+.0%})"
+            if change > tolerance:
+                regressions.append(name)
+                note += " REGRESSION"
+        print(f"{name:<44}{stats['requests']:>9}{stats['failures']:>6}{stats['p50_ms']:>9.0f}"
+              f"{stats['p95_ms']:>9.0f}{stats['p99_ms']:>9.0f}{stats['rps']:>8.1f}  {note}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50, help="concurrent simulated users")
+    parser.add_argument("--spawn-rate", type=float, default=10)
+    parser.add_argument("--duration", default="60s")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--llm-port", type=int, default=8090)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--seed-users", type=int, default=50)
+    parser.add_argument("--baseline", default=os.path.join(BENCH_DIR, "baseline.json"))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 increase over the baseline")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    seed_file = os.path.join(workdir, "seed.json")
+    with open(seed_file, "w") as f:
+        json.dump(seed.build(args.seed_users, conversations=20, messages=30), f)
+
+    env = app_environment(args, seed_file)
+    processes = []
+    try:
+        processes.append(subprocess.Popen(
+            [sys.executable, os.path.join(BENCH_DIR, "fake_llm.py"), "--port", str(args.llm_port),
+             "--latency-ms", str(args.llm_latency_ms)], cwd=ROOT_DIR))
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+             "--workers", str(args.workers), "--no-access-log"], cwd=ROOT_DIR, env=env))
+        wait_for(f"http://127.0.0.1:{args.port}/healthz")
+
+        csv_prefix = os.path.join(workdir, "locust")
+        subprocess.run(
+            ["locust", "-f", os.path.join(BENCH_DIR, "locustfile.py"), "--headless", "--only-summary",
+             "-u", str(args.users), "-r", str(args.spawn_rate), "-t", args.duration,
+             "--host", f"http://127.0.0.1:{args.port}", "--csv", csv_prefix],
+            cwd=ROOT_DIR, env=env, check=False)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=10)
+
+    results = read_stats(csv_prefix)
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline, args.tolerance)
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+    if regressions:
+        print(f"p95 regressed by more than {args.tolerance:.0%} for: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#seed.py
+#Fixture documents for the load tests, loaded by the in-memory repository through
+#REPOSITORY_SEED_FILE. Every user is bench{n}@example.com with the password BENCH_PASSWORD.
+#run with: python benchmarks/seed.py --users 50 --conversations 20 --output benchmarks/seed.json
+
+import argparse, json, uuid
+from datetime import datetime, timedelta
+from passlib.context import CryptContext
+
+BENCH_PASSWORD = "bench-password"
+BENCH_MODEL = "gpt-4o-mini"
+
+MODELS = [
+    {
+        "id": BENCH_MODEL, "value": BENCH_MODEL, "label": "GPT-4o mini", "vendor": "OpenAI",
+        "system_prompt_supported": "Yes", "short_description": "Served by benchmarks/fake_llm.py",
+        "context_window": 128000, "max_output_tokens": 16384, "knowledge_cutoff": "October 2023",
+        "cost_per_1m_tokens_input": 0.15, "cost_per_1m_tokens_output": 0.60,
+        "type": "llm_model", "show_in_prod": "Yes"
+    },
+    {
+        "id": "claude-3-5-haiku-20241022", "value": "claude-3-5-haiku-20241022", "label": "Claude 3.5 Haiku",
+        "vendor": "Anthropic", "system_prompt_supported": "Yes", "short_description": "Served by benchmarks/fake_llm.py",
+        "context_window": 200000, "max_output_tokens": 8192, "knowledge_cutoff": "July 2024",
+        "cost_per_1m_tokens_input": 0.80, "cost_per_1m_tokens_output": 4.00,
+        "type": "llm_model", "show_in_prod": "Yes"
+    }
+]
+
+def user_email(n: int) -> str:
+    return f"bench{n}@example.com"
+
+def build(users: int, conversations: int, messages: int) -> dict:
+    password_hash = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(BENCH_PASSWORD)
+    started = datetime(2025, 1, 1)
+    fixtures = {"users": [], "conversations": [], "models": MODELS, "system messages": []}
+
+    for category in ("Fun", "Work"):
+        for order in range(5):
+            fixtures["system messages"].append({
+                "id": str(uuid.uuid4()), "name": f"{category} preset {order}", "category": category,
+                "message": f"You are a {category.lower()} assistant number {order}.",
+                "description": "Benchmark preset", "displayOrder": order, "isActive": True
+            })
+
+    for n in range(users):
+        user_id = str(uuid.uuid4())
+        fixtures["users"].append({
+            "id": user_id, "partitionKey": f"USER#{user_id}", "type": "user", "email": user_email(n),
+            "password_hash": password_hash, "is_active": True, "verified": True,
+            "created_at": started.isoformat()
+        })
+        for c in range(conversations):
+            history = [{"role": "system", "content": "You are a helpful assistant.",
+                        "timestamp": started.isoformat(), "model": None}]
+            for m in range(messages):
+                role = "user" if m % 2 == 0 else "assistant"
+                history.append({
+                    "role": role,
+                    "content": f"Message {m} about partition keys and request units in conversation {c}.",
+                    "timestamp": (started + timedelta(minutes=m)).isoformat(),
+                    "model": BENCH_MODEL if role == "assistant" else None
+                })
+            fixtures["conversations"].append({
+                "id": str(uuid.uuid4()), "partitionKey": f"CHAT#{user_id}", "type": "conversation",
+                "user_id": user_id, "name": f"Conversation {c}", "folder": f"Folder {c % 4}",
+                "messages": history,
+                "created_at": (started + timedelta(days=c)).isoformat(),
+                "updated_at": (started + timedelta(days=c)).isoformat()
+            })
+    return fixtures
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=30)
+    parser.add_argument("--output", default="benchmarks/seed.json")
+    args = parser.parse_args()
+    with open(args.output, "w") as f:
+        json.dump(build(args.users, args.conversations, args.messages), f)
+    print(f"Wrote {args.users} users with {args.conversations} conversations each to {args.output}")
+
+if __name__ == "__main__":
+    main()
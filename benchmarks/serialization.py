@@ -0,0 +1,73 @@
+#serialization.py
+#Compares FastAPI's default JSON rendering with ORJSONResponse for a 500 message conversation,
+#and the bytes sent with no compression, gzip and brotli.
+#run with: python benchmarks/serialization.py [--messages 500] [--repeat 50]
+
+import argparse, gzip, json, statistics, sys, time, uuid
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def build_conversation(message_count: int):
+    started = datetime(2025, 1, 1)
+    messages = [{"role": "system", "content": "You are a helpful assistant.", "timestamp": started.isoformat()}]
+    for i in range(message_count - 1):
+        role = "user" if i % 2 == 0 else "assistant"
+        text = ("Can you explain how the partition key affects query cost? " * 3 if role == "user"
+                else "A query scoped to one partition is served by a single physical partition. " * 12
+                + "```python\nitems = container.query_items(query, partition_key=pk)\n```")
+        messages.append({
+            "role": role,
+            "content": text,
+            "timestamp": (started + timedelta(seconds=30 * i)).isoformat(),
+            "model": None if role == "user" else "gpt-4o-mini"
+        })
+    return {"id": str(uuid.uuid4()), "name": "Benchmark", "folder": "Benchmarks", "messages": messages}
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    conversation = build_conversation(args.messages)
+
+    # What FastAPI does for a returned dict, and what the hot endpoints do now
+    default_ms = timed(lambda: JSONResponse(jsonable_encoder(conversation)).body, args.repeat)
+    orjson_ms = timed(lambda: ORJSONResponse(conversation).body, args.repeat)
+
+    raw = ORJSONResponse(conversation).body
+    assert json.loads(raw) == json.loads(JSONResponse(jsonable_encoder(conversation)).body)
+    gzip_ms = timed(lambda: gzip.compress(raw, compresslevel=6), args.repeat)
+    gzipped = gzip.compress(raw, compresslevel=6)
+
+    print(f"Conversation with {args.messages} messages, median of {args.repeat} runs")
+    print(f"{'serializer':<28}{'ms':>10}")
+    print(f"{'jsonable_encoder + json':<28}{default_ms:>10.2f}")
+    print(f"{'orjson':<28}{orjson_ms:>10.2f}")
+    print(f"{'speedup':<28}{default_ms / orjson_ms:>9.1f}x")
+    print()
+    print(f"{'encoding':<28}{'bytes':>10}{'ms':>10}")
+    print(f"{'identity':<28}{len(raw):>10}{0:>10.2f}")
+    print(f"{'gzip (level 6)':<28}{len(gzipped):>10}{gzip_ms:>10.2f}")
+    if brotli is not None:
+        brotli_ms = timed(lambda: brotli.compress(raw, quality=4), args.repeat)
+        print(f"{'brotli (quality 4)':<28}{len(brotli.compress(raw, quality=4)):>10}{brotli_ms:>10.2f}")
+    else:
+        print("brotli not installed, skipped", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#startup.py
+#Cold start benchmark: imports main.py in a fresh interpreter with python -X importtime and reports
+#the total import time and the slowest modules. Fails when the import takes longer than the budget
+#or when one of the vendor SDKs, which main.py loads on first use only, is imported at startup.
+#run with: python benchmarks/startup.py --budget 1.5 --runs 5
+
+import argparse, os, re, statistics, subprocess, sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cold start target for one worker on Azure App Service, where every worker imports main.py on boot
+DEFAULT_BUDGET_SECONDS = 1.5
+
+# Loaded by the provider registry and the mailer on first use, never at import time
+DEFERRED_MODULES = ["openai", "anthropic", "google.genai", "fastapi_mail"]
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+def startup_environment() -> dict:
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "startup-benchmark")
+    env.setdefault("ALGORITHM", "HS256")
+    env.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+    env.setdefault("MAIL_PORT", "587")
+    env.setdefault("REPOSITORY_BACKEND", "memory")
+    env.setdefault("ENVIRONMENT", "benchmark")
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+def measure() -> list:
+    """One cold import of main.py: (cumulative microseconds, depth, module) per imported module."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                               cwd=ROOT_DIR, env=startup_environment(), capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr[-4000:])
+        raise RuntimeError("Importing main.py failed")
+    modules = []
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            modules.append((int(match.group(2)), (len(match.group(3)) - 1) // 2, match.group(4)))
+    return modules
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=float(os.getenv("STARTUP_BUDGET_SECONDS", DEFAULT_BUDGET_SECONDS)),
+                        help="maximum median import time of main.py in seconds")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="number of slowest modules to list")
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    totals = [sum(cumulative for cumulative, depth, _ in modules if depth == 0) / 1e6 for modules in runs]
+    median = statistics.median(totals)
+
+    print(f"import main: median {median:.3f}s, min {min(totals):.3f}s, max {max(totals):.3f}s over {args.runs} runs")
+    print("slowest top-level imports of the last run:")
+    top_level = sorted((m for m in runs[-1] if m[1] == 0), reverse=True)[:args.top]
+    for cumulative, _, module in top_level:
+        print(f"  {cumulative / 1000:9.1f} ms  {module}")
+
+    failed = False
+    imported = {module for _, _, module in runs[-1]}
+    eager = [module for module in DEFERRED_MODULES if module in imported]
+    if eager:
+        print(f"Imported at startup but expected on first use only: {', '.join(eager)}")
+        failed = True
+    if median > args.budget:
+        print(f"Startup budget exceeded: {median:.3f}s > {args.budget:.3f}s")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#workers.py
+#Compares gunicorn with and without --preload: time until every worker serves /healthz and the
+#proportional (PSS) and private memory of each worker, read from /proc (Linux only).
+#The app runs on the seeded in-memory repository, like benchmarks/run.py.
+#run with: python benchmarks/workers.py --workers 4
+
+import argparse, json, os, subprocess, sys, tempfile, time, urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import seed
+
+def children(pid: int) -> list:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+def memory(pid: int) -> dict:
+    """PSS and private memory of a process in MiB."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {"pss": values.get("Pss", 0), "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)}
+
+def boot(preload: bool, args, env: dict) -> dict:
+    env = dict(env, GUNICORN_PRELOAD="true" if preload else "false", WEB_CONCURRENCY=str(args.workers),
+               PORT=str(args.port))
+    started = time.monotonic()
+    master = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+                              cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        # Ready once every worker has started and the app answers
+        while True:
+            if time.monotonic() - started > 60:
+                raise RuntimeError("gunicorn did not start within 60 seconds")
+            try:
+                if len(children(master.pid)) == args.workers:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{args.port}/healthz", timeout=1):
+                        break
+            except Exception:
+                pass
+            time.sleep(0.05)
+        boot_seconds = time.monotonic() - started
+        # Serve some requests so the workers touch the shared data, as in production
+        for _ in range(args.workers * 10):
+            for path in ("/api/models", "/api/system-messages", "/"):
+                urllib.request.urlopen(f"http://127.0.0.1:{args.port}{path}", timeout=5).read()
+        workers = [memory(pid) for pid in children(master.pid)]
+        return {
+            "preload": preload,
+            "boot_seconds": boot_seconds,
+            "worker_pss_mib": sum(w["pss"] for w in workers) / len(workers),
+            "worker_private_mib": sum(w["private"] for w in workers) / len(workers),
+            "total_pss_mib": sum(w["pss"] for w in workers) + memory(master.pid)["pss"]
+        }
+    finally:
+        master.terminate()
+        master.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--seed-users", type=int, default=50)
+    args = parser.parse_args()
+
+    seed_file = os.path.join(tempfile.mkdtemp(prefix="bench-"), "seed.json")
+    with open(seed_file, "w") as f:
+        json.dump(seed.build(args.seed_users, conversations=20, messages=30), f)
+    env = dict(os.environ, REPOSITORY_BACKEND="memory", REPOSITORY_SEED_FILE=seed_file, ENVIRONMENT="benchmark",
+               SECRET_KEY="benchmark-secret", ALGORITHM="HS256", ACCESS_TOKEN_EXPIRE_MINUTES="60", MAIL_PORT="587",
+               LOG_LEVEL="WARNING")
+
+    print(f"{'mode':<12}{'boot s':>8}{'PSS/worker MiB':>16}{'private/worker MiB':>20}{'total PSS MiB':>15}")
+    for preload in (False, True):
+        result = boot(preload, args, env)
+        print(f"{'preload' if preload else 'no preload':<12}{result['boot_seconds']:>8.2f}{result['worker_pss_mib']:>16.1f}"
+              f"{result['worker_private_mib']:>20.1f}{result['total_pss_mib']:>15.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+#gunicorn.conf.py
+#start with: gunicorn -c gunicorn.conf.py main:app
+#
+#With GUNICORN_PRELOAD=true (the default) main.py is imported once in the master. The model catalog,
+#the system message library and the compiled templates are loaded there too, then frozen out of the
+#garbage collector so the forked workers share their memory pages copy-on-write.
+#Everything that owns a connection or a thread (Cosmos DB client, LLM clients, log listener) is
+#created in each worker after the fork.
+
+import gc, os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "600"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before the first worker is forked
+    if not preload_app:
+        return
+    import main
+    main.preload()
+    # Objects in the permanent generation are never scanned, so a collection in a worker
+    # does not write to their headers and copy the pages they live on
+    gc.freeze()
+
+def post_fork(server, worker):
+    if preload_app:
+        import main
+        main.after_fork()
+
+def child_exit(server, worker):
+    # Drop the live gauges of a dead worker from the /metrics aggregate
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -2,34 +2,43 @@
 #start with: uvicorn main:app --host 0.0.0.0 --port 8001 --reload
 #see docs: http://127.0.0.1:8001/docs
 
-import json, logging, openai, os, re, secrets, uuid, anthropic, asyncio
-from azure.cosmos import CosmosClient, PartitionKey, exceptions
+import hashlib, json, logging, os, re, secrets, uuid, asyncio
+import orjson
+from azure.cosmos import exceptions
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, Form, HTTPException, Depends, status, APIRouter, BackgroundTasks, APIRouter, Query, Body
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse, FileResponse, HTMLResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, RedirectResponse, FileResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from google import genai
-from google.genai import types
 from jose import JWTError, jwt
-from logging.handlers import RotatingFileHandler
-from openai import OpenAI
 from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional, Dict, Any
-
-# Create logs directory if it doesn't exist
-if not os.path.exists('logs'):
-    os.mkdir('logs')
-
-# Configure logging
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]',
-                    handlers=[RotatingFileHandler('logs/myapp.log', maxBytes=10240, backupCount=10)])
+from utilities import metrics
+from utilities.archive import ArchiveError, BatchWriter, export_chunks, gunzip, limited, ndjson_lines, zip_ndjson
+from utilities.assets import AssetManifest, CachedStaticFiles, StaticFilesBypass
+from utilities.authentication import AuthenticationMiddleware, RouteTable, decode_token
+from utilities.bulk import run_batches
+from utilities.catalog import ModelCatalog, SystemMessageLibrary
+from utilities.compression import CompressionMiddleware
+from utilities.failover import FailoverRouter, ProvidersUnavailable
+from utilities.logs import log_payload, setup_logging
+from utilities.projections import ChangeFeedProcessor, ConversationProjector, index_conversations, index_folders, search_entry
+from utilities.providers import AnthropicAdapter, GeminiAdapter, OpenAIAdapter, ProviderRegistry, honours_temperature, select_provider
+from utilities.ratelimit import AdmissionController, RateLimited, estimate_tokens
+from utilities.repository import ConcurrencyConflict, ConversationRepository, create_repository, conversation_partition_key, public_conversation_partition_key, SYSTEM_PROPERTIES
+from utilities.responsecache import MemoryCacheStore, ResponseCache
+from utilities.sharedcache import create_cache
+from utilities.singleflight import SingleFlight
+from utilities.transport import TransportRegistry
+from utilities.viewcounter import ViewCounter
+from utilities.writebehind import WriteBehindBuffer
+
+# Configure logging: JSON lines written by a background thread
+log_listener = setup_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -44,6 +53,15 @@ class Conversation(BaseModel):
     folder: str
     messages: List[Message]
 
+class BulkRequest(BaseModel):
+    ids: List[str]
+
+class BulkMoveRequest(BulkRequest):
+    folder: str
+
+class BulkPublishRequest(BulkRequest):
+    published: bool
+
 class ChatSettings(BaseModel):
     system_prompt: str
     model: str
@@ -83,7 +101,177 @@ class SetPasswordRequest(BaseModel):
     password: str
 
 load_dotenv(override=True)
-app = FastAPI()
+
+# Cosmos DB setup: the repository is created at import time but only connects in the lifespan hook,
+# so each worker owns exactly one async client and connection pool
+repository = create_repository()
+
+# HTTP connection pools for the LLM providers
+transports = TransportRegistry()
+
+# Concurrent identical reads share one Cosmos DB query
+reads = SingleFlight()
+
+# Users, catalogs and conversation lists, cached per worker and in the shared cache of CACHE_BACKEND
+cache = create_cache()
+
+async def conversations_changed(user_id: str):
+    """Drop the cached conversation list and folders of a user after one of their conversations changed."""
+    await cache.invalidate(f"conversations:{user_id}", f"folders:{user_id}")
+
+# Views of public conversations, written to Cosmos DB in batches
+view_counter = ViewCounter(
+    lambda public_id, count: repository.public_conversations.add_views(public_id, count),
+    interval=float(os.getenv("VIEW_FLUSH_INTERVAL_SECONDS", "30"))
+)
+
+# Conversation lists, folders and search served from projections kept up to date by the change feed
+PROJECTIONS_ENABLED = os.getenv("PROJECTIONS_ENABLED", "false").lower() == "true"
+projector = ConversationProjector(
+    repository,
+    public_snapshot=lambda conversation: sync_public_snapshot(conversation),
+    on_change=conversations_changed
+)
+projection_processor = ChangeFeedProcessor(
+    repository,
+    projector,
+    poll_interval=float(os.getenv("PROJECTIONS_POLL_SECONDS", "1")),
+    lease_seconds=float(os.getenv("PROJECTIONS_LEASE_SECONDS", "30"))
+)
+
+async def conversation_written(conversation):
+    """Update the projections and drop the cached lists after a conversation was created or replaced."""
+    await conversations_written(conversation['user_id'], [conversation])
+
+async def conversations_written(user_id: str, conversations):
+    if PROJECTIONS_ENABLED and conversations:
+        try:
+            # The handlers refresh the public snapshot themselves
+            await projector.apply_many(user_id, conversations, sync_snapshot=False)
+        except Exception as e:
+            # The change feed processor applies them on its next pass
+            logger.error(f"Error projecting conversations {', '.join(c['id'] for c in conversations)}: {str(e)}")
+    await conversations_changed(user_id)
+
+async def conversation_deleted(user_id: str, conversation_id: str):
+    await conversations_deleted(user_id, [conversation_id])
+
+async def conversations_deleted(user_id: str, conversation_ids):
+    for conversation_id in conversation_ids:
+        write_behind.discard((user_id, conversation_id))
+    if PROJECTIONS_ENABLED and conversation_ids:
+        try:
+            await projector.remove_many(user_id, conversation_ids)
+        except Exception as e:
+            # Deletes are not in the change feed; only a rebuild removes these now
+            logger.error(f"Error removing conversations {', '.join(conversation_ids)} from the projections: {str(e)}")
+    await conversations_changed(user_id)
+
+# Every write of a conversation gives it a new version, handed to the client as the ETag and sent
+# back in If-Match; a change based on an outdated copy is refused with 412. The _etag cannot serve
+# for this: a buffered autosave has none until it is written.
+def new_version() -> str:
+    return uuid.uuid4().hex
+
+def version_etag(version: Optional[str]) -> str:
+    # Conversations written before versions existed are version "0"
+    return f'"{version or "0"}"'
+
+def if_match(request: Request) -> Optional[str]:
+    """The version a change is based on, from If-Match; None if the client sent none or "*"."""
+    value = (request.headers.get("if-match") or "").strip()
+    if not value or value == "*":
+        return None
+    return value.removeprefix("W/").strip('"')
+
+def version_conflict() -> HTTPException:
+    return HTTPException(
+        status_code=412,
+        detail="The conversation was changed in another tab or window. Reload it and try again."
+    )
+
+def autosave_conflict() -> HTTPException:
+    return HTTPException(
+        status_code=412,
+        detail="Your last changes were not saved: the conversation was changed in another tab or window. Reload it and try again."
+    )
+
+def versioned_response(conversation) -> ORJSONResponse:
+    return ORJSONResponse(conversation, headers={"ETag": version_etag(conversation.get('version'))})
+
+async def write_conversation(conversation, etag):
+    """Write a buffered autosave over the stored version it was based on; returns the new _etag.
+
+    Raises ConcurrencyConflict if that version was replaced meanwhile; the buffer then drops the
+    autosave and marks the conversation conflicted.
+    """
+    try:
+        result = await repository.conversations.replace(conversation, etag=etag)
+    except exceptions.CosmosResourceNotFoundError:
+        # Deleted meanwhile
+        return None
+    await conversation_written(result)
+    if result.get('published'):
+        await sync_public_snapshot(result)
+    return result.get('_etag')
+
+# Autosaves of the same conversation within WRITE_BEHIND_SECONDS are written once; off unless WRITE_BEHIND_ENABLED=true
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+write_behind = WriteBehindBuffer(
+    write_conversation,
+    delay=float(os.getenv("WRITE_BEHIND_SECONDS", "2")),
+    max_delay=float(os.getenv("WRITE_BEHIND_MAX_SECONDS", "10"))
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await repository.connect()
+    await cache.start()
+    view_counter.start()
+    if PROJECTIONS_ENABLED:
+        projection_processor.start()
+    try:
+        yield
+    finally:
+        await write_behind.flush_all()
+        providers.clear()
+        await transports.aclose()
+        await view_counter.stop()
+        await projection_processor.stop()
+        await cache.close()
+        await repository.close()
+
+def preload():
+    """Load the read-only data shared by all workers.
+
+    Called by gunicorn.conf.py in the master process when the app is preloaded, before the workers
+    are forked. The Cosmos DB client used here is closed again; each worker connects in its lifespan.
+    """
+    async def load():
+        await repository.connect()
+        await cache.start()
+        try:
+            await asyncio.gather(model_catalog.refresh(), system_message_library.refresh())
+            # Shared copy-on-write with the workers as long as nobody reloads them. Only a shared cache
+            # tells the workers about changes; without one the catalogs expire after CATALOG_TTL_SECONDS.
+            model_catalog.pinned = system_message_library.pinned = cache.l2 is not None
+        finally:
+            await cache.close()
+            await repository.close()
+    try:
+        asyncio.run(load())
+    except Exception as e:
+        # The workers load the catalogs on first use instead
+        logger.error(f"Error preloading catalogs: {str(e)}")
+    for name in templates.env.list_templates():
+        templates.get_template(name)
+
+def after_fork():
+    """Start the threads of a worker forked from a preloaded master; threads do not survive fork."""
+    global log_listener
+    log_listener = setup_logging()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -93,30 +281,82 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Compress JSON payloads such as /api/bootstrap and full conversations (brotli or gzip)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1000")),
+    gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+    brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+)
+
+# Static assets; the hashed files built by utilities/build_assets.py are referenced through asset_url
+static_files = CachedStaticFiles(directory="static")
+app.mount("/static", static_files, name="static")
+assets = AssetManifest("static")
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = assets.url
 
 environment = os.getenv("ENVIRONMENT")
-logger.info("environment: " + environment)
+logger.info("environment: %s", environment)
+
+# Adapters used by the /chat endpoint, keyed by provider. Each one is created on its first request,
+# importing its vendor SDK only then, and shares the per-worker connection pools of the transport registry.
+def create_openai_compatible(provider: str, api_key: str, base_url: Optional[str] = None):
+    from openai import AsyncOpenAI
+    client = AsyncOpenAI(api_key=os.getenv(api_key), base_url=os.getenv(base_url) if base_url else None,
+                         http_client=transports.client(provider))
+    return OpenAIAdapter(provider, client)
+
+def create_anthropic():
+    from anthropic import AsyncAnthropic
+    return AnthropicAdapter(AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), http_client=transports.client("anthropic")))
+
+def create_google():
+    from google import genai
+    from google.genai import types
+    return GeminiAdapter(genai.Client(api_key=os.getenv("GEMINI_API_KEY"),
+                                      http_options=types.HttpOptions(async_client_args=transports.client_args("google"))))
+
+providers = ProviderRegistry({
+    "openai": lambda: create_openai_compatible("openai", "OPENAI_API_KEY"),
+    "deepseek": lambda: create_openai_compatible("deepseek", "DEEPSEEK_API_KEY", "DEEPSEEK_URL"),
+    "llama": lambda: create_openai_compatible("llama", "LLAMA_API_KEY", "LLAMA_URL"),
+    "anthropic": create_anthropic,
+    "google": create_google
+})
+
+# Exact-match cache for /chat responses
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+response_cache = ResponseCache(
+    MemoryCacheStore(
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000")),
+        max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    ),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+)
 
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"),)
-deepseek_client = OpenAI(api_key=os.getenv("DEEPSEEK_API_KEY"), base_url=os.getenv("DEEPSEEK_URL"))
-google_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-llama_client = OpenAI(api_key=os.getenv("LLAMA_API_KEY"), base_url=os.getenv("LLAMA_URL"))
+# Model catalog used to price LLM calls and to list the models, and the system message library
+model_catalog = ModelCatalog(
+    lambda: cache.get_or_load("catalog:models", lambda: reads.do(("models", True), lambda: repository.models.list(include_hidden=True))),
+    ttl=float(os.getenv("CATALOG_TTL_SECONDS", "300"))
+)
+system_message_library = SystemMessageLibrary(
+    lambda: cache.get_or_load("catalog:system_messages", lambda: reads.do(("system_messages",), repository.system_messages.list_active)),
+    ttl=float(os.getenv("CATALOG_TTL_SECONDS", "300"))
+)
+
+cache.on_invalidate("catalog:models", model_catalog.invalidate)
+cache.on_invalidate("catalog:system_messages", system_message_library.invalidate)
+
+# Fallback chains, circuit breakers and hedging for the /chat endpoint
+failover = FailoverRouter(providers, model_catalog.get)
+
+# Per-user and per-model rate limits and concurrency slots for the /chat endpoint
+admission = AdmissionController()
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Cosmos DB setup
-cosmos_client = CosmosClient.from_connection_string(os.getenv("COSMOS_CONNECTION_STRING"))
-database = cosmos_client.get_database_client("chat_app")
-usercontainer = database.get_container_client("users")
-conversationcontainer = database.get_container_client("conversations")
-tokencontainer = database.get_container_client("tokens")
-modelcontainer = database.get_container_client("models")
-systemmessagescontainer = database.get_container_client("system messages")
-
 # JWT Configuration
 SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
@@ -130,22 +370,48 @@ if not ACCESS_TOKEN_EXPIRE_MINUTES:
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/token")
 
-# Configuration for sending emails
-conf = ConnectionConfig(
-    MAIL_USERNAME = os.getenv("MAIL_USERNAME"),
-    MAIL_PASSWORD = os.getenv("MAIL_PASSWORD"),
-    MAIL_FROM = os.getenv("MAIL_FROM"),
-    MAIL_FROM_NAME = os.getenv("MAIL_FROM_NAME"),
-    MAIL_PORT = int(os.getenv("MAIL_PORT")),
-    MAIL_SERVER = os.getenv("MAIL_SERVER"),
-    MAIL_STARTTLS = os.getenv("MAIL_STARTTLS"),
-    MAIL_SSL_TLS = os.getenv("MAIL_SSL_TLS"),
-    USE_CREDENTIALS = os.getenv("USE_CREDENTIALS"),
-    VALIDATE_CERTS=os.getenv("VALIDATE_CERTS"),
-    TEMPLATE_FOLDER = os.getenv("TEMPLATE_FOLDER") #Path(__file__).parent / 'templates'
-)
+# Add a Server-Timing header with the Cosmos DB time and request units of each response
+COSMOS_SERVER_TIMING = os.getenv("COSMOS_SERVER_TIMING", "false").lower() == "true"
+
+# Bearer token of the Prometheus scraper; /metrics is not served without one
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Proxies in front of the app that append to X-Forwarded-For: the App Service front end.
+# 0 when clients connect directly, so the header is not trusted at all.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
+# Email client, created when the first email is sent
+fast_mail = None
+
+def mailer():
+    global fast_mail
+    if fast_mail is None:
+        from fastapi_mail import FastMail, ConnectionConfig
+        conf = ConnectionConfig(
+            MAIL_USERNAME = os.getenv("MAIL_USERNAME"),
+            MAIL_PASSWORD = os.getenv("MAIL_PASSWORD"),
+            MAIL_FROM = os.getenv("MAIL_FROM"),
+            MAIL_FROM_NAME = os.getenv("MAIL_FROM_NAME"),
+            MAIL_PORT = int(os.getenv("MAIL_PORT")),
+            MAIL_SERVER = os.getenv("MAIL_SERVER"),
+            MAIL_STARTTLS = os.getenv("MAIL_STARTTLS"),
+            MAIL_SSL_TLS = os.getenv("MAIL_SSL_TLS"),
+            USE_CREDENTIALS = os.getenv("USE_CREDENTIALS"),
+            VALIDATE_CERTS=os.getenv("VALIDATE_CERTS"),
+            TEMPLATE_FOLDER = os.getenv("TEMPLATE_FOLDER") #Path(__file__).parent / 'templates'
+        )
+        fast_mail = FastMail(conf)
+    return fast_mail
 
-fast_mail = FastMail(conf)
+async def send_plain_email(email: str, subject: str, body: str):
+    from fastapi_mail import MessageSchema
+    message_obj = MessageSchema(
+        subject=subject,
+        recipients=[email],
+        body=body,
+        subtype="plain"
+    )
+    await mailer().send_message(message=message_obj)
 
 async def send_verification_email(email: str, verification_token: str):
     subject = "Email Verification for Predictum IT ChatApp"
@@ -162,25 +428,20 @@ async def send_verification_email(email: str, verification_token: str):
     If you didn't request this verification, please ignore this email.
     """
     
-    message_obj = MessageSchema(
-        subject=subject,
-        recipients=[email],
-        body=message,
-        subtype="plain"
-    )
-
-    await fast_mail.send_message(message=message_obj)
+    await send_plain_email(email, subject, message)
 
-@app.get("/settings")
-async def get_settings():
-    settings = {
+def default_settings():
+    return {
         "model": os.getenv("MODEL"),
         "system_prompt_supported": os.getenv("SYSTEM_PROMPT_SUPPORTED"),
         "system_prompt": os.getenv("SYSTEM_PROMPT"),
         "temperature": float(os.getenv("TEMPERATURE")),
         "max_tokens": int(os.getenv("MAX_TOKENS"))
     }
-    return JSONResponse(content=settings)
+
+@app.get("/settings")
+async def get_settings():
+    return JSONResponse(content=default_settings())
 
 # Helper functions for authentication
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -194,8 +455,15 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 # Get current user
+async def load_current_user(email: str):
+    user = await reads.do(("user", email), lambda: repository.users.get_by_email(email, user_only=True))
+    if user is None:
+        return None
+    # The password hash is never needed after login and must not sit in the shared cache
+    return {key: value for key, value in user.items() if key != "password_hash"}
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
-    logger.info("=== Token Validation ===")
+    logger.debug("=== Token Validation ===")
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -203,32 +471,25 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     )
     
     try:
-        logger.info("Attempting to decode token")
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        logger.debug("Attempting to decode token")
+        payload = decode_token(token, SECRET_KEY, ALGORITHM)
         email: str = payload.get("sub")
-        logger.info(f"Token decoded successfully for email: {email}")
+        logger.debug("Token decoded successfully for email: %s", email)
         
         if email is None:
             logger.error("No email in token payload")
             raise credentials_exception
 
         # Query user from database
-        query = "SELECT * FROM c WHERE c.email = @email AND c.type = 'user'"
-        parameters = [{"name": "@email", "value": email}]
-        
-        users = list(usercontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
+        user = await cache.get_or_load(f"user:{email}", lambda: load_current_user(email))
 
-        if not users:
+        if not user:
             logger.error("User not found in database")
             raise credentials_exception
 
-        logger.info("User authenticated successfully")
-        logger.info("=== Token Validation Complete ===")
-        return users[0]
+        logger.debug("User authenticated successfully")
+        logger.debug("=== Token Validation Complete ===")
+        return user
 
     except JWTError as e:
         logger.error(f"JWT Error: {str(e)}")
@@ -251,19 +512,12 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     
     try:
         # Query user from database
-        query = "SELECT * FROM c WHERE c.email = @email AND c.type = 'user'"
-        parameters = [{"name": "@email", "value": form_data.username}]
-        
         logger.info("Querying database for user")
-        users = list(usercontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
+        user = await repository.users.get_by_email(form_data.username, user_only=True)
         
-        logger.info(f"Found {len(users)} matching users")
+        logger.info(f"Found matching user: {user is not None}")
 
-        if not users:
+        if not user:
             logger.error("No user found with provided email")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -272,7 +526,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             )
 
         # Verify password
-        is_password_correct = pwd_context.verify(form_data.password, users[0]["password_hash"])
+        is_password_correct = pwd_context.verify(form_data.password, user["password_hash"])
         logger.info(f"Password verification result: {is_password_correct}")
 
         if not is_password_correct:
@@ -283,7 +537,6 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        user = users[0]
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
             data={"sub": user["email"]}, 
@@ -307,15 +560,9 @@ async def register(user: UserRegistration):
     
     try:
         # Check if user already exists
-        query = "SELECT * FROM c WHERE c.email = @email"
-        parameters = [{"name": "@email", "value": user.email}]
-        existing_users = list(usercontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
-
-        if existing_users:
+        existing_user = await repository.users.get_by_email(user.email)
+
+        if existing_user:
             raise HTTPException(status_code=400, detail="Email already registered")
 
         # Generate a unique verification token
@@ -329,7 +576,7 @@ async def register(user: UserRegistration):
             "created_at": datetime.utcnow().isoformat(),
             "expires_at": (datetime.utcnow() + timedelta(hours=1)).isoformat()
         }
-        tokencontainer.create_item(body=token_doc)
+        await repository.tokens.create(token_doc)
 
         # Send email with verification link
         await send_verification_email(user.email, verification_token)
@@ -350,15 +597,9 @@ async def request_delete_account(user: UserRegistration):
     
     try:
         # Check if user exists
-        query = "SELECT * FROM c WHERE c.email = @email"
-        parameters = [{"name": "@email", "value": user.email}]
-        existing_users = list(usercontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
-
-        if not existing_users:
+        existing_user = await repository.users.get_by_email(user.email)
+
+        if not existing_user:
             raise HTTPException(status_code=400, detail="Email for the account not found")
 
         # Generate a unique verification token
@@ -372,7 +613,7 @@ async def request_delete_account(user: UserRegistration):
             "created_at": datetime.utcnow().isoformat(),
             "expires_at": (datetime.utcnow() + timedelta(hours=1)).isoformat()
         }
-        tokencontainer.create_item(body=token_doc)
+        await repository.tokens.create(token_doc)
 
         # Send email with verification link
         await send_delete_account_email(user.email, deletion_token)
@@ -389,7 +630,7 @@ async def request_delete_account(user: UserRegistration):
 @app.post("/api/request-reset-password")
 async def request_reset_password(email: str):
     logger.info(f"Password reset requested for email: {email}")
-    user = get_user_by_email(email)
+    user = await get_user_by_email(email)
     
     if user:
         reset_token = secrets.token_urlsafe(16)
@@ -404,7 +645,7 @@ async def request_reset_password(email: str):
         }
         
         try:
-            tokencontainer.create_item(body=token_doc)
+            await repository.tokens.create(token_doc)
             # Send reset password email with the token
             await send_reset_password_email(email, reset_token)
             return {"message": "Reset password email sent. Check your mail!"}
@@ -420,23 +661,14 @@ async def request_reset_password(email: str):
 @app.get("/reset-password")
 async def reset_password_page(request: Request, token: str = Query(...)):
     try:
-        # Query token from Cosmos DB
-        query = "SELECT * FROM c WHERE c.id = @token AND c.type = 'reset_token'"
-        parameters = [{"name": "@token", "value": token}]
-        
-        tokens = list(tokencontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
+        # Read token from Cosmos DB
+        token_doc = await repository.tokens.get(token, 'reset_token')
         
-        if not tokens:
+        if not token_doc:
             return templates.TemplateResponse("error.html", {
                 "request": request,
                 "message": "This password reset link is invalid. Please request a new password reset."
             })
-            
-        token_doc = tokens[0]
         
         # Check if token has expired
         expires_at = datetime.fromisoformat(token_doc['expires_at'])
@@ -460,23 +692,15 @@ async def reset_password_page(request: Request, token: str = Query(...)):
 @app.get("/delete-account")
 async def delete_account_page(request: Request, token: str = Query(...)):
     try:
-        # Query token from Cosmos DB
-        query = "SELECT * FROM c WHERE c.id = @token AND c.type = 'deletion_token'"
-        parameters = [{"name": "@token", "value": token}]
+        # Read token from Cosmos DB
         logger.info(f"Querying token: {token}")
-        tokens = list(tokencontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
+        token_doc = await repository.tokens.get(token, 'deletion_token')
         
-        if not tokens:
+        if not token_doc:
             return templates.TemplateResponse("error.html", {
                 "request": request,
                 "message": "This link is invalid. Please request the deletion of your account again."
             })
-            
-        token_doc = tokens[0]
         
         # Check if token has expired
         expires_at = datetime.fromisoformat(token_doc['expires_at'])
@@ -500,20 +724,11 @@ async def delete_account_page(request: Request, token: str = Query(...)):
 @app.post("/api/reset-password")
 async def reset_password(request: ResetPasswordRequest):
     try:
-        # Query token from Cosmos DB
-        query = "SELECT * FROM c WHERE c.id = @token AND c.type = 'reset_token'"
-        parameters = [{"name": "@token", "value": request.token}]
-        
-        tokens = list(tokencontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
+        # Read token from Cosmos DB
+        token_doc = await repository.tokens.get(request.token, 'reset_token')
         
-        if not tokens:
+        if not token_doc:
             raise HTTPException(status_code=400, detail="Invalid reset token")
-            
-        token_doc = tokens[0]
         
         # Check if token has expired
         expires_at = datetime.fromisoformat(token_doc['expires_at'])
@@ -526,10 +741,10 @@ async def reset_password(request: ResetPasswordRequest):
         hashed_password = pwd_context.hash(request.new_password)
         
         # Update the user's password in the database
-        update_user_password(email, hashed_password)
+        await update_user_password(email, hashed_password)
         
         # Delete the used token
-        tokencontainer.delete_item(item=token_doc['id'], partition_key=token_doc['id'])
+        await repository.tokens.delete(token_doc['id'])
         
         return {"message": "Password reset successful. Now you can login again!"}
         
@@ -546,20 +761,11 @@ async def reset_password(request: ResetPasswordRequest):
 async def delete_account(request: DeleteAccountRequest):
     logger.info(f"Delete account request for token: {request.token}")
     try:
-        # Query token from Cosmos DB
-        query = "SELECT * FROM c WHERE c.id = @token AND c.type = 'deletion_token'"
-        parameters = [{"name": "@token", "value": request.token}]
-        
-        tokens = list(tokencontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
+        # Read token from Cosmos DB
+        token_doc = await repository.tokens.get(request.token, 'deletion_token')
         
-        if not tokens:
+        if not token_doc:
             raise HTTPException(status_code=400, detail="Invalid reset token")
-            
-        token_doc = tokens[0]
         
         # Check if token has expired
         expires_at = datetime.fromisoformat(token_doc['expires_at'])
@@ -569,10 +775,10 @@ async def delete_account(request: DeleteAccountRequest):
         email = token_doc['email']
         
         # Delete the user from the database
-        delete_user(email)
+        await delete_user(email)
         
         # Delete the used token
-        tokencontainer.delete_item(item=token_doc['id'], partition_key=token_doc['id'])
+        await repository.tokens.delete(token_doc['id'])
         
         return {"message": "Your account has been deleted successfully."}
         
@@ -599,14 +805,7 @@ async def send_reset_password_email(email: str, reset_token: str):
     If you didn't request a password reset, please ignore this email.
     """
 
-    message_obj = MessageSchema(
-        subject=subject,
-        recipients=[email],
-        body=message,
-        subtype="plain"
-    )
-
-    await fast_mail.send_message(message=message_obj)
+    await send_plain_email(email, subject, message)
 
 async def send_delete_account_email(email: str, deletion_token: str):
     subject = "Delete your account for Predictum IT ChatApp"
@@ -622,107 +821,55 @@ async def send_delete_account_email(email: str, deletion_token: str):
     If you didn't request to delete your account, please ignore this email.
     """
 
-    message_obj = MessageSchema(
-        subject=subject,
-        recipients=[email],
-        body=message,
-        subtype="plain"
-    )
-
-    await fast_mail.send_message(message=message_obj)
+    await send_plain_email(email, subject, message)
 
-def update_user_password(email: str, new_password: str):
-    query = "SELECT * FROM c WHERE c.email = @email"
-    parameters = [{"name": "@email", "value": email}]
+async def update_user_password(email: str, new_password: str):
+    user = await repository.users.get_by_email(email)
     
-    users = list(usercontainer.query_items(
-        query=query,
-        parameters=parameters,
-        enable_cross_partition_query=True
-    ))
-    
-    if users:
-        user = users[0]
+    if user:
         user["password_hash"] = new_password
         
         # Update the user document in the database
-        usercontainer.replace_item(item=user, body=user)
+        await repository.users.replace(user)
+        await cache.invalidate(f"user:{email}")
     else:
         raise Exception("User not found")
 
-def delete_user(email: str):
+async def delete_user(email: str):
     # First find the user
-    query = "SELECT * FROM c WHERE c.email = @email"
-    parameters = [{"name": "@email", "value": email}]
+    user = await repository.users.get_by_email(email)
     
-    users = list(usercontainer.query_items(
-        query=query,
-        parameters=parameters,
-        enable_cross_partition_query=True
-    ))
-    
-    if users:
-        user = users[0]
+    if user:
         user_id = user["id"]
         logger.info(f"Deleting user with ID: {user_id}")
 
         # Get all conversations associated with this user
-        conv_query = "SELECT * FROM c WHERE c.user_id = @user_id"
-        conv_parameters = [{"name": "@user_id", "value": user_id}]
-        
-        conversations = list(conversationcontainer.query_items(
-            query=conv_query,
-            parameters=conv_parameters,
-            enable_cross_partition_query=True
-        ))
-        logger.info(f"Found {len(conversations)} conversations to delete")
+        conversation_ids = await repository.conversations.list_ids(user_id)
+        logger.info(f"Found {len(conversation_ids)} conversations to delete")
 
         # Delete conversations
-        for conversation in conversations:
-            logger.info(f"Deleting conversation: {conversation['id']}")
-            conversationcontainer.delete_item(
-                item=conversation, 
-                partition_key=f'CHAT#{user_id}'
-            )
+        for conversation_id in conversation_ids:
+            logger.info(f"Deleting conversation: {conversation_id}")
+            await repository.conversations.delete(user_id, conversation_id)
+            await conversation_deleted(user_id, conversation_id)
 
         # Finally delete the user
-        usercontainer.delete_item(
-            item=user, 
-            partition_key=f'USER#{user_id}'
-        )
+        await repository.users.delete(user)
+        await cache.invalidate(f"user:{email}")
     else:
         raise Exception("User not found")
     
-def get_user_by_email(email: str):
-    query = "SELECT * FROM c WHERE c.email = @email"
-    parameters = [{"name": "@email", "value": email}]
-    
-    users = list(usercontainer.query_items(
-        query=query,
-        parameters=parameters,
-        enable_cross_partition_query=True
-    ))
-    
-    if users:
-        return users[0]
-    else:
-        return None
+async def get_user_by_email(email: str):
+    return await repository.users.get_by_email(email)
 
 async def cleanup_expired_tokens():
     while True:
         try:
             current_time = datetime.utcnow().isoformat()
-            query = "SELECT * FROM c WHERE c.expires_at < @current_time"
-            parameters = [{"name": "@current_time", "value": current_time}]
-            
-            expired_tokens = list(tokencontainer.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
+            expired_tokens = await repository.tokens.list_expired(current_time)
             
             for token in expired_tokens:
-                tokencontainer.delete_item(item=token['id'], partition_key=token['id'])
+                await repository.tokens.delete(token['id'])
                 
             await asyncio.sleep(3600)  # Run every hour
             
@@ -738,56 +885,47 @@ async def read_users_me(current_user = Depends(get_current_user)):
         "id": current_user["id"]
     }
 
-# Middleware to authenticate requests
-@app.middleware("http")
-async def authenticate_requests(request: Request, call_next):
-    # Allow access to register, token endpoints, and static assets
-    public_paths = [
-        "/static/",
-        "/api/register",
-        "/api/token"
-    ]
-
-    if any(request.url.path.startswith(path) for path in public_paths):
-        return await call_next(request)
-
-    # Check for token in protected routes
-    if request.url.path.startswith("/static/"):
-        token = request.cookies.get("token")
-        if not token:
-            return RedirectResponse(url="/static/login.html")
-        
-        try:
-            # Verify token
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            # If valid, continue with the request
-            return await call_next(request)
-        except JWTError:
-            return RedirectResponse(url="/static/login.html")
+# Middleware to attribute Cosmos DB request units and latency to the route that caused them
+app.add_middleware(metrics.CosmosUsageMiddleware, server_timing=COSMOS_SERVER_TIMING)
+
+# Prometheus metrics, for the scraper only: it sends METRICS_TOKEN instead of a user token
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
+
+# Middleware to authenticate requests: register, token endpoints, static assets and probes skip it,
+# other routes get their bearer token decoded once for get_current_user
+app.add_middleware(
+    AuthenticationMiddleware,
+    route_table=RouteTable(
+        public_prefixes=["/static/", "/api/register", "/api/token"],
+        public_paths=["/healthz", "/metrics"]
+    ),
+    secret_key=SECRET_KEY,
+    algorithm=ALGORITHM
+)
 
-    return await call_next(request)
+# Static files skip all middleware; registered last so that it is the outermost layer
+app.add_middleware(StaticFilesBypass, static_app=static_files, path="/static")
 
 @app.get("/verify")
 async def verify_email_page(request: Request, token: str = Query(...)):
     try:
-        # Query token from Cosmos DB
-        query = "SELECT * FROM c WHERE c.id = @token AND c.type = 'verification_token'"
-        parameters = [{"name": "@token", "value": token}]
+        # Read token from Cosmos DB
+        token_doc = await repository.tokens.get(token, 'verification_token')
         
-        tokens = list(tokencontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
-        
-        if not tokens:
+        if not token_doc:
             # Return an error page instead of throwing an exception
             return templates.TemplateResponse("error.html", {
                 "request": request,
                 "message": "This verification link is invalid. Please request a new verification email."
             })
-            
-        token_doc = tokens[0]
         
         # Check if token has expired
         expires_at = datetime.fromisoformat(token_doc['expires_at'])
@@ -812,20 +950,11 @@ async def verify_email_page(request: Request, token: str = Query(...)):
 @app.post("/api/set-password")
 async def set_password(request: SetPasswordRequest):
     try:
-        # Query token from Cosmos DB
-        query = "SELECT * FROM c WHERE c.id = @token AND c.type = 'verification_token'"
-        parameters = [{"name": "@token", "value": request.token}]
-        
-        tokens = list(tokencontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
+        # Read token from Cosmos DB
+        token_doc = await repository.tokens.get(request.token, 'verification_token')
         
-        if not tokens:
+        if not token_doc:
             raise HTTPException(status_code=400, detail="Invalid verification token")
-            
-        token_doc = tokens[0]
         
         # Check if token has expired
         expires_at = datetime.fromisoformat(token_doc['expires_at'])
@@ -851,10 +980,11 @@ async def set_password(request: SetPasswordRequest):
         }
         
         # Save to database
-        usercontainer.create_item(body=user_doc)
+        await repository.users.create(user_doc)
+        await cache.invalidate(f"user:{email}")
         
         # Delete the used token from Cosmos DB
-        tokencontainer.delete_item(item=token_doc['id'], partition_key=token_doc['id'])
+        await repository.tokens.delete(token_doc['id'])
         
         return {"message": "Password set successfully. You are now able to login!"}
         
@@ -868,17 +998,63 @@ async def set_password(request: SetPasswordRequest):
         )
 
 # Chat endpoint
+def bearer_token(request: Request) -> Optional[str]:
+    # For endpoints where logging in is optional
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    return None
+
+def client_address(request: Request) -> str:
+    # Behind the App Service front end the connection comes from the proxy, which appends the address
+    # of the client to X-Forwarded-For; entries left of the ones our proxies appended are client input
+    forwarded = [address.strip() for address in request.headers.get("x-forwarded-for", "").split(",") if address.strip()]
+    if TRUSTED_PROXY_HOPS and len(forwarded) >= TRUSTED_PROXY_HOPS:
+        address = forwarded[-TRUSTED_PROXY_HOPS]
+        # App Service adds the port: "203.0.113.7:51234", "[2001:db8::1]:51234"
+        if address.startswith("[") and "]" in address:
+            return address[1:address.index("]")]
+        if address.count(":") == 1:
+            return address.split(":")[0]
+        return address
+    return request.client.host if request.client else "unknown"
+
+def rate_limit_key(request: Request) -> str:
+    # /chat does not require a login, so anonymous callers are limited by address
+    token = bearer_token(request)
+    if token:
+        try:
+            email = decode_token(token, SECRET_KEY, ALGORITHM).get("sub")
+            if email:
+                return f"user:{email}"
+        except JWTError:
+            pass
+    return f"ip:{client_address(request)}"
+
+@asynccontextmanager
+async def model_admission(model: str, tokens: int):
+    # Admission for each model /chat calls, the requested one and its fallbacks
+    try:
+        model_doc = await model_catalog.get(model)
+    except Exception as e:
+        logger.error(f"Error reading model catalog: {str(e)}")
+        model_doc = None
+    async with admission.admit_model(select_provider(model), model, model_doc, tokens) as usage:
+        yield usage
+
 @app.post("/chat")
 async def chat(
+    request: Request,
     message: str = Form(...), 
     conversation: str = Form(default="[]"), 
     model: str = Form(...),
     temperature: float = Form(...),
     max_tokens: int = Form(...),
-    system_prompt: str = Form(...)
+    system_prompt: str = Form(...),
+    use_cache: bool = Form(default=False, alias="cache")
 ):
     try:
-        logger.info(f"Received message: {message}")
+        log_payload(logger, "Received message", message)
         
         # Parse conversation JSON string to list
         try:
@@ -890,148 +1066,82 @@ async def chat(
         messages = []
         messages.extend(conversation_list)
         messages.append({"role": "user", "content": message})
-        logger.info(f"conversation_list: {conversation_list}")
-        logger.info(f"messages: {messages}")
 
         selectedmodel = model
-        logger.info(f"Selected model: {model}")
-
-        for message in messages:
-            if 'timestamp' in message:
-                del message['timestamp']
-            if 'model' in message:
-                del message['model']
-        logger.info(f"Final message: {messages}")
-
-        if "gemini" in selectedmodel.lower():
-            logger.info(f"gemini messages: {messages}")
-            try:
-                # Format everything as a single prompt
-                prompt = ""
-
-                # Add system prompt if provided
-                if system_prompt and system_prompt.strip():
-                    prompt += f"System: {system_prompt}\n\n"
-
-                # Add conversation history
-                # Iterate to the second to last message, i.e. skip the newest user message
-                for i in range(len(messages) - 1):
-                    msg = messages[i]
-                    role = "User" if msg["role"] == "user" else "Assistant"
-                    prompt += f"{role}: {msg['content']}\n\n"
-
-                # Add the current query
-                prompt += f"User: {message}\n\nAssistant:"
-
-                logger.info(f"Gemini prompt: {prompt}")
-
-                # Generate content with minimal parameters
-                response = google_client.models.generate_content(
-                    model=selectedmodel,
-                    contents=prompt
-                )
-
-                logger.info(f"Gemini response: {response}")
-
+        logger.info("Selected model: %s", model)
+
+        for msg in messages:
+            if 'timestamp' in msg:
+                del msg['timestamp']
+            if 'model' in msg:
+                del msg['model']
+        log_payload(logger, "Final message", messages)
+
+        provider = select_provider(selectedmodel)
+        if provider is None:
+            raise ValueError(f"Unsupported model: {selectedmodel}")
+
+        # Deterministic requests, or requests that opt in, can be answered from the response cache.
+        # Temperature 0 is not deterministic for models that ignore the temperature.
+        cache_key = None
+        if RESPONSE_CACHE_ENABLED and ((temperature == 0 and honours_temperature(selectedmodel)) or use_cache):
+            cache_key = response_cache.key(selectedmodel, system_prompt, messages, temperature, max_tokens)
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Response cache hit for model: %s", selectedmodel)
                 return JSONResponse(content={
-                    "response": response.text
-                })
-            except Exception as e:
-                logger.error(f"Error with Gemini API: {str(e)}")
-                logger.exception("Full Gemini exception details:")
-                return JSONResponse(content={"error": str(e)}, status_code=500)
-            
-        # o1-mini only support the value 1 in the temperature parameter, and max_token is max_completion_tokens
-        if "-mini" in selectedmodel.lower():
-            messages.pop(0) #Remove the first item in the list, as o1 does not accept the system role
-            messages.pop() #Remove the last item in the list, because it is duplicate for some reason
-            logger.info(f"o1-mini messages: {messages}")
-            response = openai_client.chat.completions.create(
-                model=selectedmodel, 
-                messages=messages,
-                temperature=1,
-                max_completion_tokens=max_tokens
-            )
-            logger.info(f"o1-mini response: {response}")
-            return JSONResponse(content={
-                "response": response.choices[0].message.content
-                })
-
-        # o1-preview does not support the temperature parameter, and max_token is max_completion_tokens
-        if "o1" in selectedmodel.lower():
-            messages.pop(0) #Remove the first item in the list, as o1 does not accept the system role
-            messages.pop() #Remove the last item in the list, because it is duplicate for some reason
-            logger.info(f"o1-preview messages: {messages}")
-            response = openai_client.chat.completions.create(
-                model=selectedmodel, 
-                messages=messages,
-                max_completion_tokens=max_tokens
-            )
-            logger.info(f"o1-preview response: {response}")
-            return JSONResponse(content={
-                "response": response.choices[0].message.content
+                    "response": cached["response"],
+                    "model": selectedmodel,
+                    "fallback": False,
+                    "cached": True
                 })
 
-        if "gpt" in selectedmodel.lower():
-            messages.pop() #Remove the last item in the list, because it is duplicated
-            logger.info(f"gpt messages: {messages}")
-            response = openai_client.chat.completions.create(
-                model=selectedmodel, 
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            logger.info(f"gpt response: {response}")
-            return JSONResponse(content={
-                "response": response.choices[0].message.content
-                })
+        estimated_tokens = estimate_tokens(system_prompt, messages, max_tokens)
+        async with admission.admit_user(rate_limit_key(request), estimated_tokens) as usage:
+            result = await failover.complete(selectedmodel, messages, system_prompt, temperature, max_tokens,
+                                             admit=lambda candidate: model_admission(candidate, estimated_tokens))
+            usage["tokens"] = result.input_tokens + result.output_tokens
+        if result.model != selectedmodel:
+            logger.warning(f"Model {selectedmodel} unavailable, answered by fallback model {result.model}")
 
-        if "deepseek" in selectedmodel.lower():
-            logger.info(f"deepseek messages: {messages}")
-            messages.pop() #Remove the last item in the list, because it is duplicated
-            logger.info(f"deepseek messages: {messages}")
-            response = deepseek_client.chat.completions.create(
-                model=selectedmodel, 
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            logger.info(f"deepseek response: {response}")
-            return JSONResponse(content={
-                "response": response.choices[0].message.content
-                })
+        try:
+            cost = model_catalog.cost(await model_catalog.get(result.model), result.input_tokens,
+                                      result.output_tokens, result.cached_input_tokens)
+        except Exception as e:
+            logger.error(f"Error reading model catalog: {str(e)}")
+            cost = 0.0
+        metrics.record_llm_call(result, cost)
+        logger.info("LLM call", extra={
+            "provider": result.provider,
+            "model": result.model,
+            "latency": round(result.latency, 3),
+            "input_tokens": result.input_tokens,
+            "output_tokens": result.output_tokens,
+            "cached_input_tokens": result.cached_input_tokens,
+            "cost_usd": round(cost, 6)
+        })
+        log_payload(logger, "LLM response", result.text)
 
-        if "llama" in selectedmodel.lower():
-            logger.info(f"llama messages: {messages}")
-            messages.pop() #Remove the last item in the list, because it is duplicated
-            logger.info(f"llama messages: {messages}")
-            response = llama_client.chat.completions.create(
-                model=selectedmodel, 
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            logger.info(f"llama response: {response}")
-            return JSONResponse(content={
-                "response": response.choices[0].message.content
-                })
+        # A fallback model's answer is not the answer of the model the key names
+        if cache_key is not None and result.model == selectedmodel:
+            await response_cache.set(cache_key, {"response": result.text, "model": result.model})
 
-        if "claude" in selectedmodel.lower():
-            messages.pop(0) #Remove the first item in the list, as claude does not accept the system role
-            messages.pop() #Remove the last item in the list, because it is duplicated
-            logger.info(f"claude messages: {messages}")
-            response = anthropic_client.messages.create(
-                model=selectedmodel, 
-                messages=messages, 
-                system=system_prompt,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            logger.info(f"claud response: {response}")
-            return JSONResponse(content={
-                "response": response.content[0].text
-                })
+        return JSONResponse(content={
+            "response": result.text,
+            "model": result.model,
+            "fallback": result.model != selectedmodel
+            })
 
+    except RateLimited as e:
+        logger.warning(f"Rate limited /chat request: {str(e)}")
+        return JSONResponse(
+            content={"error": str(e)},
+            status_code=429,
+            headers={"Retry-After": str(max(1, int(e.retry_after + 0.999)))}
+        )
+    except ProvidersUnavailable as e:
+        logger.error(f"Error calling LLM API: {str(e)}; last error: {str(e.__cause__)}")
+        return JSONResponse(content={"error": str(e)}, status_code=503)
     except Exception as e:
         logger.error(f"Error calling LLM API: {str(e)}")
         logger.exception("Full exception details:")
@@ -1041,15 +1151,9 @@ async def chat(
 async def get_models_from_cosmos():
     try:
         # Query for models that should be shown in production
-        if environment == "development":
-            query = "SELECT * FROM c WHERE c.type = 'llm_model' order by c.vendor, c.label"            
-        else:
-            query = "SELECT * FROM c WHERE c.type = 'llm_model' AND c.show_in_prod = 'Yes' order by c.vendor, c.label"
-        logger.info(query)
-        items = list(modelcontainer.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
+        include_hidden = environment == "development"
+        # Copies, the callers remove fields from them and the catalog is shared
+        items = [dict(model) for model in await model_catalog.list(include_hidden=include_hidden)]
         
         # Sort models if needed (optional)
         # items.sort(key=lambda x: x.get('label', ''))
@@ -1072,7 +1176,7 @@ async def get_models():
         # Remove internal fields that shouldn't be exposed to the client
         for model in models:
             # Remove CosmosDB system properties
-            for key in ['_rid', '_self', '_etag', '_attachments', '_ts']:
+            for key in SYSTEM_PROPERTIES:
                 if key in model:
                     del model[key]
                     
@@ -1094,18 +1198,20 @@ async def save_conversation(
     try:
         conversation_doc = {
             'id': str(uuid.uuid4()),
-            'partitionKey': f'CHAT#{current_user["id"]}',
+            'partitionKey': conversation_partition_key(current_user["id"]),
             'type': 'conversation',
             'user_id': current_user["id"],
             'name': conversation.name,
             'folder': conversation.folder,
             'messages': [msg.dict() for msg in conversation.messages],
             'created_at': datetime.utcnow().isoformat(),
-            'updated_at': datetime.utcnow().isoformat()
+            'updated_at': datetime.utcnow().isoformat(),
+            'version': new_version()
         }
         
-        result = conversationcontainer.create_item(body=conversation_doc)
-        return result
+        result = await repository.conversations.create(conversation_doc)
+        await conversation_written(result)
+        return versioned_response(result)
 
     except Exception as e:
         logger.error(f"Error saving conversation: {str(e)}")
@@ -1117,20 +1223,28 @@ async def save_conversation(
 # Update conversation
 @app.put("/api/conversations/{conversation_id}")
 async def update_conversation(
+    request: Request,
     conversation_id: str,
     conversation: Conversation,
     current_user = Depends(get_current_user)
 ):
-    partition_key = f'CHAT#{current_user["id"]}'        
-    # Read existing conversation
+    partition_key = conversation_partition_key(current_user["id"])
+    buffer_key = (current_user["id"], conversation_id)
+    expected = if_match(request)
+    if expected is not None:
+        # If-Match is checked against the stored version, so a pending autosave is written first
+        await write_behind.flush(buffer_key)
+    if write_behind.take_conflict(buffer_key):
+        raise autosave_conflict()
+    # Read existing conversation, the buffered version if an autosave is pending
     try:
-        existing = conversationcontainer.read_item( 
-            item=conversation_id,
-            partition_key=partition_key
-        )
+        existing = (write_behind.get(buffer_key) if expected is None else None) or \
+            await repository.conversations.get(current_user["id"], conversation_id)
     except Exception as e:
         logger.error(f"Error reading existing conversation: {str(e)}")
         raise HTTPException(status_code=404, detail="Conversation not found")
+    if existing is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
 
     # Check if name or folder has changed
     if existing.get('name') != conversation.name or existing.get('folder') != conversation.folder:
@@ -1145,11 +1259,13 @@ async def update_conversation(
                 'folder': conversation.folder,
                 'messages': [msg.dict() for msg in conversation.messages],
                 'created_at': datetime.utcnow().isoformat(),
-                'updated_at': datetime.utcnow().isoformat()
+                'updated_at': datetime.utcnow().isoformat(),
+                'version': new_version()
             }
-            result = conversationcontainer.create_item(body=conversation_doc)
+            result = await repository.conversations.create(conversation_doc)
+            await conversation_written(result)
             logger.info(f"Update successful.")
-            return result
+            return versioned_response(result)
             
         except Exception as e:
             logger.error(f"Error during replace_item: {str(e)}")
@@ -1158,6 +1274,11 @@ async def update_conversation(
                 detail=f"Failed to update conversation: {str(e)}"
             )
     else:
+        # Refuse to overwrite changes the client has not seen. An autosave still buffered by
+        # another worker is only seen here once it has been written.
+        if expected is not None and (existing.get('version') or '0') != expected:
+            raise version_conflict()
+
         # Replace the document
         try:
             conversation_doc = {
@@ -1169,15 +1290,29 @@ async def update_conversation(
                 'folder': conversation.folder,
                 'messages': [msg.dict() for msg in conversation.messages],
                 'created_at': existing.get('created_at'),
-                'updated_at': datetime.utcnow().isoformat()
+                'updated_at': datetime.utcnow().isoformat(),
+                'version': new_version()
             }
-            result = conversationcontainer.replace_item( 
-                item=conversation_id,
-                body=conversation_doc
-            )
+            for key in ('published', 'public_id', 'magiclink', 'published_at'):
+                if key in existing:
+                    conversation_doc[key] = existing[key]
+            if WRITE_BEHIND_ENABLED and expected is None:
+                # Written together with the autosaves that follow within the next seconds
+                write_behind.put(buffer_key, conversation_doc, existing.get('_etag'))
+                return versioned_response(conversation_doc)
+            # Written now, so the ETag answered is the stored version; this replaces an autosave
+            # whose flush failed above
+            write_behind.discard(buffer_key)
+            # Conditional on the version checked above, when the client asked for the check
+            result = await repository.conversations.replace(
+                conversation_doc, etag=existing.get('_etag') if expected is not None else None)
+            await conversation_written(result)
+            await sync_public_snapshot(result)
             logger.info(f"Update successful.")
-            return result
-            
+            return versioned_response(result)
+
+        except ConcurrencyConflict:
+            raise version_conflict()
         except Exception as e:
             logger.error(f"Error during replace_item: {str(e)}")
             raise HTTPException(
@@ -1185,31 +1320,60 @@ async def update_conversation(
                 detail=f"Failed to update conversation: {str(e)}"
             )
 
+def publication_fields(current, published: bool):
+    """The fields publishing or unpublishing sets, given the id, published and public_id of a conversation."""
+    fields = {
+        'published': published,
+        'published_at': datetime.utcnow().isoformat(),
+        'version': new_version()
+    }
+    if published and not current.get('published'):
+        # Magic links are generated here; the value sent by the client is ignored
+        fields['public_id'] = secrets.token_urlsafe(16)
+    elif not published:
+        fields['public_id'] = None
+    fields['magiclink'] = public_id({**current, **fields}) if published else ""
+    return fields
+
+async def publication_changed(conversation, previous_public_id: str):
+    if conversation.get('published'):
+        await sync_public_snapshot(conversation)
+    else:
+        await delete_public_snapshot(previous_public_id)
+
 @app.put("/api/publish-conversation/{conversation_id}")
 async def publish_conversation(
+    request: Request,
     conversation_id: str,
-    request: dict,
+    payload: dict,
     current_user = Depends(get_current_user)
 ):
+    expected = if_match(request)
     try:
-        # Check if conversation exists
-        partition_key = f'CHAT#{current_user["id"]}'
-        conversation = conversationcontainer.read_item(
-            item=conversation_id,
-            partition_key=partition_key
-        )
-        
-        conversation['published'] = request['published']
-        conversation['magiclink'] = request['magiclink']
-        conversation['published_at'] = datetime.utcnow().isoformat()
-        
-        result = conversationcontainer.replace_item(
-            item=conversation_id,
-            body=conversation
-        )
-        
-        return result
+        # Write a pending autosave first, so that it is not lost or overwritten
+        await write_behind.flush((current_user["id"], conversation_id))
+        # Only the publishing fields are read and patched, not the messages
+        current = await repository.conversations.get_publication(current_user["id"], conversation_id)
+        if current is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        version = current.get('version') or '0'
+        if expected is not None and version != expected:
+            raise version_conflict()
+
+        # Conditional on the version read above; patch returns the whole conversation for the snapshot
+        fields = publication_fields(current, bool(payload['published']))
+        result = await repository.conversations.patch(current_user["id"], conversation_id, fields, version=version)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        await conversation_written(result)
+        await publication_changed(result, public_id(current))
+        
+        return versioned_response(result)
 
+    except HTTPException:
+        raise
+    except ConcurrencyConflict:
+        raise version_conflict()
     except Exception as e:
         logger.error(f"Error publishing conversation: {str(e)}")
         raise HTTPException(
@@ -1217,47 +1381,87 @@ async def publish_conversation(
             detail="Failed to publish conversation"
         )
 
+# Public read model: publishing a conversation stores a snapshot with its pre-rendered page in a
+# PUBLIC#{magic link} partition. The snapshot maps the magic link to the partition key and id of the
+# conversation, so a public page is a single point read and is cached by browsers and CDNs;
+# unpublishing, editing or deleting the conversation replaces or removes the snapshot.
+PUBLIC_PAGE_MAX_AGE = int(os.getenv("PUBLIC_PAGE_MAX_AGE", "60"))
+PUBLIC_PAGE_SHARED_MAX_AGE = int(os.getenv("PUBLIC_PAGE_SHARED_MAX_AGE", "3600"))
+# Conversations published before the snapshots existed get theirs from a one-off backfill:
+# python -m utilities.backfill_public_snapshots
+
+PUBLIC_MESSAGE_FIELDS = ('role', 'content', 'timestamp', 'model')
+
+def public_id(conversation):
+    # Conversations published before magic links were generated are public under their own id
+    return conversation.get('public_id') or conversation['id']
+
+def build_public_snapshot(conversation):
+    snapshot = {
+        'id': public_id(conversation),
+        'partitionKey': public_conversation_partition_key(public_id(conversation)),
+        'type': 'public_conversation',
+        'conversation_id': conversation['id'],
+        'conversation_partition_key': conversation['partitionKey'],
+        'name': conversation.get('name'),
+        'messages': [{key: m.get(key) for key in PUBLIC_MESSAGE_FIELDS} for m in conversation.get('messages', [])],
+        'published_at': conversation.get('published_at'),
+        'updated_at': conversation.get('updated_at')
+    }
+    snapshot['html'] = templates.get_template("conversation.html").render(conversation=snapshot)
+    snapshot['etag'] = hashlib.sha256(snapshot['html'].encode("utf-8")).hexdigest()[:32]
+    return snapshot
+
+async def delete_public_snapshot(link: str):
+    # Views of the page that are not written yet would recreate its view count
+    view_counter.discard(link)
+    await repository.public_conversations.delete(link)
+
+async def sync_public_snapshot(conversation):
+    """Create, refresh or remove the public snapshot of a conversation after it changed."""
+    if conversation.get('published'):
+        await repository.public_conversations.upsert(build_public_snapshot(conversation))
+    else:
+        await delete_public_snapshot(public_id(conversation))
+
+def public_response(request: Request, body, media_type: str, etag: str):
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={PUBLIC_PAGE_MAX_AGE}, s-maxage={PUBLIC_PAGE_SHARED_MAX_AGE}"
+    }
+    if request.headers.get("if-none-match") in (f'"{etag}"', f'W/"{etag}"'):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
 # Serve public conversation page
 @app.get("/public-conversation/{conversation_id}", response_class=HTMLResponse)
 async def get_public_conversation_page(request: Request, conversation_id: str):
     """
-    Serves the HTML page for displaying a conversation.
+    Serves the pre-rendered HTML page of a published conversation.
     """
     try:
-        # You might want to validate here that the conversation exists and is published
-        # before serving the page, to avoid showing the page for unauthorized conversations.
-        # However, you can also handle this in the JavaScript code in the HTML page.
-
-        return templates.TemplateResponse(
-            "conversation.html",  # Or whatever you name your HTML file
-            {"request": request, "conversation_id": conversation_id}
-        )
+        snapshot = await repository.public_conversations.get(conversation_id)
     except Exception as e:
-        print(f"An error occurred: {e}")
+        logger.error(f"Error retrieving public conversation: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error.")
 
+    if snapshot is None:
+        return templates.TemplateResponse("error.html", {
+            "request": request,
+            "message": "This conversation does not exist or is no longer published."
+        }, status_code=404)
+    view_counter.record(snapshot['id'])
+    return public_response(request, snapshot['html'], "text/html; charset=utf-8", snapshot['etag'])
+
 # Get public conversation
 @app.get("/api/public-conversations/{conversation_id}")
 async def get_public_conversation(
+    request: Request,
     conversation_id: str
 ):
 
     try:
-        query = f"SELECT * FROM c WHERE c.id = @id and c.type = 'conversation' and c.published = true"
-        parameters = [
-            {"name": "@id", "value": conversation_id}
-        ]
-        conversation = list(conversationcontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
-
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversation not found or not published.")
-
-        return conversation
-
+        snapshot = await repository.public_conversations.get(conversation_id)
     except Exception as e:
         logger.error(f"Error retrieving conversation: {str(e)}")
         raise HTTPException(
@@ -1265,6 +1469,15 @@ async def get_public_conversation(
             detail=f"Failed to retrieve conversation: {str(e)}"
         )
 
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Conversation not found or not published.")
+
+    # Same list shape as the former cross-partition query
+    conversation = {key: snapshot.get(key) for key in ('name', 'messages', 'published_at', 'updated_at')}
+    conversation['id'] = snapshot['conversation_id']
+    conversation['published'] = True
+    return public_response(request, ORJSONResponse([conversation]).body, "application/json", snapshot['etag'] + "-json")
+
 # Delete conversation
 @app.delete("/api/conversations/{conversation_id}")
 async def delete_conversation(
@@ -1272,11 +1485,13 @@ async def delete_conversation(
     current_user = Depends(get_current_user)
 ):
     try:
-        partition_key = f'CHAT#{current_user["id"]}'
-        conversationcontainer.delete_item(
-            item=conversation_id,
-            partition_key=partition_key
-        )
+        write_behind.discard((current_user["id"], conversation_id))
+        # Whether it is published, without reading its messages
+        publication = await repository.conversations.get_publication(current_user["id"], conversation_id)
+        await repository.conversations.delete(current_user["id"], conversation_id)
+        await conversation_deleted(current_user["id"], conversation_id)
+        if publication and publication.get('published'):
+            await delete_public_snapshot(public_id(publication))
         return {"message": "Conversation deleted successfully"}
 
     except Exception as e:
@@ -1292,32 +1507,21 @@ async def get_conversation(
     conversation_id: str,
     current_user = Depends(get_current_user)
 ):
+    if write_behind.take_conflict((current_user["id"], conversation_id)):
+        raise autosave_conflict()
     try:
-        #c.id, c.partitionKey, c.user_id, c.name, c.folder, c.created_at, c.updated_at, c.type,
-        #c.messages, c._rid, c._self, c._etag, c._attachments, c._ts
-        query = """
-        SELECT c.messages
-        FROM c
-        WHERE c.type = 'conversation' 
-        AND c.partitionKey = @partitionKey 
-        AND c.id = @id
-        ORDER BY c.created_at DESC
-        """
-        parameters = [
-            {"name": "@partitionKey", "value": f'CHAT#{current_user["id"]}'},
-            {"name": "@id", "value": conversation_id}
-        ]
-        logger.info(f"SQL:" + query)
-        logger.info(f"Parameters:" + str(parameters))
-
-        conversation = list(conversationcontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
-        logger.info(f"Conversation: {conversation}")
-
-        return conversation
+        pending = write_behind.get((current_user["id"], conversation_id))
+        if pending is not None:
+            conversation = [{'messages': pending['messages'], 'version': pending.get('version')}]
+        else:
+            conversation = await repository.conversations.get_messages(current_user["id"], conversation_id)
+        log_payload(logger, "Conversation", conversation)
+        if not conversation:
+            return ORJSONResponse(conversation)
+
+        # Cosmos documents are plain JSON, so they can skip FastAPI's jsonable_encoder pass
+        version = conversation[0].pop('version', None)
+        return ORJSONResponse(conversation, headers={"ETag": version_etag(version)})
 
     except Exception as e:
         logger.error(f"Error retrieving conversation: {str(e)}")
@@ -1327,36 +1531,33 @@ async def get_conversation(
         )
 
 # Get conversations
+async def load_conversation_list(user_id: str):
+    if PROJECTIONS_ENABLED:
+        entries = await repository.projections.list_entries(user_id)
+        if entries:
+            return index_conversations(entries)
+    # Projections disabled, not built for this user yet, or no conversations left
+    return await repository.conversations.list_metadata(user_id)
+
+async def load_folders(user_id: str):
+    if PROJECTIONS_ENABLED:
+        entries = await repository.projections.list_entries(user_id)
+        if entries:
+            return index_folders(entries)
+    return await repository.conversations.list_folders(user_id)
+
+def list_conversations(current_user):
+    return cache.get_or_load(
+        f"conversations:{current_user['id']}",
+        lambda: reads.do(("conversations", current_user["id"]), lambda: load_conversation_list(current_user["id"]))
+    )
+
 @app.get("/api/conversations")
 async def get_conversations(current_user = Depends(get_current_user)):
     try:
-        query = """
-        SELECT 
-         c.id, c.partitionKey, c.user_id, c.name, c.folder, c.published, c.magiclink,
-         c.created_at, c.updated_at, c.type,
-         c.id as messages, c._rid, c._self, c._etag, c._attachments, c._ts, ARRAY_LENGTH(
-        ARRAY(
-            SELECT VALUE m 
-            FROM m IN c.messages 
-            WHERE m.role != 'system'
-        )
-    ) as message_count
-        FROM c
-        WHERE c.type = 'conversation' 
-        AND c.partitionKey = @partitionKey 
-        ORDER BY c.created_at DESC
-        """
-        parameters = [
-            {"name": "@partitionKey", "value": f'CHAT#{current_user["id"]}'}
-        ]
+        conversations = await list_conversations(current_user)
         
-        conversations = list(conversationcontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
-        
-        return conversations
+        return ORJSONResponse(conversations)
 
     except Exception as e:
         logger.error(f"Error retrieving conversations: {str(e)}")
@@ -1369,21 +1570,10 @@ async def get_conversations(current_user = Depends(get_current_user)):
 @app.get("/api/folders")
 async def get_folders(current_user = Depends(get_current_user)):
     try:
-        query = """
-        SELECT DISTINCT VALUE c.folder 
-        FROM c 
-        WHERE c.type = 'conversation' 
-        AND c.partitionKey = @partitionKey
-        """
-        parameters = [
-            {"name": "@partitionKey", "value": f'CHAT#{current_user["id"]}'}
-        ]
-        
-        folders = list(conversationcontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
+        folders = await cache.get_or_load(
+            f"folders:{current_user['id']}",
+            lambda: reads.do(("folders", current_user["id"]), lambda: load_folders(current_user["id"]))
+        )
         
         return folders
 
@@ -1408,23 +1598,15 @@ async def search_conversations(
                 detail="Search query cannot be empty"
             )
             
-        # Get all conversations for this user
-        query = """
-        SELECT c.id, c.name, c.folder, c.updated_at, c.messages, c.partitionKey
-        FROM c
-        WHERE c.type = 'conversation'
-        AND c.partitionKey = @partitionKey
-        """
-        
-        parameters = [
-            {"name": "@partitionKey", "value": f'CHAT#{current_user["id"]}'}
-        ]
-        
-        conversations = list(conversationcontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
+        # Search entries of the user's conversations: the matching ones from the projections,
+        # or all of them built from the conversations themselves
+        if PROJECTIONS_ENABLED:
+            conversations = await repository.projections.search(current_user["id"], search_term)
+        else:
+            conversations = [search_entry({**conv, 'user_id': current_user["id"]})
+                             for conv in await repository.conversations.list_for_search(current_user["id"])]
+            for conv in conversations:
+                conv['id'] = conv['conversation_id']
         
         # Process and filter results
         results = []
@@ -1448,24 +1630,19 @@ async def search_conversations(
             
             # Check message content match
             if not matched:
-                for message in conv.get("messages", []):
-                    content = message.get("content", "")
+                for content in conv.get("contents", []):
                     if search_term in content.lower():
                         matched = True
                         matched_content = extract_match_context(content, search_term)
                         break
             
             if matched:
-                # Count messages (excluding system message)
-                message_count = sum(1 for msg in conv.get("messages", []) 
-                                  if msg.get("role") != "system")
-                
                 result = {
                     "id": conv.get("id"),
                     "name": conv.get("name"),
                     "folder": conv.get("folder"),
                     "updated_at": conv.get("updated_at"),
-                    "message_count": message_count
+                    "message_count": conv.get("message_count")
                 }
                 
                 # Add highlighted versions if available
@@ -1482,7 +1659,7 @@ async def search_conversations(
         results.sort(key=lambda x: x.get("updated_at", ""), reverse=True)
         
         # Return top 10 results
-        return results[:10]
+        return ORJSONResponse(results[:10])
 
     except Exception as e:
         logger.error(f"Error searching conversations: {str(e)}")
@@ -1532,25 +1709,9 @@ async def check_conversation_exists(
     current_user = Depends(get_current_user)
 ):
     try:
-        query = """
-        SELECT c.id
-        FROM c
-        WHERE c.type = 'conversation'
-        AND c.partitionKey = @partitionKey
-        AND c.name = @name
-        AND c.folder = @folder
-        """
-        parameters = [
-            {"name": "@partitionKey", "value": f'CHAT#{current_user["id"]}'},
-            {"name": "@name", "value": request["name"]},
-            {"name": "@folder", "value": request["folder"]}
-        ]
-        
-        results = list(conversationcontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
+        results = await repository.conversations.find_by_name(
+            current_user["id"], request["name"], request["folder"]
+        )
         
         if results:
             return {"exists": True, "id": results[0]['id']}
@@ -1565,28 +1726,33 @@ async def check_conversation_exists(
 
 @app.put("/api/rename-conversation/{conversation_id}")
 async def rename_conversation(
+    request: Request,
     conversation_id: str,
-    request: dict,
+    payload: dict,
     current_user = Depends(get_current_user)
 ):
     try:
-        # Check if conversation exists
-        partition_key = f'CHAT#{current_user["id"]}'
-        conversation = conversationcontainer.read_item(
-            item=conversation_id,
-            partition_key=partition_key
-        )
-        
-        conversation['name'] = request['name']
-        conversation['updated_at'] = datetime.utcnow().isoformat()
-        
-        result = conversationcontainer.replace_item(
-            item=conversation_id,
-            body=conversation
-        )
-        
-        return result
+        # Write a pending autosave first, so that it is not lost or overwritten
+        await write_behind.flush((current_user["id"], conversation_id))
+        # Patched without reading it; with If-Match only if the client saw the stored version
+        result = await repository.conversations.patch(current_user["id"], conversation_id, {
+            'name': payload['name'],
+            'updated_at': datetime.utcnow().isoformat(),
+            'version': new_version()
+        }, version=if_match(request))
+        if result is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+
+        await conversation_written(result)
+        if result.get('published'):
+            await sync_public_snapshot(result)
+        
+        return versioned_response(result)
 
+    except HTTPException:
+        raise
+    except ConcurrencyConflict:
+        raise version_conflict()
     except Exception as e:
         logger.error(f"Error renaming conversation: {str(e)}")
         raise HTTPException(
@@ -1594,17 +1760,299 @@ async def rename_conversation(
             detail="Failed to rename conversation"
         )
 
+# Bulk operations on conversations selected in the sidebar. They take a list of ids and answer with a
+# status per id: 200, 404 if the user has no such conversation, 412 if it changed while the operation
+# ran, or 500. Writes run as transactional batches in the user's partition (see utilities/bulk.py).
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "500"))
+BULK_BATCH_SIZE = min(int(os.getenv("BULK_BATCH_SIZE", "100")), ConversationRepository.MAX_BATCH_OPERATIONS)
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "4"))
+
+def bulk_ids(request: BulkRequest) -> List[str]:
+    ids = list(dict.fromkeys(request.ids))
+    if not ids:
+        raise HTTPException(status_code=400, detail="No conversations selected")
+    if len(ids) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} conversations at a time")
+    return ids
+
+def bulk_result(conversation_id: str, status_code: int, conversation=None):
+    result = {'id': conversation_id, 'status': status_code}
+    if conversation is not None:
+        result['etag'] = version_etag(conversation.get('version'))
+    return result
+
+async def flush_pending(user_id: str, conversation_ids: List[str]):
+    # Pending autosaves are written first, so that they are not lost or overwritten
+    for conversation_id in conversation_ids:
+        await write_behind.flush((user_id, conversation_id))
+
+@app.post("/api/conversations/bulk/move")
+async def bulk_move_conversations(
+    request: BulkMoveRequest,
+    current_user = Depends(get_current_user)
+):
+    ids = bulk_ids(request)
+    user_id = current_user["id"]
+    try:
+        await flush_pending(user_id, ids)
+        updated_at = datetime.utcnow().isoformat()
+        results = await run_batches("move", ids, lambda batch: repository.conversations.patch_many(user_id, [
+            (conversation_id, {'folder': request.folder, 'updated_at': updated_at, 'version': new_version()}, None)
+            for conversation_id in batch
+        ]), BULK_BATCH_SIZE, BULK_CONCURRENCY)
+        await conversations_written(user_id, [conversation for _, _, conversation in results if conversation])
+        return [bulk_result(conversation_id, status_code, conversation)
+                for conversation_id, status_code, conversation in results]
+
+    except Exception as e:
+        logger.error(f"Error moving conversations: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to move conversations"
+        )
+
+@app.post("/api/conversations/bulk/delete")
+async def bulk_delete_conversations(
+    request: BulkRequest,
+    current_user = Depends(get_current_user)
+):
+    ids = bulk_ids(request)
+    user_id = current_user["id"]
+    try:
+        for conversation_id in ids:
+            write_behind.discard((user_id, conversation_id))
+        # Which ones exist, and the snapshots of the published ones, without reading their messages
+        publications = {p['id']: p for p in await repository.conversations.get_publications(user_id, ids)}
+
+        async def delete(batch):
+            await repository.conversations.delete_many(user_id, batch)
+            return batch
+
+        batches = await run_batches("delete", [i for i in ids if i in publications], delete,
+                                    BULK_BATCH_SIZE, BULK_CONCURRENCY)
+        results = {conversation_id: status_code for conversation_id, status_code, _ in batches}
+        deleted = [conversation_id for conversation_id, status_code in results.items() if status_code == 200]
+        await conversations_deleted(user_id, deleted)
+        for conversation_id in deleted:
+            if publications[conversation_id].get('published'):
+                await delete_public_snapshot(public_id(publications[conversation_id]))
+        return [bulk_result(conversation_id, results.get(conversation_id, 404)) for conversation_id in ids]
+
+    except Exception as e:
+        logger.error(f"Error deleting conversations: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to delete conversations"
+        )
+
+@app.post("/api/conversations/bulk/publish")
+async def bulk_publish_conversations(
+    request: BulkPublishRequest,
+    current_user = Depends(get_current_user)
+):
+    ids = bulk_ids(request)
+    user_id = current_user["id"]
+    try:
+        await flush_pending(user_id, ids)
+        publications = {p['id']: p for p in await repository.conversations.get_publications(user_id, ids)}
+        # Each patch is conditional on the version read above, like publish_conversation
+        batches = await run_batches("publish", [i for i in ids if i in publications],
+                                    lambda batch: repository.conversations.patch_many(user_id, [
+                                        (conversation_id, publication_fields(publications[conversation_id], request.published),
+                                         publications[conversation_id].get('version') or '0')
+                                        for conversation_id in batch
+                                    ]), BULK_BATCH_SIZE, BULK_CONCURRENCY)
+        results = {conversation_id: (status_code, conversation) for conversation_id, status_code, conversation in batches}
+
+        changed = [conversation for _, conversation in results.values() if conversation]
+        await conversations_written(user_id, changed)
+        for conversation in changed:
+            await publication_changed(conversation, public_id(publications[conversation['id']]))
+
+        response = []
+        for conversation_id in ids:
+            status_code, conversation = results.get(conversation_id, (404, None))
+            result = bulk_result(conversation_id, status_code, conversation)
+            if conversation is not None:
+                result['magiclink'] = conversation.get('magiclink')
+            response.append(result)
+        return response
+
+    except Exception as e:
+        logger.error(f"Error publishing conversations: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to publish conversations"
+        )
+
+@app.post("/api/conversations/bulk/export")
+async def bulk_export_conversations(
+    request: BulkRequest,
+    current_user = Depends(get_current_user)
+):
+    ids = bulk_ids(request)
+    user_id = current_user["id"]
+    try:
+        await flush_pending(user_id, ids)
+        # A read needs no transaction: one query in the partition instead of a batch of point reads
+        conversations = {c['id']: c for c in await repository.conversations.get_many(user_id, ids)}
+        results = []
+        for conversation_id in ids:
+            conversation = conversations.get(conversation_id)
+            if conversation is None:
+                results.append(bulk_result(conversation_id, 404))
+                continue
+            for key in SYSTEM_PROPERTIES:
+                conversation.pop(key, None)
+            results.append({**bulk_result(conversation_id, 200, conversation), 'conversation': conversation})
+        return ORJSONResponse(results)
+
+    except Exception as e:
+        logger.error(f"Error exporting conversations: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to export conversations"
+        )
+
+# Export of all conversations of a user as a zip archive, and import of one; both stream, so that
+# large archives are never held in memory (see utilities/archive.py)
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "20"))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+# Cosmos DB takes at most 2 MB per transactional batch and per document
+IMPORT_BATCH_BYTES = int(os.getenv("IMPORT_BATCH_BYTES", str(1024 * 1024)))
+IMPORT_LINE_MAX_BYTES = 2 * 1024 * 1024
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "2"))
+IMPORT_MAX_ERRORS = 100
+
+@app.get("/api/conversations/export")
+async def export_conversations(
+    export_format: str = Query("ndjson", alias="format"),
+    current_user = Depends(get_current_user)
+):
+    if export_format not in ("ndjson", "markdown"):
+        raise HTTPException(status_code=400, detail="The format must be ndjson or markdown")
+    user_id = current_user["id"]
+    try:
+        await flush_pending(user_id, [conversation_id for owner, conversation_id in write_behind.keys() if owner == user_id])
+    except Exception as e:
+        logger.error(f"Error writing pending conversations before an export: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to export conversations")
+
+    filename = f"conversations-{datetime.utcnow():%Y%m%d}.zip"
+    return StreamingResponse(
+        export_chunks(repository.conversations.iter_all(user_id, EXPORT_PAGE_SIZE), export_format),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def imported_conversation(data, user_id: str):
+    """A new conversation document from a line of an export. Publishing is not imported."""
+    if not isinstance(data, dict):
+        raise ValueError("Not a conversation")
+    conversation = Conversation(**data)
+    # Ids are kept, so importing the same archive twice skips what is already there
+    try:
+        conversation_id = str(uuid.UUID(str(data.get('id'))))
+    except ValueError:
+        conversation_id = str(uuid.uuid4())
+    now = datetime.utcnow().isoformat()
+    return {
+        'id': conversation_id,
+        'partitionKey': conversation_partition_key(user_id),
+        'type': 'conversation',
+        'user_id': user_id,
+        'name': conversation.name,
+        'folder': conversation.folder,
+        'messages': [msg.dict() for msg in conversation.messages],
+        'created_at': data.get('created_at') or now,
+        'updated_at': data.get('updated_at') or now,
+        'version': new_version()
+    }
+
+@app.post("/api/conversations/import")
+async def import_conversations(
+    request: Request,
+    current_user = Depends(get_current_user)
+):
+    """
+    Imports an export: an NDJSON body (optionally with Content-Encoding: gzip) or the zip archive.
+    Answers with the number of conversations imported, skipped because they exist, and failed.
+    """
+    user_id = current_user["id"]
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    chunks = request.stream()
+    # IMPORT_MAX_BYTES limits the body and what it decompresses to
+    if content_type in ("application/zip", "application/x-zip-compressed"):
+        chunks = zip_ndjson(chunks, IMPORT_MAX_BYTES)
+    elif content_type in ("application/x-ndjson", "application/jsonl"):
+        if request.headers.get("content-encoding", "").lower() == "gzip":
+            chunks = gunzip(limited(chunks, IMPORT_MAX_BYTES), IMPORT_MAX_BYTES)
+        else:
+            chunks = limited(chunks, IMPORT_MAX_BYTES)
+    else:
+        raise HTTPException(status_code=415, detail="Send an NDJSON body or the zip archive of an export")
+
+    summary = {'imported': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+
+    def failed(line_number: int, error: str):
+        summary['failed'] += 1
+        if len(summary['errors']) < IMPORT_MAX_ERRORS:
+            summary['errors'].append({'line': line_number, 'error': error})
+
+    async def write(batch):
+        results = await run_batches("import", [conversation for _, conversation in batch],
+                                    lambda conversations: repository.conversations.create_many(user_id, conversations),
+                                    len(batch), 1)
+        created = []
+        for (line_number, _), (_, status_code, conversation) in zip(batch, results):
+            if status_code == 200:
+                summary['imported'] += 1
+                created.append(conversation)
+            elif status_code == 409:
+                summary['skipped'] += 1
+            else:
+                failed(line_number, f"Could not be saved ({status_code})")
+        await conversations_written(user_id, created)
+
+    # At most IMPORT_CONCURRENCY batches are written at a time; meanwhile the body is not read
+    writer = BatchWriter(write, IMPORT_CONCURRENCY)
+    batch, batch_bytes, line_number = [], 0, 0
+    try:
+        async for line in ndjson_lines(chunks, IMPORT_LINE_MAX_BYTES):
+            line_number += 1
+            try:
+                conversation = imported_conversation(orjson.loads(line), user_id)
+            except (ValueError, TypeError):
+                failed(line_number, "Not a conversation")
+                continue
+            if batch and (len(batch) >= BULK_BATCH_SIZE or batch_bytes + len(line) > IMPORT_BATCH_BYTES):
+                await writer.submit(batch)
+                batch, batch_bytes = [], 0
+            batch.append((line_number, conversation))
+            batch_bytes += len(line)
+        if batch:
+            await writer.submit(batch)
+        await writer.drain()
+        return summary
+
+    except ArchiveError as e:
+        await writer.drain()
+        raise HTTPException(status_code=400, detail=f"{str(e)}; {summary['imported']} conversations were imported before")
+    except Exception as e:
+        writer.cancel()
+        logger.error(f"Error importing conversations: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to import conversations"
+        )
+
 # Get system messages
 @app.get("/api/system-messages", response_model=List[Dict[str, Any]])
 async def get_system_messages():
     """Retrieve all active system messages, grouped by category."""
     try:
-        # Query for all active system messages, ordered by category and displayOrder
-        query = "SELECT * FROM c WHERE c.isActive = true ORDER BY c.category, c.displayOrder"
-        items = list(systemmessagescontainer.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
+        # All active system messages, ordered by category and displayOrder
+        items = await system_message_library.active()
         return items
     except exceptions.CosmosHttpResponseError as e:
         logger.error(f"Error retrieving system messages: {str(e)}")
@@ -1614,12 +2062,7 @@ async def get_system_messages():
 async def get_system_message_categories():
     """Retrieve all unique categories of system messages."""
     try:
-        query = "SELECT DISTINCT c.category FROM c WHERE c.isActive = true ORDER BY c.category"
-        items = list(systemmessagescontainer.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
-        return [item['category'] for item in items]
+        return await system_message_library.categories()
     except exceptions.CosmosHttpResponseError as e:
         logger.error(f"Error retrieving system message categories: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -1628,18 +2071,36 @@ async def get_system_message_categories():
 async def get_system_messages_by_category(category: str):
     """Retrieve all active system messages for a specific category."""
     try:
-        query = "SELECT * FROM c WHERE c.isActive = true AND c.category = @category ORDER BY c.displayOrder"
-        parameters = [{"name": "@category", "value": category}]
-        items = list(systemmessagescontainer.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
+        items = await system_message_library.by_category(category)
         return items
     except exceptions.CosmosHttpResponseError as e:
         logger.error(f"Error retrieving system message category: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+# The settings data the single page app loads at startup, in one round trip. Folders and
+# conversations are not included: the dialogs load them when they open, so they are never stale.
+@app.get("/api/bootstrap")
+async def bootstrap():
+    parts = {
+        "models": get_models(),
+        "system_messages": get_system_messages(),
+        "system_message_categories": get_system_message_categories()
+    }
+    results = await asyncio.gather(*parts.values(), return_exceptions=True)
+
+    payload = {"settings": default_settings()}
+    errors = []
+    for name, result in zip(parts, results):
+        if isinstance(result, Exception):
+            # A failed part is left out; the client falls back to its regular endpoint
+            logger.error(f"Error loading bootstrap part {name}: {str(result)}")
+            payload[name] = None
+            errors.append(name)
+        else:
+            payload[name] = result
+    payload["errors"] = errors
+    return ORJSONResponse(payload)
+
 # Debugging routes
 @app.get("/api/debug/routes")
 async def debug_routes():
@@ -1672,12 +2133,8 @@ async def debug_routes():
 async def test_db():
     try:
         # Try to query the database
-        query = "SELECT VALUE COUNT(1) FROM c"
-        result = list(usercontainer.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
-        return {"message": "Database connection successful", "count": result[0]}
+        count = await repository.users.count()
+        return {"message": "Database connection successful", "count": count}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
 
@@ -1689,37 +2146,20 @@ async def debug_test():
     logger.info("="*50)
     return {"status": "ok", "message": "Debug endpoint working"}
 
-def get_cosmos_client():
-    try:
-        client = cosmos_client
-        yield client
-    except Exception as e:
-        print(f"Error creating Cosmos DB client: {e}")
-        raise
-
 # Health Check Endpoint
 @app.get("/healthz", status_code=status.HTTP_200_OK)
-async def health_check(cosmos_client: CosmosClient = Depends(get_cosmos_client)):
+async def health_check():
     """
     Health check endpoint.  Checks Cosmos DB connectivity.
     """
     try:
-        # Try to access the database and container to check connectivity
-        #cosmos_client = CosmosClient.from_connection_string(os.getenv("COSMOS_CONNECTION_STRING"))
-        database = cosmos_client.get_database_client("chat_app")
-        container = database.get_container_client("users")
-
         # Perform a simple read operation (e.g., get one item) to validate connectivity
-        try:
-            items = list(container.read_all_items(max_item_count=1))  # Adjust as needed. Reading 1 item is a good test.
-            if not items:
-                print("Health check: No items found in container.  Assuming healthy connection, but container might be empty.")
-        except exceptions.CosmosResourceNotFoundError as e:
-            print(f"Health check: Container not found: {e}")
-            return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "unhealthy", "error": "Container not found"})
-
+        await repository.ping()
         return {"status": "healthy"}
 
+    except exceptions.CosmosResourceNotFoundError as e:
+        print(f"Health check: Container not found: {e}")
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "unhealthy", "error": "Container not found"})
     except exceptions.CosmosHttpResponseError as e:
         print(f"Health check failed: Cosmos DB connection error: {e}")
         return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "unhealthy", "error": str(e)})
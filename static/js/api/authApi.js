@@ -76,6 +76,7 @@ export class AuthApi {
         localStorage.removeItem('user_email');
         localStorage.removeItem('token_expiration');
         localStorage.removeItem('currentConversationId');
+        localStorage.removeItem('currentConversationEtag');
         localStorage.removeItem('currentFolder');
         window.location.href = '/';
     }
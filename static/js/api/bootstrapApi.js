@@ -0,0 +1,30 @@
+// api/bootstrapApi.js
+// Startup data loaded with a single request to /api/bootstrap.
+// Each part is handed out once; later calls go to the regular endpoints so they see fresh data.
+let bootstrapRequest = null;
+
+export class BootstrapApi {
+    static load() {
+        if (!bootstrapRequest) {
+            bootstrapRequest = fetch('/api/bootstrap')
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error('Failed to fetch bootstrap data');
+                    }
+                    return response.json();
+                })
+                .catch(error => {
+                    console.error('Error fetching bootstrap data:', error);
+                    return {};
+                });
+        }
+        return bootstrapRequest;
+    }
+
+    static async take(part) {
+        const data = await BootstrapApi.load();
+        const value = data[part];
+        delete data[part];
+        return value === null ? undefined : value;
+    }
+}
@@ -125,6 +125,89 @@ export class ConversationApi {
         }
     }
 
+    // Bulk operations: action is move (options: { folder }), delete, publish (options: { published })
+    // or export. Answers with { id, status } per id; export adds the conversation.
+    static async bulk(action, ids, options = {}) {
+        try {
+            const token = localStorage.getItem('token');
+            if (!token) throw new Error('No authentication token found');
+
+            const response = await fetch(`/api/conversations/bulk/${action}`, {
+                method: 'POST',
+                headers: {
+                    'Authorization': `Bearer ${token}`,
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ ids, ...options })
+            });
+
+            if (!response.ok) {
+                const error = await response.json();
+                throw new Error(error.detail || `Failed to ${action} conversations`);
+            }
+
+            return await response.json();
+        } catch (error) {
+            console.error(`Error running bulk ${action}:`, error);
+            throw error;
+        }
+    }
+
+    // Downloads the zip archive of all conversations; format is 'ndjson' (can be imported again) or 'markdown'
+    static async exportArchive(format = 'ndjson') {
+        try {
+            const token = localStorage.getItem('token');
+            if (!token) throw new Error('No authentication token found');
+
+            const response = await fetch(`/api/conversations/export?format=${format}`, {
+                headers: {
+                    'Authorization': `Bearer ${token}`
+                }
+            });
+
+            if (!response.ok) {
+                throw new Error('Failed to export conversations');
+            }
+
+            const url = URL.createObjectURL(await response.blob());
+            const link = document.createElement('a');
+            link.href = url;
+            link.download = `conversations-${format}.zip`;
+            link.click();
+            URL.revokeObjectURL(url);
+        } catch (error) {
+            console.error('Error exporting conversations:', error);
+            throw error;
+        }
+    }
+
+    // Imports a zip archive or NDJSON file from exportArchive; the file is streamed by the browser
+    static async importArchive(file) {
+        try {
+            const token = localStorage.getItem('token');
+            if (!token) throw new Error('No authentication token found');
+
+            const response = await fetch('/api/conversations/import', {
+                method: 'POST',
+                headers: {
+                    'Authorization': `Bearer ${token}`,
+                    'Content-Type': file.name.endsWith('.zip') ? 'application/zip' : 'application/x-ndjson'
+                },
+                body: file
+            });
+
+            if (!response.ok) {
+                const error = await response.json();
+                throw new Error(error.detail || 'Failed to import conversations');
+            }
+
+            return await response.json();
+        } catch (error) {
+            console.error('Error importing conversations:', error);
+            throw error;
+        }
+    }
+
     static async checkExists(name, folder) {
         try {
             const token = localStorage.getItem('token');
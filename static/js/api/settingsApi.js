@@ -1,7 +1,14 @@
 // api/settingsApi.js
+import { BootstrapApi } from './bootstrapApi.js';
+
 export class SettingsApi {
     static async getModels() {
         try {
+            const models = await BootstrapApi.take('models');
+            if (models !== undefined) {
+                return models;
+            }
+
             const response = await fetch('/api/models');
             if (!response.ok) {
                 throw new Error('Failed to fetch models');
@@ -138,7 +138,8 @@ export class Chat {
 
             if (response.ok) {
                 const data = await response.json();
-                this.addBotMessage(data.response, settings.model);
+                // The server may have answered with a fallback model
+                this.addBotMessage(data.response, data.model || settings.model);
                 this.markConversationAsTouched();
                 //this.messageInput.focus();
             } else {
@@ -164,8 +165,11 @@ export class Chat {
         formData.append('max_tokens', settings.max_tokens);
         formData.append('system_prompt', settings.system_prompt);
 
+        // The token identifies the user for rate limiting
+        const token = localStorage.getItem('token');
         return fetch('/chat', {
             method: 'POST',
+            headers: token ? { 'Authorization': `Bearer ${token}` } : {},
             body: formData
         });
     }
@@ -393,6 +397,7 @@ export class Chat {
         localStorage.setItem('currentConversation', "New");
         localStorage.removeItem('chatHistory');
         localStorage.removeItem('currentConversationId');
+        localStorage.removeItem('currentConversationEtag');
         localStorage.removeItem('currentFolder');
         localStorage.setItem('currentConversationTouched', "false");
 
@@ -573,7 +578,7 @@ export class Chat {
             if (response.ok) {
                 const data = await response.json();
                 const settings = JSON.parse(localStorage.getItem('chatSettings'));
-                this.addBotMessage(data.response, settings.model);
+                this.addBotMessage(data.response, data.model || settings.model);
                 this.markConversationAsTouched();
                 this.saveHistory();
             } else {
@@ -228,6 +228,12 @@ export class ConversationManager {
                 </div>
                 
                 <div class="dialog-footer">
+                    <button class="export-archive" data-format="ndjson" title="Download all conversations; can be imported again">Export</button>
+                    <button class="export-archive" data-format="markdown" title="Download all conversations as Markdown files">Export Markdown</button>
+                    <button class="import-archive" title="Import an export (.zip or .ndjson)">Import</button>
+                    <input type="file" class="import-file" accept=".zip,.ndjson,.jsonl" style="display: none;">
+                    <button class="bulk-move" disabled>Move selected</button>
+                    <button class="bulk-delete" disabled>Delete selected</button>
                     <button class="close-selector">Cancel</button>
                 </div>
             </div>
@@ -426,6 +432,7 @@ export class ConversationManager {
             // If we found a conversation item and the click wasn't on action buttons
             if (conversationItem &&
                 !e.target.closest('.conversation-actions') &&
+                !e.target.closest('.conversation-select') &&
                 !e.target.closest('.name-edit')) {
 
                 const conversationData = this.debugConversationData(conversationItem);
@@ -492,6 +499,97 @@ export class ConversationManager {
 
         // Setup rename and delete buttons
         this.setupConversationActions(dialog);
+        this.setupBulkActions(dialog);
+        this.setupArchiveActions(dialog);
+    }
+
+    setupArchiveActions(dialog) {
+        dialog.querySelectorAll('.export-archive').forEach(btn => {
+            btn.addEventListener('click', async () => {
+                btn.disabled = true;
+                try {
+                    await ConversationApi.exportArchive(btn.dataset.format);
+                } catch (error) {
+                    alert('Failed to export conversations');
+                } finally {
+                    btn.disabled = false;
+                }
+            });
+        });
+
+        const fileInput = dialog.querySelector('.import-file');
+        dialog.querySelector('.import-archive').addEventListener('click', () => fileInput.click());
+        fileInput.addEventListener('change', async () => {
+            const file = fileInput.files[0];
+            if (!file) return;
+            const loadingOverlay = showLoadingOverlay(dialog.querySelector('.dialog-content'), 'Importing conversations...');
+            try {
+                const summary = await ConversationApi.importArchive(file);
+                alert(`Imported ${summary.imported} conversation(s), skipped ${summary.skipped} that already exist` +
+                    (summary.failed ? `, ${summary.failed} failed` : ''));
+                const conversations = await ConversationApi.getAll();
+                dialog.querySelector('.close').click();
+                await this.showLoadDialog(conversations);
+            } catch (error) {
+                alert(error.message);
+            } finally {
+                removeLoadingOverlay(loadingOverlay);
+                fileInput.value = '';
+            }
+        });
+    }
+
+    setupBulkActions(dialog) {
+        const moveButton = dialog.querySelector('.bulk-move');
+        const deleteButton = dialog.querySelector('.bulk-delete');
+        const selectedItems = () => [...dialog.querySelectorAll('#browse-page .conversation-select:checked')]
+            .map(checkbox => checkbox.closest('.conversation-item'));
+
+        dialog.addEventListener('change', (e) => {
+            if (e.target.classList.contains('conversation-select')) {
+                const count = selectedItems().length;
+                moveButton.disabled = deleteButton.disabled = count === 0;
+            }
+        });
+
+        moveButton.addEventListener('click', async () => {
+            const items = selectedItems();
+            const folder = prompt(`Move ${items.length} conversation(s) to folder:`);
+            if (!folder || !folder.trim()) return;
+            await this.bulkAction(dialog, 'move', items, { folder: folder.trim() });
+        });
+
+        deleteButton.addEventListener('click', async () => {
+            const items = selectedItems();
+            if (confirm(`Are you sure you want to delete ${items.length} conversation(s)?`)) {
+                await this.bulkAction(dialog, 'delete', items);
+            }
+        });
+    }
+
+    async bulkAction(dialog, action, items, options = {}) {
+        const ids = items.map(item => JSON.parse(item.dataset.conversation).id);
+        const loadingOverlay = showLoadingOverlay(dialog.querySelector('.dialog-content'), 'Updating conversations...');
+        try {
+            const results = await ConversationApi.bulk(action, ids, options);
+            const failed = results.filter(result => result.status !== 200).length;
+            if (failed > 0) {
+                alert(`${failed} of ${ids.length} conversation(s) could not be updated`);
+            }
+            if (action === 'delete' && ids.includes(this.currentId)) {
+                // Saved again as a new conversation
+                this.currentId = null;
+                localStorage.removeItem('currentConversationId');
+            }
+            // The folders changed; render the dialog again from the updated list
+            const conversations = await ConversationApi.getAll();
+            dialog.querySelector('.close').click();
+            await this.showLoadDialog(conversations);
+        } catch (error) {
+            alert(error.message);
+        } finally {
+            removeLoadingOverlay(loadingOverlay);
+        }
     }
 
     async saveConversation(name, folder) {
@@ -511,6 +609,8 @@ export class ConversationManager {
                 headers: {
                     'Authorization': `Bearer ${token}`,
                     'Content-Type': 'application/json',
+                    // Refused with 412 if the conversation was changed in another tab since we loaded it
+                    ...this.ifMatch(currentId ? localStorage.getItem('currentConversationEtag') : null)
                 },
                 body: JSON.stringify({
                     name: name.replace("'", ""),
@@ -530,6 +630,7 @@ export class ConversationManager {
                 this.currentId = result.id;
                 localStorage.setItem('currentConversationId', this.currentId);
             }
+            this.rememberEtag(response);
 
             localStorage.setItem('currentFolder', folder);
             localStorage.setItem('currentConversation', name);
@@ -567,7 +668,7 @@ export class ConversationManager {
             localStorage.setItem('currentConversation', conversation.name);
             this.currentId = conversation.id;
 
-            const conversationData = await this.getConversationMessages(conversation.id);
+            const conversationData = await this.getConversationMessages(conversation.id, true);
             this.chat.history = conversationData[0].messages.map(message => ({
                 role: message.role,
                 content: message.content,
@@ -648,7 +749,7 @@ export class ConversationManager {
         }
     }
 
-    async getConversationMessages(conversationId) {
+    async getConversationMessages(conversationId, current = false) {
         try {
             const token = localStorage.getItem('token');
             if (!token) {
@@ -666,6 +767,9 @@ export class ConversationManager {
                 throw new Error('Failed to fetch conversation messages');
             }
 
+            if (current) {
+                this.rememberEtag(response);
+            }
             return await response.json();
         } catch (error) {
             console.error('Error fetching conversation:', error);
@@ -673,6 +777,43 @@ export class ConversationManager {
         }
     }
 
+    // ETags of conversations: the version the server last returned, sent back in If-Match
+    ifMatch(etag) {
+        return etag ? { 'If-Match': etag } : {};
+    }
+
+    versionEtag(conversation) {
+        // Conversations saved before versions existed are version "0"
+        return `"${conversation.version || '0'}"`;
+    }
+
+    rememberEtag(response) {
+        const etag = response.headers.get('ETag');
+        if (etag) {
+            localStorage.setItem('currentConversationEtag', etag);
+        } else {
+            localStorage.removeItem('currentConversationEtag');
+        }
+    }
+
+    // After a rename or publish from the list, keep its entry and the open conversation up to date
+    updateVersion(item, conversation, response) {
+        const etag = response.headers.get('ETag');
+        if (!etag) return;
+        // A compressed response carries the weak form W/"version"
+        item.dataset.conversation = JSON.stringify({ ...conversation, version: etag.replace(/^W\//, '').replace(/"/g, '') });
+        if (conversation.id === this.currentId) {
+            localStorage.setItem('currentConversationEtag', etag);
+        }
+    }
+
+    async checkConflict(response) {
+        if (response.status === 412) {
+            const error = await response.json();
+            throw new Error(error.detail);
+        }
+    }
+
     // Helper methods for dialog management
     toggleNewFolderInput() {
         const folderSelect = document.getElementById('folder-select');
@@ -727,7 +868,8 @@ export class ConversationManager {
                     folder: conv.folder,
                     updated_at: conv.updated_at,
                     message_count: conv.message_count || 0,
-                    published: conv.published || false
+                    published: conv.published || false,
+                    magiclink: conv.magiclink || ''
                 };
 
                 // Serialize to JSON and ensure it's properly escaped for HTML attribute
@@ -754,6 +896,7 @@ export class ConversationManager {
 
                 return `
                     <div class="conversation-item" data-conversation="${safeJsonData}">
+                        <input type="checkbox" class="conversation-select" title="Select">
                         <div class="conversation-content">
                             <div class="conversation-name" data-id="${conv.id}">
                                 <span class="name-text">${escapeHTML(conv.name)}</span>
@@ -853,7 +996,9 @@ export class ConversationManager {
                 const conversation = JSON.parse(item.dataset.conversation);
 
                 if (confirm(`Are you sure you want to publish "${conversation.name}"?`)) {
-                    await this.publishConversation(conversation.id);
+                    const published = await this.publishConversation(item, conversation);
+                    // The server generates the magic link
+                    prompt('Public link to this conversation:', this.publicLink(published.magiclink));
                 }
             });
         });
@@ -865,8 +1010,9 @@ export class ConversationManager {
                 const item = btn.closest('.conversation-item');
                 const conversation = JSON.parse(item.dataset.conversation);
 
-                if (confirm(`Are you sure you want to unpublish "${conversation.name}"?`)) {
-                    await this.unpublishConversation(conversation.id);
+                const link = conversation.magiclink ? `\n\nPublic link: ${this.publicLink(conversation.magiclink)}` : '';
+                if (confirm(`Are you sure you want to unpublish "${conversation.name}"?${link}`)) {
+                    await this.unpublishConversation(item, conversation);
                 }
             });
         });
@@ -889,7 +1035,7 @@ export class ConversationManager {
                     const newName = nameInput.value.trim();
                     if (newName && newName !== nameText.textContent) {
                         const conversation = JSON.parse(item.dataset.conversation);
-                        await this.renameConversation(conversation.id, newName);
+                        await this.renameConversation(item, conversation, newName);
                         nameText.textContent = newName;
                     }
                     nameText.style.display = 'block';
@@ -919,86 +1065,99 @@ export class ConversationManager {
         });
     }
         
-    async publishConversation(id) {
+    async publishConversation(item, conversation) {
         try {
             const token = localStorage.getItem('token');
             if (!token) {
                 throw new Error('No authentication token found');
             }
 
-            const response = await fetch(`/api/publish-conversation/${id}`, {
+            const response = await fetch(`/api/publish-conversation/${conversation.id}`, {
                 method: 'PUT',
                 headers: {
                     'Authorization': `Bearer ${token}`,
                     'Content-Type': 'application/json',
+                    ...this.ifMatch(this.versionEtag(conversation))
                 },
-                body: JSON.stringify({ published: true, magiclink: "yyy" })
+                body: JSON.stringify({ published: true })
             });
 
+            await this.checkConflict(response);
             if (!response.ok) {
                 throw new Error('Failed to publish conversation');
             }
 
+            this.updateVersion(item, conversation, response);
             return await response.json();
         } catch (error) {
             console.error('Error publishing conversation:', error);
-            alert('Failed to publish conversation');
+            alert(error.message);
             throw error;
         }
     }
 
-    async unpublishConversation(id) {
+    publicLink(magiclink) {
+        return `${window.location.origin}/public-conversation/${magiclink}`;
+    }
+
+    async unpublishConversation(item, conversation) {
         try {
             const token = localStorage.getItem('token');
             if (!token) {
                 throw new Error('No authentication token found');
             }
 
-            const response = await fetch(`/api/publish-conversation/${id}`, {
+            const response = await fetch(`/api/publish-conversation/${conversation.id}`, {
                 method: 'PUT',
                 headers: {
                     'Authorization': `Bearer ${token}`,
                     'Content-Type': 'application/json',
+                    ...this.ifMatch(this.versionEtag(conversation))
                 },
-                body: JSON.stringify({ published: false, magiclink: "" })
+                body: JSON.stringify({ published: false })
             });
 
+            await this.checkConflict(response);
             if (!response.ok) {
                 throw new Error('Failed to unpublish conversation');
             }
 
+            this.updateVersion(item, conversation, response);
             return await response.json();
         } catch (error) {
             console.error('Error unpublishing conversation:', error);
-            alert('Failed to unpublish conversation');
+            alert(error.message);
             throw error;
         }
     }
    
-    async renameConversation(id, newName) {
+    async renameConversation(item, conversation, newName) {
         try {
             const token = localStorage.getItem('token');
             if (!token) {
                 throw new Error('No authentication token found');
             }
 
-            const response = await fetch(`/api/rename-conversation/${id}`, {
+            const response = await fetch(`/api/rename-conversation/${conversation.id}`, {
                 method: 'PUT',
                 headers: {
                     'Authorization': `Bearer ${token}`,
                     'Content-Type': 'application/json',
+                    ...this.ifMatch(this.versionEtag(conversation))
                 },
                 body: JSON.stringify({ name: newName })
             });
 
+            await this.checkConflict(response);
             if (!response.ok) {
                 throw new Error('Failed to rename conversation');
             }
 
+            this.updateVersion(item, { ...conversation, name: newName }, response);
             return await response.json();
         } catch (error) {
             console.error('Error renaming conversation:', error);
-            alert('Failed to rename conversation');
+            alert(error.message);
             throw error;
         }
     }
@@ -1060,6 +1219,7 @@ export class ConversationManager {
     handleAuthenticationError() {
         localStorage.removeItem('token');
         localStorage.removeItem('currentConversationId');
+        localStorage.removeItem('currentConversationEtag');
         localStorage.removeItem('currentFolder');
         alert('Your session has expired. Please login again.');
         window.location.href = '/static/login.html';
@@ -2,6 +2,7 @@
 import { DEFAULT_SETTINGS } from '../utils/constants.js';
 import { SettingsApi } from '../api/settingsApi.js';
 import { SystemMessageApi } from '../api/systemMessageApi.js';
+import { BootstrapApi } from '../api/bootstrapApi.js';
 
 export class Settings {
     constructor() {
@@ -122,8 +123,10 @@ export class Settings {
             // Clear existing options
             presetSelector.innerHTML = '<option value="">Select a preset...</option>';
             
-            // Fetch categories
-            const categories = await SystemMessageApi.getSystemMessageCategories();
+            // Fetch categories, and all messages at once when the bootstrap data has them
+            const categories = await BootstrapApi.take('system_message_categories')
+                || await SystemMessageApi.getSystemMessageCategories();
+            const allMessages = await BootstrapApi.take('system_messages');
             
             // Create optgroups for each category
             for (const category of categories) {
@@ -131,7 +134,9 @@ export class Settings {
                 optgroup.label = category;
                 
                 // Fetch messages for this category
-                const messages = await SystemMessageApi.getSystemMessagesByCategory(category);
+                const messages = allMessages
+                    ? allMessages.filter(msg => msg.category === category)
+                    : await SystemMessageApi.getSystemMessagesByCategory(category);
                 
                 // Add options for each message
                 messages.forEach(msg => {
@@ -417,8 +422,8 @@ export class Settings {
 
     async fetchDefaultSettings() {
         try {
-            const response = await fetch('/settings');
-            const data = await response.json();
+            const data = await BootstrapApi.take('settings')
+                || await (await fetch('/settings')).json();
             
             // Update DEFAULT_SETTINGS with the fetched values
             Object.assign(DEFAULT_SETTINGS, data);
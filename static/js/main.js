@@ -3,6 +3,7 @@ import { Chat } from './components/chat.js';
 import { Settings } from './components/settings.js';
 import { ConversationManager } from './components/conversationManager.js';
 import { AuthApi } from './api/authApi.js';
+import { BootstrapApi } from './api/bootstrapApi.js';
 import { showLoadingOverlay, removeLoadingOverlay } from './utils/helpers.js';
 
 class App {
@@ -12,6 +13,9 @@ class App {
 
     async init() {
         try {
+            // Start loading the startup data before the components ask for it
+            BootstrapApi.load();
+
             // Show loading overlay after 1 second delay
             let loadingOverlay = null;
             const loadingTimeout = setTimeout(() => {
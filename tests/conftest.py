@@ -0,0 +1,20 @@
+#conftest.py
+#The tests import the app modules from the repository root, like uvicorn main:app does.
+#main.py runs against the in-memory repository, without Cosmos DB, mail or LLM credentials.
+
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for key, value in {
+    "ENVIRONMENT": "test",
+    "REPOSITORY_BACKEND": "memory",
+    "SECRET_KEY": "test-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+    "MAIL_PORT": "587",
+    "MODEL": "gpt-4o-mini",
+    "TEMPERATURE": "0.7",
+    "MAX_TOKENS": "1000"
+}.items():
+    os.environ.setdefault(key, value)
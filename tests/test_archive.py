@@ -0,0 +1,95 @@
+#test_archive.py
+#Exports can be imported again, and an upload is refused once it or what it decompresses to is too large.
+
+import asyncio, gzip, io, zipfile
+import orjson
+import pytest
+from utilities.archive import ArchiveError, ExportArchive, gunzip, limited, ndjson_lines, zip_ndjson
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+async def stream(data: bytes, chunk_size: int = 1000):
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+async def collect(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+async def collect_pieces(chunks):
+    return [chunk async for chunk in chunks]
+
+def conversation(conversation_id):
+    return {'id': conversation_id, 'name': f'Chat {conversation_id}', 'folder': 'Default',
+            'messages': [{'role': 'user', 'content': 'hello'}], 'partitionKey': 'CHAT#u1'}
+
+def test_export_archive_round_trips_through_the_import():
+    archive = ExportArchive("ndjson")
+    data = b"".join(archive.add(conversation(c)) for c in ("c1", "c2")) + archive.close()
+
+    async def main():
+        return [orjson.loads(line) async for line in ndjson_lines(zip_ndjson(stream(data), len(data)), 1024)]
+
+    imported = run(main())
+    assert [c['id'] for c in imported] == ["c1", "c2"]
+    assert 'partitionKey' not in imported[0]
+
+def test_markdown_export_names_each_file_once():
+    archive = ExportArchive("markdown")
+    data = b"".join(archive.add({**conversation(c), 'name': 'Same'}) for c in ("c1", "c2")) + archive.close()
+    assert zipfile.ZipFile(io.BytesIO(data)).namelist() == ["Default/Same.md", "Default/Same (2).md"]
+
+def test_gunzip_decompresses_in_bounded_pieces():
+    body = b"".join(orjson.dumps(conversation(str(i))) + b"\n" for i in range(2000))
+    pieces = run(collect_pieces(gunzip(stream(gzip.compress(body)), len(body), read_size=4096)))
+    assert b"".join(pieces) == body
+    assert max(len(piece) for piece in pieces) <= 4096
+
+def test_gunzip_refuses_more_than_max_bytes():
+    bomb = gzip.compress(b"\n" * 10_000_000)
+    with pytest.raises(ArchiveError, match="decompressed body is larger than 1000000 bytes"):
+        run(collect(gunzip(stream(bomb), 1_000_000)))
+
+def test_gunzip_refuses_invalid_data():
+    with pytest.raises(ArchiveError, match="Invalid gzip data"):
+        run(collect(gunzip(stream(b"not gzip at all"), 1000)))
+
+def test_plain_body_is_limited():
+    assert run(collect(limited(stream(b"x" * 1000), 1000))) == b"x" * 1000
+    with pytest.raises(ArchiveError, match="larger than 999 bytes"):
+        run(collect(limited(stream(b"x" * 1000), 999)))
+
+def test_zip_entries_are_limited_once_decompressed():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("conversations.ndjson", b"\n" * 10_000_000)
+    data = buffer.getvalue()
+    assert len(data) < 100_000
+    with pytest.raises(ArchiveError, match="decompressed archive is larger than 100000 bytes"):
+        run(collect(zip_ndjson(stream(data), 100_000)))
+
+def test_long_lines_are_refused():
+    with pytest.raises(ArchiveError, match="longer than 100 bytes"):
+        run(collect(ndjson_lines(stream(b"x" * 1000, chunk_size=200), 100)))
+
+def test_import_refuses_an_ndjson_body_over_the_limit(monkeypatch):
+    import main
+    from fastapi.testclient import TestClient
+    monkeypatch.setattr(main, "IMPORT_MAX_BYTES", 1000)
+    main.repository.containers["users"].upsert("importer@example.com", {
+        'id': 'importer', 'partitionKey': 'importer@example.com', 'type': 'user',
+        'email': 'importer@example.com', 'password_hash': 'x'
+    })
+    headers = {"Authorization": f"Bearer {main.create_access_token({'sub': 'importer@example.com'})}",
+               "Content-Type": "application/x-ndjson"}
+    body = b"".join(orjson.dumps(conversation(str(i))) + b"\n" for i in range(100))
+
+    with TestClient(main.app) as client:
+        plain = client.post("/api/conversations/import", content=body, headers=headers)
+        compressed = client.post("/api/conversations/import", content=gzip.compress(body),
+                                 headers={**headers, "Content-Encoding": "gzip"})
+
+    assert plain.status_code == 400
+    assert "larger than 1000 bytes" in plain.json()["detail"]
+    assert compressed.status_code == 400
+    assert "decompressed body is larger than 1000 bytes" in compressed.json()["detail"]
@@ -0,0 +1,37 @@
+#test_assets.py
+#Precompressed assets are chosen by the qualities in Accept-Encoding.
+
+import gzip
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from utilities.assets import CachedStaticFiles
+
+brotli = pytest.importorskip("brotli")
+
+SOURCE = b"console.log('hello');" * 20
+
+@pytest.fixture
+def client(tmp_path):
+    dist = tmp_path / "dist"
+    dist.mkdir()
+    (dist / "app.js").write_bytes(SOURCE)
+    (dist / "app.js.gz").write_bytes(gzip.compress(SOURCE))
+    (dist / "app.js.br").write_bytes(brotli.compress(SOURCE))
+    app = Starlette(routes=[Mount("/static", CachedStaticFiles(directory=str(tmp_path)))])
+    return TestClient(app)
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip, br;q=0", "gzip"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("*", "br"),
+    ("identity", None),
+])
+def test_precompressed_file_follows_the_qualities(client, accept_encoding, expected):
+    response = client.get("/static/dist/app.js", headers={"Accept-Encoding": accept_encoding})
+    assert response.headers.get("content-encoding") == expected
+    assert response.content == SOURCE
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-type"].startswith(("application/javascript", "text/javascript"))
@@ -0,0 +1,70 @@
+#test_catalog.py
+#Catalogs loaded in the gunicorn master do not expire when a shared cache tells the workers about changes;
+#they are reloaded when their cache key is invalidated.
+
+import asyncio
+from utilities.catalog import ModelCatalog
+from utilities.responsecache import MemoryCacheStore
+from utilities.sharedcache import TieredCache
+
+def catalog_with_loads(ttl):
+    loads = []
+
+    async def loader():
+        loads.append(len(loads) + 1)
+        return [{"id": "gpt-4o", "value": "gpt-4o", "label": f"GPT-4o v{len(loads)}"}]
+
+    return ModelCatalog(loader, ttl=ttl), loads
+
+def test_pinned_catalog_does_not_expire():
+    catalog, loads = catalog_with_loads(ttl=0)
+
+    async def run():
+        await catalog.refresh()
+        catalog.pinned = True
+        for _ in range(3):
+            await catalog.get("gpt-4o")
+
+    asyncio.run(run())
+    assert loads == [1]
+
+def test_unpinned_catalog_expires():
+    catalog, loads = catalog_with_loads(ttl=0)
+
+    async def run():
+        await catalog.get("gpt-4o")
+        await catalog.get("gpt-4o")
+
+    asyncio.run(run())
+    assert loads == [1, 2]
+
+def test_invalidating_the_cache_key_reloads_a_pinned_catalog():
+    catalog, loads = catalog_with_loads(ttl=300)
+    cache = TieredCache(MemoryCacheStore())
+    cache.on_invalidate("catalog:models", catalog.invalidate)
+
+    async def run():
+        await catalog.refresh()
+        catalog.pinned = True
+        await cache.invalidate("catalog:models")
+        return await catalog.get("gpt-4o")
+
+    assert asyncio.run(run())["label"] == "GPT-4o v2"
+
+def test_preload_pins_the_catalogs_only_with_a_shared_cache(monkeypatch):
+    import main
+    monkeypatch.setattr(main.model_catalog, "pinned", False)
+    monkeypatch.setattr(main.system_message_library, "pinned", False)
+    assert main.cache.l2 is None
+    main.preload()
+    # Nothing would tell the workers about a change, so the catalogs keep expiring
+    assert not main.model_catalog.pinned and not main.system_message_library.pinned
+
+def test_invalidation_cli_explains_the_memory_backend():
+    import os, subprocess, sys
+    completed = subprocess.run([sys.executable, "-m", "utilities.sharedcache", "catalog:models"],
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               env={**os.environ, "CACHE_BACKEND": "memory", "CATALOG_TTL_SECONDS": "60"},
+                               capture_output=True, text=True)
+    assert completed.returncode == 1
+    assert "within CATALOG_TTL_SECONDS (60 s)" in completed.stderr
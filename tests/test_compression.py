@@ -0,0 +1,35 @@
+#test_compression.py
+#Compressed responses get a weak ETag, and every compressible response says Vary: Accept-Encoding.
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+from fastapi.testclient import TestClient
+from utilities.compression import CompressionMiddleware
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+@app.get("/large")
+async def large():
+    return Response("x" * 1000, media_type="application/json", headers={"ETag": '"v1"', "Vary": "Authorization"})
+
+@app.get("/small")
+async def small():
+    return Response("x", media_type="application/json", headers={"ETag": '"v1"'})
+
+client = TestClient(app)
+
+def test_compressed_response_has_a_weak_etag_and_vary():
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"v1"'
+    assert response.headers["vary"] == "Authorization, Accept-Encoding"
+    assert response.content == b"x" * 1000
+
+def test_uncompressed_responses_keep_the_strong_etag_and_vary():
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert (response.headers["etag"], response.headers["vary"]) == ('"v1"', "Accept-Encoding")
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert (response.headers["etag"], response.headers["vary"]) == ('"v1"', "Authorization, Accept-Encoding")
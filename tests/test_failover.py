@@ -0,0 +1,98 @@
+#test_failover.py
+#Fallback models are only called once their own admission lets the request through.
+
+import asyncio
+from contextlib import asynccontextmanager
+import pytest
+from utilities.failover import FailoverRouter, ProvidersUnavailable
+from utilities.providers import ChatResult
+from utilities.ratelimit import AdmissionController, RateLimited
+
+class FakeAdapter:
+    def __init__(self, provider, error=None):
+        self.provider = provider
+        self.error = error
+        self.calls = []
+
+    async def complete(self, model, messages, system_prompt, temperature, max_tokens):
+        self.calls.append(model)
+        if self.error is not None:
+            raise self.error
+        return ChatResult(text="answer", provider=self.provider, model=model, input_tokens=3, output_tokens=4)
+
+def router(openai_error=None):
+    providers = {"openai": FakeAdapter("openai", openai_error), "anthropic": FakeAdapter("anthropic")}
+
+    async def catalog_lookup(model):
+        return {"fallback_models": ["claude-3-haiku"]} if model == "gpt-4o" else {}
+
+    return FailoverRouter(providers, catalog_lookup), providers
+
+def admissions(limited=()):
+    admitted = []
+
+    @asynccontextmanager
+    async def admit(model):
+        if model in limited:
+            raise RateLimited("model", 10)
+        usage = {"tokens": 0}
+        admitted.append((model, usage))
+        yield usage
+
+    return admit, admitted
+
+def test_fallback_is_admitted_before_it_is_called():
+    failover, providers = router(openai_error=RuntimeError("down"))
+    admit, admitted = admissions()
+    result = asyncio.run(failover.complete("gpt-4o", [], "", 0.5, 100, admit=admit))
+    assert result.model == "claude-3-haiku"
+    assert [model for model, _ in admitted] == ["gpt-4o", "claude-3-haiku"]
+    assert admitted[1][1]["tokens"] == 7
+
+def test_rate_limited_fallback_is_not_called():
+    failover, providers = router(openai_error=RuntimeError("down"))
+    admit, _ = admissions(limited=("claude-3-haiku",))
+    with pytest.raises(ProvidersUnavailable) as e:
+        asyncio.run(failover.complete("gpt-4o", [], "", 0.5, 100, admit=admit))
+    assert isinstance(e.value.__cause__, RateLimited)
+    assert providers["anthropic"].calls == []
+    assert failover.breaker("anthropic").state == "closed"
+
+def test_rate_limited_requested_model_does_not_fall_back():
+    failover, providers = router()
+    admit, _ = admissions(limited=("gpt-4o",))
+    with pytest.raises(RateLimited):
+        asyncio.run(failover.complete("gpt-4o", [], "", 0.5, 100, admit=admit))
+    assert providers["openai"].calls == [] and providers["anthropic"].calls == []
+
+def test_exhausted_chain_is_unavailable_not_the_last_error():
+    failover, providers = router(openai_error=RuntimeError("down"))
+    providers["anthropic"].error = RuntimeError("also down")
+    with pytest.raises(ProvidersUnavailable) as e:
+        asyncio.run(failover.complete("gpt-4o", [], "", 0.5, 100))
+    assert str(e.value.__cause__) == "also down"
+    assert providers["openai"].calls == ["gpt-4o"] and providers["anthropic"].calls == ["claude-3-haiku"]
+
+def test_open_breaker_skips_the_provider():
+    failover, providers = router()
+    failover.breaker("openai").opened_at = float("inf")
+    result = asyncio.run(failover.complete("gpt-4o", [], "", 0.5, 100))
+    assert result.model == "claude-3-haiku" and providers["openai"].calls == []
+    failover.breaker("anthropic").opened_at = float("inf")
+    with pytest.raises(ProvidersUnavailable):
+        asyncio.run(failover.complete("gpt-4o", [], "", 0.5, 100))
+
+def test_admit_model_holds_a_provider_slot(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_PROVIDER_CONCURRENCY", "1")
+    monkeypatch.setenv("RATE_LIMIT_MAX_WAIT_SECONDS", "0.05")
+    admission = AdmissionController()
+
+    async def run():
+        async with admission.admit_model("openai", "gpt-4o", None, 10):
+            with pytest.raises(RateLimited):
+                async with admission.admit_model("openai", "gpt-4o-mini", None, 10):
+                    pass
+        async with admission.admit_model("openai", "gpt-4o-mini", None, 10):
+            pass
+
+    asyncio.run(run())
@@ -0,0 +1,45 @@
+#test_logs.py
+#Payloads are copied up to their cap when logged and rendered by the listener thread, not by the caller.
+
+import json, logging, queue
+from utilities.logs import DeferredQueueHandler, JsonFormatter, Payload
+
+def record(msg, *args):
+    return logging.LogRecord("test", logging.DEBUG, __file__, 1, msg, args, None)
+
+def test_payload_copies_at_most_its_limit():
+    payload = Payload("x" * 1_000_000, limit=100)
+    assert payload.value == "x" * 100 + "..."
+    content = "y" * 1_000_000
+    messages = [{'role': 'user', 'content': content} for _ in range(10_000)]
+    capped = str(Payload(messages, limit=100))
+    assert len(capped) < 300
+    assert capped.endswith("...]")
+
+def test_payload_is_not_changed_by_the_caller():
+    messages = [{'role': 'user', 'content': 'hello'}]
+    payload = Payload(messages)
+    messages[0]['content'] = 'changed'
+    assert "hello" in str(payload)
+
+def test_payload_is_rendered_by_the_listener_thread():
+    rendered = []
+
+    class Spy:
+        def __init__(self, value):
+            self.value = value
+
+        def __str__(self):
+            rendered.append(self.value)
+            return self.value
+
+    handler = DeferredQueueHandler(queue.Queue())
+    payload = Payload("prompt")
+    prepared = handler.prepare(record("%s: %s", "Final message", payload))
+    assert prepared.args == ("Final message", payload)
+    assert json.loads(JsonFormatter().format(prepared))['message'] == "Final message: prompt"
+
+    # Anything else the caller still holds is rendered before the handler returns
+    prepared = handler.prepare(record("%s", Spy("mutable")))
+    assert rendered == ["mutable"]
+    assert prepared.args is None and prepared.msg == "mutable"
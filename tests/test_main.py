@@ -0,0 +1,38 @@
+#test_main.py
+#Endpoints and helpers of main.py, against the in-memory repository.
+
+import main
+from starlette.requests import Request
+
+def request(headers, client=("10.0.0.5", 443)):
+    return Request({"type": "http", "headers": [(k.encode(), v.encode()) for k, v in headers.items()], "client": client})
+
+def test_client_address_is_the_one_the_proxy_appended():
+    assert main.client_address(request({"x-forwarded-for": "203.0.113.7:51234"})) == "203.0.113.7"
+    # A client cannot choose its address by sending the header itself
+    assert main.client_address(request({"x-forwarded-for": "1.2.3.4, 203.0.113.7:51234"})) == "203.0.113.7"
+    assert main.client_address(request({"x-forwarded-for": "[2001:db8::1]:51234"})) == "2001:db8::1"
+    assert main.client_address(request({})) == "10.0.0.5"
+
+def test_bootstrap_has_the_settings_data_only():
+    from fastapi.testclient import TestClient
+    with TestClient(main.app) as client:
+        payload = client.get("/api/bootstrap").json()
+    assert set(payload) == {"settings", "models", "system_messages", "system_message_categories", "errors"}
+    assert payload["errors"] == []
+
+def test_backfill_writes_the_missing_public_snapshots():
+    import asyncio
+    from utilities.backfill_public_snapshots import backfill
+    from utilities.repository import conversation_partition_key
+    conversations = main.repository.containers["conversations"]
+    for conversation_id, published in (("legacy", True), ("private", False)):
+        conversations.create(conversation_partition_key("u1"), {
+            'id': conversation_id, 'partitionKey': conversation_partition_key("u1"), 'type': 'conversation',
+            'user_id': 'u1', 'name': conversation_id, 'messages': [{'role': 'user', 'content': 'hi'}],
+            'published': published
+        })
+    assert asyncio.run(backfill()) == 1
+    assert asyncio.run(main.repository.public_conversations.get("legacy"))['conversation_id'] == "legacy"
+    assert asyncio.run(main.repository.public_conversations.get("private")) is None
+    assert asyncio.run(backfill()) == 0
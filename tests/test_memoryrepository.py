@@ -0,0 +1,65 @@
+#test_memoryrepository.py
+#The in-memory repository must fail the way Cosmos DB does, so code tested against it takes the same paths.
+
+import asyncio
+import pytest
+from azure.cosmos import exceptions
+from utilities.memoryrepository import MemoryRepository
+from utilities.repository import BatchOperationFailed, ConcurrencyConflict, conversation_partition_key
+
+def conversation(conversation_id, user_id="u1", version="v1"):
+    return {'id': conversation_id, 'partitionKey': conversation_partition_key(user_id), 'type': 'conversation',
+            'name': conversation_id, 'folder': 'Default', 'messages': [], 'version': version}
+
+def test_create_existing_raises_resource_exists():
+    repository = MemoryRepository()
+    asyncio.run(repository.conversations.create(conversation("c1")))
+    with pytest.raises(exceptions.CosmosResourceExistsError) as e:
+        repository.containers["conversations"].create(conversation_partition_key("u1"), conversation("c1"))
+    assert e.value.status_code == 409
+
+def test_replace_missing_raises_not_found():
+    repository = MemoryRepository()
+    with pytest.raises(exceptions.CosmosResourceNotFoundError):
+        asyncio.run(repository.conversations.replace(conversation("c1")))
+    with pytest.raises(exceptions.CosmosResourceNotFoundError):
+        asyncio.run(repository.users.replace({'id': 'x', 'partitionKey': 'x', 'email': 'x@example.com'}))
+
+def test_replace_with_stale_etag_is_a_conflict():
+    repository = MemoryRepository()
+    stored = asyncio.run(repository.conversations.create(conversation("c1")))
+    asyncio.run(repository.conversations.replace({**stored, 'name': 'new'}, etag=stored['_etag']))
+    with pytest.raises(ConcurrencyConflict):
+        asyncio.run(repository.conversations.replace({**stored, 'name': 'newer'}, etag=stored['_etag']))
+
+def test_delete_missing_raises_not_found():
+    repository = MemoryRepository()
+    with pytest.raises(exceptions.CosmosResourceNotFoundError):
+        asyncio.run(repository.conversations.delete("u1", "c1"))
+
+def test_patch_checks_the_version():
+    repository = MemoryRepository()
+    asyncio.run(repository.conversations.create(conversation("c1")))
+    assert asyncio.run(repository.conversations.patch("u1", "missing", {'name': 'x'})) is None
+    with pytest.raises(ConcurrencyConflict):
+        asyncio.run(repository.conversations.patch("u1", "c1", {'name': 'x'}, version="v0"))
+    patched = asyncio.run(repository.conversations.patch("u1", "c1", {'name': 'x'}, version="v1"))
+    assert patched['name'] == 'x'
+
+def test_batch_is_all_or_nothing_with_cosmos_status_codes():
+    repository = MemoryRepository()
+    asyncio.run(repository.conversations.create(conversation("c2")))
+    with pytest.raises(BatchOperationFailed) as e:
+        asyncio.run(repository.conversations.create_many("u1", [conversation("c1"), conversation("c2")]))
+    assert (e.value.index, e.value.status_code) == (1, 409)
+    assert asyncio.run(repository.conversations.get("u1", "c1")) is None
+
+    with pytest.raises(BatchOperationFailed) as e:
+        asyncio.run(repository.conversations.patch_many("u1", [("c2", {'name': 'x'}, "v1"), ("c2", {'name': 'y'}, "v0")]))
+    assert (e.value.index, e.value.status_code) == (1, 412)
+    assert asyncio.run(repository.conversations.get("u1", "c2"))['name'] == 'c2'
+
+    with pytest.raises(BatchOperationFailed) as e:
+        asyncio.run(repository.conversations.delete_many("u1", ["c2", "missing"]))
+    assert (e.value.index, e.value.status_code) == (1, 404)
+    assert asyncio.run(repository.conversations.get("u1", "c2")) is not None
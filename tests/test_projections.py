@@ -0,0 +1,194 @@
+#test_projections.py
+#The index entries and search entries follow the conversation writes, from the handlers and from the change feed,
+#without letting an older version overwrite a newer one.
+
+import asyncio
+from utilities.memoryrepository import MemoryRepository
+from utilities.projections import ChangeFeedProcessor, ConversationProjector, index_conversations, index_folders
+from utilities.repository import ConcurrencyConflict, conversation_partition_key
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def conversation(conversation_id, user_id="u1", folder="Default", created_at="2026-01-01", **fields):
+    return {'id': conversation_id, 'partitionKey': conversation_partition_key(user_id), 'type': 'conversation',
+            'user_id': user_id, 'name': conversation_id, 'folder': folder, 'created_at': created_at,
+            'messages': [{'role': 'system', 'content': 'Be brief'}, {'role': 'user', 'content': f'About {conversation_id}'}],
+            'version': 'v1', **fields}
+
+class Processor(ChangeFeedProcessor):
+    def __init__(self, *args, owner="worker-1", **kwargs):
+        super().__init__(*args, **kwargs)
+        self._owner = owner
+
+    @property
+    def owner(self):
+        return self._owner
+
+def test_apply_indexes_and_makes_searchable():
+    repository = MemoryRepository()
+    projector = ConversationProjector(repository)
+
+    async def main():
+        first = await repository.conversations.create(conversation("c1", created_at="2026-01-01"))
+        second = await repository.conversations.create(conversation("c2", folder="Work", created_at="2026-01-02"))
+        await projector.apply_many("u1", [first, second])
+        return await repository.projections.list_entries("u1"), await repository.projections.search("u1", "about c2")
+
+    entries, found = run(main())
+    conversations = index_conversations(entries)
+    assert [c['id'] for c in conversations] == ["c2", "c1"]
+    assert conversations[0]['message_count'] == 1
+    assert 'source_etag' not in conversations[0]
+    assert index_folders(conversations) == ["Work", "Default"]
+    assert [entry['id'] for entry in found] == ["c2"]
+
+def test_older_version_does_not_overwrite_a_newer_one():
+    repository = MemoryRepository()
+    projector = ConversationProjector(repository)
+
+    async def main():
+        old = await repository.conversations.create(conversation("c1"))
+        new = await repository.conversations.replace({**old, 'name': 'Renamed', '_ts': old['_ts'] + 1})
+        assert await projector.apply(new)
+        # The change feed catching up with the version the handler has already applied
+        assert not await projector.apply(new)
+        assert not await projector.apply({**old, '_etag': '"older"', '_ts': old['_ts'] - 1})
+        return await repository.projections.list_entries("u1")
+
+    assert index_conversations(run(main()))[0]['name'] == "Renamed"
+
+def test_remove_drops_the_entry_and_its_folder():
+    repository = MemoryRepository()
+    projector = ConversationProjector(repository)
+
+    async def main():
+        stored = [await repository.conversations.create(conversation(c, folder=c)) for c in ("c1", "c2")]
+        await projector.apply_many("u1", stored)
+        await projector.remove("u1", "c1")
+        return await repository.projections.list_entries("u1"), await repository.projections.search("u1", "about")
+
+    entries, found = run(main())
+    assert [c['id'] for c in index_conversations(entries)] == ["c2"]
+    assert index_folders(entries) == ["c2"]
+    assert [entry['id'] for entry in found] == ["c2"]
+
+def test_conversations_are_indexed_in_their_own_entries():
+    repository = MemoryRepository()
+    projector = ConversationProjector(repository)
+
+    async def main():
+        stored = [await repository.conversations.create(conversation(c)) for c in ("c1", "c2")]
+        await projector.apply_many("u1", stored)
+        return repository.containers["projections"].partition("PROJ#u1")
+
+    documents = run(main())
+    entries = sorted(d['id'] for d in documents if d['type'] == 'conversation_entry')
+    assert entries == ["entry-c1", "entry-c2"]
+
+def test_entry_update_is_retried_after_a_conflict():
+    repository = MemoryRepository()
+    projector = ConversationProjector(repository)
+    save_entry = repository.projections.save_entry
+    conflicts = []
+
+    async def conflicting_save(entry):
+        if not conflicts:
+            conflicts.append(entry['id'])
+            raise ConcurrencyConflict("changed concurrently")
+        return await save_entry(entry)
+
+    repository.projections.save_entry = conflicting_save
+
+    async def main():
+        await projector.apply(await repository.conversations.create(conversation("c1")))
+        return await repository.projections.list_entries("u1")
+
+    assert [c['id'] for c in index_conversations(run(main()))] == ["c1"]
+    assert conflicts == ["entry-c1"]
+
+def test_version_applied_by_another_worker_during_a_conflict_is_kept():
+    repository = MemoryRepository()
+    projector = ConversationProjector(repository)
+    save_entry = repository.projections.save_entry
+
+    async def main():
+        old = await repository.conversations.create(conversation("c1"))
+        new = await repository.conversations.replace({**old, 'name': 'Renamed'})
+        old = {**old, '_ts': new['_ts'] - 1}
+
+        async def overtaken_save(entry):
+            # The other worker applies the newer version between this one's read and its write
+            repository.projections.save_entry = save_entry
+            await ConversationProjector(repository).apply(new)
+            raise ConcurrencyConflict("changed concurrently")
+
+        repository.projections.save_entry = overtaken_save
+        assert not await projector.apply(old)
+        return await repository.projections.list_entries("u1")
+
+    assert index_conversations(run(main()))[0]['name'] == "Renamed"
+
+def test_published_conversations_refresh_their_snapshot_and_report_the_change():
+    repository = MemoryRepository()
+    snapshots, changes = [], []
+
+    async def public_snapshot(conversation):
+        snapshots.append(conversation['id'])
+
+    async def on_change(user_id):
+        changes.append(user_id)
+
+    projector = ConversationProjector(repository, public_snapshot=public_snapshot, on_change=on_change)
+
+    async def main():
+        stored = [await repository.conversations.create(conversation("c1", published=True)),
+                  await repository.conversations.create(conversation("c2"))]
+        await projector.apply_many("u1", stored)
+
+    run(main())
+    assert snapshots == ["c1"]
+    assert changes == ["u1"]
+
+def test_change_feed_is_applied_once_from_the_checkpoint():
+    repository = MemoryRepository()
+    processor = Processor(repository, ConversationProjector(repository))
+
+    async def main():
+        await repository.conversations.create(conversation("c1"))
+        await repository.conversations.create(conversation("c2", user_id="u2"))
+        first = await processor.run_once()
+        again = await processor.run_once()
+        await repository.conversations.create(conversation("c3", created_at="2026-01-03"))
+        return first, again, await processor.run_once(), await repository.projections.list_entries("u1")
+
+    first, again, later, entries = run(main())
+    assert (first, again, later) == (2, 0, 1)
+    assert [c['id'] for c in index_conversations(entries)] == ["c3", "c1"]
+
+def test_only_the_lease_holder_reads_the_feed():
+    repository = MemoryRepository()
+    holder = Processor(repository, ConversationProjector(repository), owner="worker-1")
+    other = Processor(repository, ConversationProjector(repository), owner="worker-2")
+
+    async def main():
+        await repository.conversations.create(conversation("c1"))
+        return await holder.run_once(), await other.run_once()
+
+    assert run(main()) == (1, 0)
+
+def test_rebuild_replays_the_feed_into_empty_projections():
+    repository = MemoryRepository()
+    processor = Processor(repository, ConversationProjector(repository))
+
+    async def main():
+        await repository.conversations.create(conversation("c1"))
+        await processor.run_once()
+        await repository.projections.upsert_search_entry({'id': 'search-gone', 'partitionKey': 'PROJ#u1',
+                                                          'type': 'search_entry', 'conversation_id': 'gone'})
+        replayed = await processor.rebuild()
+        return replayed, await repository.projections.search("u1", "")
+
+    replayed, entries = run(main())
+    assert replayed == 1
+    assert [entry['id'] for entry in entries] == ["c1"]
@@ -0,0 +1,114 @@
+#test_ratelimit.py
+#Admission control: waiting, rejection, eviction of idle users and no lost concurrency slots.
+
+import asyncio
+import pytest
+from utilities.ratelimit import AdmissionController, RateLimited, TokenBucket
+
+@pytest.fixture
+def admission(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_MAX_WAIT_SECONDS", "0.05")
+    monkeypatch.setenv("RATE_LIMIT_USER_RPM", "600")
+    monkeypatch.setenv("RATE_LIMIT_USER_CONCURRENCY", "1")
+    return AdmissionController()
+
+def test_token_bucket_waits_for_the_missing_tokens():
+    bucket = TokenBucket(capacity=60, refill_per_second=1)
+    bucket.take(60)
+    assert 9 < bucket.wait_time(10) <= 10
+    bucket.refund(-30)
+    assert bucket.wait_time(1) > 30
+
+def test_user_concurrency_is_released_after_a_rejection(admission):
+    async def run():
+        async with admission.admit_user("user:a", 10):
+            with pytest.raises(RateLimited):
+                async with admission.admit_user("user:a", 10):
+                    pass
+            # Another user is not affected
+            async with admission.admit_user("user:b", 10):
+                pass
+        async with admission.admit_user("user:a", 10):
+            pass
+        return admission.users["user:a"].slots
+
+    slots = asyncio.run(run())
+    assert not slots.locked()
+
+def test_cancelled_waiter_does_not_keep_a_slot(admission):
+    admission.max_wait = 5
+
+    async def run():
+        held = asyncio.Event()
+
+        async def holder():
+            async with admission.admit_user("user:a", 10):
+                held.set()
+                await asyncio.sleep(0.01)
+
+        async def waiter():
+            async with admission.admit_user("user:a", 10):
+                await asyncio.sleep(10)
+
+        first = asyncio.create_task(holder())
+        await held.wait()
+        second = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        # Cancelled while the slot is being handed over to it
+        await first
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        await asyncio.sleep(0)
+        slots = admission.users["user:a"].slots
+        return slots._value
+
+    assert asyncio.run(run()) == 1
+
+def test_idle_users_are_evicted(admission):
+    admission.user_idle_ttl = 0
+
+    async def run():
+        async with admission.admit_user("user:a", 10):
+            async with admission.admit_user("user:b", 10):
+                pass
+            # user:b is idle, user:a is not
+            async with admission.admit_user("user:c", 10):
+                assert "user:a" in admission.users and "user:b" not in admission.users
+        async with admission.admit_user("user:d", 10):
+            pass
+        return list(admission.users)
+
+    assert asyncio.run(run()) == ["user:d"]
+
+def test_budget_is_refunded_when_no_slot_is_free(admission):
+    async def run():
+        async with admission.admit_user("user:a", 1000):
+            state = admission.users["user:a"]
+            requests, tokens = state.limit.requests.tokens, state.limit.tokens.tokens
+            with pytest.raises(RateLimited):
+                async with admission.admit_user("user:a", 50000):
+                    pass
+            return requests, tokens, state.limit.requests.tokens, state.limit.tokens.tokens
+
+    requests, tokens, requests_after, tokens_after = asyncio.run(run())
+    assert requests_after == pytest.approx(requests, abs=1)
+    assert tokens_after == pytest.approx(tokens, abs=500)
+
+def test_model_budget_is_refunded_when_the_provider_is_busy(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_PROVIDER_CONCURRENCY", "1")
+    monkeypatch.setenv("RATE_LIMIT_MAX_WAIT_SECONDS", "0.05")
+    admission = AdmissionController()
+    model_doc = {"rpm_limit": 60, "tpm_limit": 10000}
+
+    async def run():
+        async with admission.admit_model("openai", "gpt-4o", model_doc, 1000):
+            with pytest.raises(RateLimited):
+                async with admission.admit_model("openai", "gpt-4o", model_doc, 5000):
+                    pass
+        return admission.model_limits["gpt-4o"]
+
+    limit = asyncio.run(run())
+    # Only the admitted request is charged: 1 request and its 1000 tokens
+    assert limit.requests.tokens == pytest.approx(59, abs=0.1)
+    assert limit.tokens.tokens == pytest.approx(9000, abs=10)
@@ -0,0 +1,114 @@
+#test_repository.py
+#Request charges are taken from the headers of each response, not from the client's last response,
+#and the change feed resumes from the continuation token of the page iterator.
+
+import asyncio, base64, json
+from utilities import repository
+
+class FakePage:
+    def __init__(self, items):
+        self.items = items
+
+    def __aiter__(self):
+        return self._items()
+
+    async def _items(self):
+        for item in self.items:
+            yield item
+
+class FakePager:
+    def __init__(self, pages, response_hook):
+        self.pages = pages
+        self.response_hook = response_hook
+
+    def by_page(self):
+        return self._pages()
+
+    async def _pages(self):
+        for charge, items in self.pages:
+            self.response_hook({'x-ms-request-charge': str(charge), 'etag': f'"{charge}"'}, None)
+            # Another request finishing meanwhile changes the shared headers
+            FakeContainer.client_connection.last_response_headers = {'x-ms-request-charge': '1000'}
+            await asyncio.sleep(0)
+            yield FakePage(items)
+
+class FakeChangeFeedPages:
+    """Like the SDK's ChangeFeedIterable: continuation_token is the token of the whole feed after each page,
+    while the response hook only sees the etag of the partition key range the page came from."""
+
+    def __init__(self, pages, response_hook, continuation_token):
+        self.pages = pages
+        self.response_hook = response_hook
+        self.position = json.loads(base64.b64decode(continuation_token))['position'] if continuation_token else 0
+        self.continuation_token = continuation_token
+
+    def __aiter__(self):
+        return self._pages()
+
+    async def _pages(self):
+        for position in range(self.position, len(self.pages)):
+            self.response_hook({'x-ms-request-charge': str(position + 1), 'etag': f'"{position}"'}, None)
+            self.continuation_token = base64.b64encode(json.dumps({'position': position + 1}).encode()).decode()
+            await asyncio.sleep(0)
+            yield FakePage(self.pages[position])
+
+class FakeChangeFeed:
+    def __init__(self, pages, response_hook):
+        self.pages = pages
+        self.response_hook = response_hook
+
+    def by_page(self, continuation_token=None):
+        return FakeChangeFeedPages(self.pages, self.response_hook, continuation_token)
+
+class FakeConnection:
+    last_response_headers = {}
+
+class FakeContainer:
+    client_connection = FakeConnection()
+
+    def query_items(self, query, response_hook, **kwargs):
+        return FakePager([(2.5, [1, 2]), (3.5, [3])], response_hook)
+
+    def query_items_change_feed(self, response_hook, **kwargs):
+        return FakeChangeFeed([['a'], ['b'], ['c']], response_hook)
+
+def test_paged_charge_is_the_sum_of_its_pages(monkeypatch):
+    calls = []
+    monkeypatch.setattr(repository, "record_cosmos_call", lambda *args: calls.append(args))
+    container = repository.InstrumentedContainer(FakeContainer(), "conversations")
+
+    async def run():
+        return [item async for item in container.query_items("SELECT * FROM c", partition_key="p")]
+
+    assert asyncio.run(run()) == [1, 2, 3]
+    (name, operation, charge, _, item_count, cross_partition), = calls
+    assert (name, operation, charge, item_count, cross_partition) == ("conversations", "query", 6.0, 3, False)
+
+def test_change_feed_continuation_is_the_token_of_the_page_iterator(monkeypatch):
+    calls = []
+    monkeypatch.setattr(repository, "record_cosmos_call", lambda *args: calls.append(args))
+    container = repository.InstrumentedContainer(FakeContainer(), "conversations")
+
+    async def run():
+        return [page async for page in container.change_feed_pages()]
+
+    pages = asyncio.run(run())
+    assert [items for items, _ in pages] == [['a'], ['b'], ['c']]
+    assert [json.loads(base64.b64decode(token)) for _, token in pages] == [{'position': 1}, {'position': 2}, {'position': 3}]
+    assert calls[0][2] == 6.0
+
+def test_change_feed_resumes_after_the_persisted_token():
+    container = repository.InstrumentedContainer(FakeContainer(), "conversations")
+    conversations = repository.ConversationRepository(container)
+
+    async def run():
+        checkpoint = None
+        async for items, token in conversations.change_pages(None, 1):
+            checkpoint = token
+            break
+        # A later run, from the token the first one stored in its checkpoint
+        return checkpoint, [items async for items, _ in conversations.change_pages(checkpoint, 1)]
+
+    checkpoint, resumed = asyncio.run(run())
+    assert json.loads(base64.b64decode(checkpoint)) == {'position': 1}
+    assert resumed == [['b'], ['c']]
@@ -0,0 +1,148 @@
+#test_sharedcache.py
+#A load that overlaps an invalidation must not put its result back in either level, and without an
+#L2 nothing is cached at all.
+
+import asyncio
+import pytest
+from benchmarks.fake_redis import FakeRedis
+from utilities.responsecache import MemoryCacheStore
+from utilities.sharedcache import RedisCacheStore, SQLiteCacheStore, TieredCache
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+class Loader:
+    def __init__(self, values):
+        self.values = list(values)
+        self.calls = 0
+        self.release = None
+
+    async def load(self):
+        self.calls += 1
+        if self.release is not None:
+            await self.release.wait()
+        return self.values.pop(0)
+
+def sqlite_cache(path, **kwargs):
+    return TieredCache(MemoryCacheStore(), SQLiteCacheStore(str(path), **kwargs))
+
+def test_memory_backend_caches_nothing():
+    cache = TieredCache(MemoryCacheStore())
+    loader = Loader([{"id": "u1", "name": "old"}, {"id": "u1", "name": "new"}])
+
+    async def main():
+        first = await cache.get_or_load("user:a@example.com", loader.load)
+        second = await cache.get_or_load("user:a@example.com", loader.load)
+        return first, second
+
+    first, second = run(main())
+    assert loader.calls == 2
+    assert second["name"] == "new"
+
+def test_values_are_served_from_l1_then_l2(tmp_path):
+    cache = sqlite_cache(tmp_path / "cache.sqlite3")
+    other = sqlite_cache(tmp_path / "cache.sqlite3")
+    loader = Loader([{"name": "first"}])
+
+    async def main():
+        await cache.start()
+        await other.start()
+        try:
+            await cache.get_or_load("folders:u1", loader.load)
+            return await cache.get_or_load("folders:u1", loader.load), await other.get_or_load("folders:u1", loader.load)
+        finally:
+            await cache.close()
+            await other.close()
+
+    assert run(main()) == ({"name": "first"}, {"name": "first"})
+    assert loader.calls == 1
+
+def test_load_overlapping_an_invalidation_is_not_written_back(tmp_path):
+    cache = sqlite_cache(tmp_path / "cache.sqlite3")
+    loader = Loader([{"name": "stale"}, {"name": "fresh"}])
+
+    async def main():
+        await cache.start()
+        try:
+            loader.release = asyncio.Event()
+            reader = asyncio.create_task(cache.get_or_load("conversations:u1", loader.load))
+            while not loader.calls:
+                await asyncio.sleep(0.01)
+            # A write lands while the read is still loading the old value
+            await cache.invalidate("conversations:u1")
+            loader.release.set()
+            stale = await reader
+            return stale, await cache.get_or_load("conversations:u1", loader.load)
+        finally:
+            await cache.close()
+
+    stale, fresh = run(main())
+    assert stale == {"name": "stale"}
+    assert fresh == {"name": "fresh"}
+    assert loader.calls == 2
+
+def test_stale_write_from_another_worker_is_not_served(tmp_path):
+    writer = sqlite_cache(tmp_path / "cache.sqlite3")
+    reader = sqlite_cache(tmp_path / "cache.sqlite3")
+
+    async def main():
+        await writer.start()
+        await reader.start()
+        try:
+            # The reader saw generation 0 before its load; the writer invalidates; the old value lands
+            _, generation = await reader.l2.get("user:a@example.com")
+            await writer.invalidate("user:a@example.com")
+            await reader.l2.set("user:a@example.com", '{"name": "stale"}', 60, generation)
+            value, current = await writer.l2.get("user:a@example.com")
+            assert (value, current) == (None, generation + 1)
+            await writer.l2.set("user:a@example.com", '{"name": "fresh"}', 60, current)
+            return await reader.get_or_load("user:a@example.com", Loader([]).load)
+        finally:
+            await writer.close()
+            await reader.close()
+
+    assert run(main()) == {"name": "fresh"}
+
+def test_invalidation_reaches_the_l1_of_other_workers(tmp_path):
+    writer = sqlite_cache(tmp_path / "cache.sqlite3", poll_interval=0.01)
+    reader = sqlite_cache(tmp_path / "cache.sqlite3", poll_interval=0.01)
+    loader = Loader([{"name": "old"}, {"name": "new"}])
+    notified = []
+    reader.on_invalidate("catalog:models", lambda: notified.append("catalog:models"))
+
+    async def main():
+        await writer.start()
+        await reader.start()
+        try:
+            await reader.get_or_load("catalog:models", loader.load)
+            await writer.invalidate("catalog:models")
+            await asyncio.sleep(0.1)
+            return await reader.get_or_load("catalog:models", loader.load)
+        finally:
+            await writer.close()
+            await reader.close()
+
+    assert run(main()) == {"name": "new"}
+    assert notified == ["catalog:models"]
+
+def test_redis_store_ignores_values_of_an_older_generation():
+    pytest.importorskip("redis")
+
+    async def main():
+        server = await asyncio.start_server(FakeRedis().handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        store = RedisCacheStore(f"redis://127.0.0.1:{port}/0")
+        await store.start()
+        try:
+            assert await store.get("user:a@example.com") == (None, 0)
+            await store.set("user:a@example.com", '{"name": "old"}', 60, 0)
+            assert await store.get("user:a@example.com") == ('{"name": "old"}', 0)
+            await store.delete("user:a@example.com")
+            await store.set("user:a@example.com", '{"name": "stale"}', 60, 0)
+            return await store.get("user:a@example.com")
+        finally:
+            await store.close()
+            server.close()
+            await server.wait_closed()
+
+    assert run(main()) == (None, 1)
@@ -0,0 +1,87 @@
+#test_singleflight.py
+#Concurrent identical reads share one backend call, but not the documents it returned.
+
+import asyncio
+from utilities.singleflight import SingleFlight
+
+class Backend:
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+        self.release = None
+
+    async def read(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return {"messages": [{"content": "hello"}]}
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_concurrent_reads_share_one_call_and_get_their_own_copy():
+    flight = SingleFlight()
+    backend = Backend()
+
+    async def main():
+        backend.release = asyncio.Event()
+        readers = [asyncio.create_task(flight.do(("conversation", "u1"), backend.read)) for _ in range(3)]
+        await asyncio.sleep(0)
+        backend.release.set()
+        return await asyncio.gather(*readers)
+
+    results = run(main())
+    assert backend.calls == 1
+    results[0]["messages"].append({"content": "changed by one handler"})
+    assert results[1] == results[2] == {"messages": [{"content": "hello"}]}
+
+def test_different_keys_are_not_coalesced():
+    flight = SingleFlight()
+    backend = Backend()
+
+    async def main():
+        backend.release = asyncio.Event()
+        readers = [asyncio.create_task(flight.do(("conversation", user), backend.read)) for user in ("u1", "u2")]
+        await asyncio.sleep(0)
+        backend.release.set()
+        await asyncio.gather(*readers)
+
+    run(main())
+    assert backend.calls == 2
+
+def test_cancelled_leader_does_not_cancel_the_call_for_the_others():
+    flight = SingleFlight()
+    backend = Backend()
+
+    async def main():
+        backend.release = asyncio.Event()
+        leader = asyncio.create_task(flight.do(("conversation", "u1"), backend.read))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do(("conversation", "u1"), backend.read))
+        await asyncio.sleep(0)
+        leader.cancel()
+        backend.release.set()
+        return await follower
+
+    assert run(main()) == {"messages": [{"content": "hello"}]}
+    assert backend.calls == 1
+
+def test_errors_reach_every_caller_and_the_key_is_released():
+    flight = SingleFlight()
+    backend = Backend(error=RuntimeError("Cosmos DB unavailable"))
+
+    async def main():
+        backend.release = asyncio.Event()
+        readers = [asyncio.create_task(flight.do(("conversation", "u1"), backend.read)) for _ in range(2)]
+        await asyncio.sleep(0)
+        backend.release.set()
+        results = await asyncio.gather(*readers, return_exceptions=True)
+        await asyncio.sleep(0)
+        backend.error = None
+        return results, await flight.do(("conversation", "u1"), backend.read)
+
+    results, retried = run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retried == {"messages": [{"content": "hello"}]}
+    assert backend.calls == 2
@@ -0,0 +1,62 @@
+#test_viewcounter.py
+#Views are written in batches, and never for a page that was unpublished or deleted.
+
+import asyncio
+from utilities.memoryrepository import MemoryRepository
+from utilities.repository import public_conversation_partition_key
+from utilities.viewcounter import ViewCounter
+
+def snapshot(public_id):
+    return {'id': public_id, 'partitionKey': public_conversation_partition_key(public_id), 'type': 'public_conversation'}
+
+def views(repository, public_id):
+    document = repository.containers["conversations"].get(public_conversation_partition_key(public_id), 'views')
+    return document['views'] if document else None
+
+def test_views_are_added_up_and_discarded_views_are_not_written():
+    repository = MemoryRepository()
+    counter = ViewCounter(repository.public_conversations.add_views)
+
+    async def run():
+        for public_id in ("a", "b"):
+            await repository.public_conversations.upsert(snapshot(public_id))
+        for public_id in ("a", "a", "b"):
+            counter.record(public_id)
+        counter.discard("b")
+        await repository.public_conversations.delete("b")
+        await counter.flush()
+
+    asyncio.run(run())
+    assert (views(repository, "a"), views(repository, "b")) == (2, None)
+
+def test_late_flush_does_not_recreate_the_count_of_a_deleted_page():
+    repository = MemoryRepository()
+
+    async def run():
+        await repository.public_conversations.upsert(snapshot("a"))
+        await repository.public_conversations.add_views("a", 1)
+        await repository.public_conversations.delete("a")
+        await repository.public_conversations.add_views("a", 5)
+
+    asyncio.run(run())
+    assert views(repository, "a") is None
+
+def test_failed_writes_are_kept_for_the_next_flush():
+    written = []
+    failures = [RuntimeError("throttled")]
+
+    async def flush_one(public_id, count):
+        if failures:
+            raise failures.pop()
+        written.append((public_id, count))
+
+    counter = ViewCounter(flush_one)
+
+    async def run():
+        counter.record("a")
+        await counter.flush()
+        counter.record("a")
+        await counter.flush()
+
+    asyncio.run(run())
+    assert written == [("a", 2)]
@@ -0,0 +1,172 @@
+#test_writebehind.py
+#Buffered autosaves are coalesced, retried after errors, chained onto the write in flight, and dropped
+#(never merged) when the stored version changed under them.
+
+import asyncio
+import main
+from fastapi.testclient import TestClient
+from utilities.repository import ConcurrencyConflict, conversation_partition_key
+from utilities.writebehind import WriteBehindBuffer
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+class Store:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.written = []
+        self.release = None
+
+    async def write(self, document, etag):
+        if self.release is not None:
+            await self.release.wait()
+        if self.errors:
+            raise self.errors.pop(0)
+        self.written.append((document, etag))
+        return f'"e{len(self.written) + 1}"'
+
+def test_updates_within_the_delay_are_written_once():
+    store = Store()
+    buffer = WriteBehindBuffer(store.write, delay=60)
+
+    async def main():
+        buffer.put("c1", {"messages": ["a"]}, '"e1"')
+        buffer.put("c1", {"messages": ["a", "b"]}, '"e1"')
+        assert buffer.get("c1") == {"messages": ["a", "b"], "_etag": '"e1"'}
+        await buffer.flush_all()
+
+    run(main())
+    assert store.written == [({"messages": ["a", "b"]}, '"e1"')]
+
+def test_failed_write_is_kept_for_a_retry():
+    store = Store(errors=[RuntimeError("unavailable")])
+    buffer = WriteBehindBuffer(store.write, delay=60, retry_delay=60)
+
+    async def main():
+        buffer.put("c1", {"messages": ["a"]}, '"e1"')
+        await buffer.flush("c1")
+        assert buffer.keys() == ["c1"]
+        await buffer.flush("c1")
+
+    run(main())
+    assert store.written == [({"messages": ["a"]}, '"e1"')]
+    assert not buffer.take_conflict("c1")
+
+def test_conflicting_write_is_dropped_and_reported_once():
+    store = Store(errors=[ConcurrencyConflict("changed")])
+    buffer = WriteBehindBuffer(store.write, delay=60, retry_delay=0)
+
+    async def main():
+        buffer.put("c1", {"messages": ["a"]}, '"e1"')
+        await buffer.flush("c1")
+        await asyncio.sleep(0.01)
+
+    run(main())
+    assert store.written == []
+    assert buffer.keys() == []
+    assert buffer.take_conflict("c1")
+    assert not buffer.take_conflict("c1")
+
+def test_update_during_a_flush_is_written_over_the_version_it_returns():
+    store = Store()
+    buffer = WriteBehindBuffer(store.write, delay=60)
+
+    async def main():
+        store.release = asyncio.Event()
+        buffer.put("c1", {"messages": ["a"]}, '"e1"')
+        flushing = asyncio.create_task(buffer.flush("c1"))
+        await asyncio.sleep(0)
+        # Read-your-writes while the first update is in flight; the next one is based on it
+        assert buffer.get("c1") == {"messages": ["a"], "_etag": '"e1"'}
+        buffer.put("c1", {"messages": ["a", "b"]}, buffer.get("c1")["_etag"])
+        second = asyncio.create_task(buffer.flush("c1"))
+        store.release.set()
+        await asyncio.gather(flushing, second)
+
+    run(main())
+    assert store.written == [({"messages": ["a"]}, '"e1"'), ({"messages": ["a", "b"]}, '"e2"')]
+    assert not buffer.take_conflict("c1")
+
+def test_update_during_a_conflicting_flush_is_dropped_too():
+    store = Store(errors=[ConcurrencyConflict("changed")])
+    buffer = WriteBehindBuffer(store.write, delay=60)
+
+    async def main():
+        store.release = asyncio.Event()
+        buffer.put("c1", {"messages": ["a"]}, '"e1"')
+        flushing = asyncio.create_task(buffer.flush("c1"))
+        await asyncio.sleep(0)
+        buffer.put("c1", {"messages": ["a", "b"]}, '"e1"')
+        store.release.set()
+        await flushing
+        await buffer.flush_all()
+
+    run(main())
+    assert store.written == []
+    assert buffer.keys() == []
+    assert buffer.take_conflict("c1")
+
+def test_discard_clears_a_conflict():
+    buffer = WriteBehindBuffer(Store(errors=[ConcurrencyConflict("changed")]).write, delay=60)
+
+    async def main():
+        buffer.put("c1", {"messages": ["a"]}, '"e1"')
+        await buffer.flush("c1")
+
+    run(main())
+    buffer.discard("c1")
+    assert not buffer.take_conflict("c1")
+
+def stored_conversation(conversation_id):
+    main.repository.containers["users"].upsert("writer@example.com", {
+        'id': 'writer', 'partitionKey': 'writer@example.com', 'type': 'user',
+        'email': 'writer@example.com', 'password_hash': 'x'
+    })
+    return run(main.repository.conversations.create({
+        'id': conversation_id, 'partitionKey': conversation_partition_key("writer"), 'type': 'conversation',
+        'user_id': 'writer', 'name': 'Chat', 'folder': 'Default', 'created_at': '2026-01-01',
+        'messages': [{'role': 'user', 'content': 'first', 'timestamp': '1'}], 'version': 'v1'
+    }))
+
+def autosave(content):
+    return {'name': 'Chat', 'folder': 'Default', 'messages': [{'role': 'user', 'content': content, 'timestamp': '2'}]}
+
+def test_autosave_overtaken_by_another_write_is_not_merged(monkeypatch):
+    monkeypatch.setattr(main, "WRITE_BEHIND_ENABLED", True)
+    monkeypatch.setattr(main.write_behind, "delay", 60)
+    stored = stored_conversation("c-conflict")
+    headers = {"Authorization": f"Bearer {main.create_access_token({'sub': 'writer@example.com'})}"}
+
+    with TestClient(main.app) as client:
+        response = client.put("/api/conversations/c-conflict", json=autosave("from this tab"), headers=headers)
+        assert response.status_code == 200
+        # Another worker writes the conversation before the autosave is flushed
+        run(main.repository.conversations.replace(
+            {**stored, 'messages': [{'role': 'user', 'content': 'from another tab'}], 'version': 'v2'}))
+        assert client.get("/api/conversations/export", headers=headers).status_code == 200
+
+        assert client.get("/api/conversation/c-conflict", headers=headers).status_code == 412
+        reloaded = client.get("/api/conversation/c-conflict", headers=headers)
+
+    assert reloaded.status_code == 200
+    assert reloaded.json()[0]['messages'] == [{'role': 'user', 'content': 'from another tab'}]
+    assert reloaded.headers["ETag"] == '"v2"'
+
+def test_if_match_is_checked_against_the_stored_version(monkeypatch):
+    monkeypatch.setattr(main, "WRITE_BEHIND_ENABLED", True)
+    monkeypatch.setattr(main.write_behind, "delay", 60)
+    stored_conversation("c-if-match")
+    headers = {"Authorization": f"Bearer {main.create_access_token({'sub': 'writer@example.com'})}"}
+
+    with TestClient(main.app) as client:
+        buffered = client.put("/api/conversations/c-if-match", json=autosave("buffered"), headers=headers)
+        stale = client.put("/api/conversations/c-if-match", json=autosave("stale"), headers={**headers, "If-Match": '"v1"'})
+        current = client.put("/api/conversations/c-if-match", json=autosave("checked"),
+                             headers={**headers, "If-Match": buffered.headers["ETag"]})
+
+    assert stale.status_code == 412
+    assert current.status_code == 200
+    assert main.write_behind.keys() == []
+    written = run(main.repository.conversations.get("writer", "c-if-match"))
+    assert written['messages'][0]['content'] == "checked"
+    assert current.headers["ETag"] == f'"{written["version"]}"'
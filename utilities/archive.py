@@ -0,0 +1,206 @@
+#archive.py
+#Streaming export and import of a user's conversations, in constant memory.
+#
+#The export is a zip archive written while the conversations are paged out of the database: either
+#one conversations.ndjson entry (one conversation per line, which is what the import reads) or one
+#Markdown file per conversation in a folder per folder, formatted like read.md. Each chunk of the zip
+#is sent as soon as it is compressed, so the archive is never held in memory.
+#
+#The import takes an NDJSON body, gzip-encoded or not, or a zip archive from the export. NDJSON is
+#parsed while it is received; a zip is spooled to a temporary file first, since its directory is at
+#the end. Lines are written in batches, and reading stops while IMPORT_CONCURRENCY batches are being
+#written, so a fast client is held back by TCP flow control instead of filling the memory.
+#Both the body and what it decompresses to are limited to max_bytes, so a small gzip or zip bomb is
+#refused instead of filling the memory or the disk.
+
+import asyncio, io, re, tempfile, zipfile, zlib
+import orjson
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+EXPORT_FIELDS = ('id', 'name', 'folder', 'created_at', 'updated_at', 'messages')
+
+# Characters that are not allowed in file names on Windows, macOS or Linux
+UNSAFE_FILE_NAME = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+class ArchiveError(ValueError):
+    """The uploaded archive cannot be read."""
+
+def export_document(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: conversation.get(key) for key in EXPORT_FIELDS}
+
+def conversation_markdown(conversation: Dict[str, Any]) -> str:
+    parts = [f"# {conversation.get('name') or 'Untitled'}"]
+    for message in conversation.get('messages', []):
+        role = str(message.get('role') or '').capitalize()
+        if message.get('role') == 'assistant' and message.get('model'):
+            role = f"{role}: {message['model']}"
+        parts.append(f"## {role}")
+        parts.append(str(message.get('content') or ''))
+    return "\n\n".join(parts) + "\n"
+
+def _file_name(value: Optional[str], default: str) -> str:
+    return UNSAFE_FILE_NAME.sub('_', value or '').strip(' .')[:100] or default
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable target of a ZipFile; collects what it writes until drained."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+class ExportArchive:
+    """Builds a zip archive of conversations chunk by chunk, as "ndjson" or "markdown"."""
+
+    def __init__(self, export_format: str = "ndjson"):
+        if export_format not in ("ndjson", "markdown"):
+            raise ValueError(f"Unknown export format: {export_format}")
+        self.export_format = export_format
+        self.sink = _Sink()
+        # Unseekable output: entry sizes go into data descriptors after each entry
+        self.zip = zipfile.ZipFile(self.sink, "w", zipfile.ZIP_DEFLATED, compresslevel=6)
+        self.entry = self.zip.open("conversations.ndjson", "w", force_zip64=True) if export_format == "ndjson" else None
+        self.names = set()
+
+    def add(self, conversation: Dict[str, Any]) -> bytes:
+        """Add a conversation; returns the part of the archive that is complete."""
+        if self.entry is not None:
+            self.entry.write(orjson.dumps(export_document(conversation)) + b"\n")
+        else:
+            base = f"{_file_name(conversation.get('folder'), 'No folder')}/{_file_name(conversation.get('name'), 'Untitled')}"
+            name, number = f"{base}.md", 1
+            while name in self.names:
+                number += 1
+                name = f"{base} ({number}).md"
+            self.names.add(name)
+            self.zip.writestr(name, conversation_markdown(conversation))
+        return self.sink.drain()
+
+    def close(self) -> bytes:
+        """Finish the archive; returns its remaining bytes, the central directory last."""
+        if self.entry is not None:
+            self.entry.close()
+        self.zip.close()
+        return self.sink.drain()
+
+async def export_chunks(conversations: AsyncIterator[Dict[str, Any]], export_format: str = "ndjson") -> AsyncIterator[bytes]:
+    archive = ExportArchive(export_format)
+    async for conversation in conversations:
+        # Compression runs off the event loop
+        data = await asyncio.to_thread(archive.add, conversation)
+        if data:
+            yield data
+    yield await asyncio.to_thread(archive.close)
+
+async def limited(chunks: AsyncIterator[bytes], max_bytes: int, what: str = "The body") -> AsyncIterator[bytes]:
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > max_bytes:
+            raise ArchiveError(f"{what} is larger than {max_bytes} bytes")
+        yield chunk
+
+async def _gunzip(chunks: AsyncIterator[bytes], read_size: int) -> AsyncIterator[bytes]:
+    decompressor = zlib.decompressobj(wbits=31)
+    async for chunk in chunks:
+        data = chunk
+        while True:
+            # At most read_size bytes at a time: a few compressed bytes can expand to gigabytes
+            try:
+                output = decompressor.decompress(data, read_size)
+            except zlib.error as e:
+                raise ArchiveError(f"Invalid gzip data: {str(e)}")
+            if output:
+                yield output
+            data = decompressor.unconsumed_tail
+            if not data and len(output) < read_size:
+                break
+    data = decompressor.flush()
+    if data:
+        yield data
+
+def gunzip(chunks: AsyncIterator[bytes], max_bytes: int, read_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """A gzip stream decompressed, refused once it is more than max_bytes."""
+    return limited(_gunzip(chunks, read_size), max_bytes, "The decompressed body")
+
+async def zip_ndjson(chunks: AsyncIterator[bytes], max_bytes: int, read_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """The .ndjson entries of an uploaded zip archive, which is spooled to a temporary file.
+
+    Both the archive and its decompressed entries are limited to max_bytes.
+    """
+    with tempfile.TemporaryFile() as spool:
+        size = 0
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise ArchiveError(f"The archive is larger than {max_bytes} bytes")
+            await asyncio.to_thread(spool.write, chunk)
+        try:
+            archive = zipfile.ZipFile(spool)
+        except zipfile.BadZipFile as e:
+            raise ArchiveError(f"Invalid zip archive: {str(e)}")
+        with archive:
+            names = [name for name in archive.namelist() if name.endswith(".ndjson")]
+            if not names:
+                raise ArchiveError("The archive has no .ndjson file; Markdown exports cannot be imported")
+            size = 0
+            for name in names:
+                with archive.open(name) as entry:
+                    while True:
+                        data = await asyncio.to_thread(entry.read, read_size)
+                        if not data:
+                            break
+                        size += len(data)
+                        if size > max_bytes:
+                            raise ArchiveError(f"The decompressed archive is larger than {max_bytes} bytes")
+                        yield data
+
+async def ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[bytes]:
+    """The non-empty lines of an NDJSON stream."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        if len(pending) > max_line_bytes:
+            raise ArchiveError(f"A line is longer than {max_line_bytes} bytes")
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+class BatchWriter:
+    """Writes batches with at most concurrency of them in flight; submit waits while that many are."""
+
+    def __init__(self, write: Callable[[List[Any]], Awaitable[None]], concurrency: int = 2):
+        self.write = write
+        self.concurrency = concurrency
+        self.tasks = set()
+
+    async def submit(self, batch: List[Any]):
+        while len(self.tasks) >= self.concurrency:
+            done, self.tasks = await asyncio.wait(self.tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        self.tasks.add(asyncio.create_task(self.write(batch)))
+
+    async def drain(self):
+        tasks, self.tasks = self.tasks, set()
+        for task in tasks:
+            await task
+
+    def cancel(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = set()
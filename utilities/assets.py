@@ -0,0 +1,86 @@
+#assets.py
+#Serving of the static assets built by utilities/build_assets.py.
+#Hashed files under /static/dist are cached by browsers for a year; everything else is revalidated.
+#When the build has not run (local development) templates fall back to the unhashed files.
+
+import json, mimetypes, os
+import anyio
+from starlette.staticfiles import StaticFiles
+from typing import Dict
+from utilities.compression import preferred_encodings
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+class AssetManifest:
+    def __init__(self, static_dir: str = "static", prefix: str = "/static"):
+        self.prefix = prefix
+        self.manifest_path = os.path.join(static_dir, "dist", "manifest.json")
+        self.assets: Dict[str, str] = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.manifest_path) as f:
+                self.assets = json.load(f)
+        except FileNotFoundError:
+            self.assets = {}
+
+    def url(self, path: str) -> str:
+        """URL of an asset given by its path below static/, e.g. asset_url('js/main.js')."""
+        hashed = self.assets.get(path)
+        if hashed:
+            return f"{self.prefix}/dist/{hashed}"
+        return f"{self.prefix}/{path}"
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with Cache-Control headers that serves precompressed .br/.gz files when accepted."""
+
+    async def get_response(self, path: str, scope):
+        cache_control = IMMUTABLE if path.startswith("dist/") else REVALIDATE
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+
+        if path.startswith("dist/") and scope["method"] in ("GET", "HEAD"):
+            for encoding in preferred_encodings(accept_encoding, ("br", "gzip")):
+                suffix = ".br" if encoding == "br" else ".gz"
+                # A stat of the disk; like StaticFiles, not on the event loop
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+                if stat_result is None:
+                    continue
+                response = self.file_response(full_path, stat_result, scope)
+                response.headers["content-type"] = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                response.headers["content-encoding"] = encoding
+                response.headers["vary"] = "Accept-Encoding"
+                response.headers["cache-control"] = cache_control
+                return response
+
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["cache-control"] = cache_control
+            if path.startswith("dist/"):
+                # Other clients get a precompressed file for the same URL
+                response.headers["vary"] = "Accept-Encoding"
+        return response
+
+class StaticFilesBypass:
+    """Outermost ASGI layer that hands static requests straight to the static files app,
+    so they skip authentication, metrics and compression middleware."""
+
+    def __init__(self, app, static_app, path: str = "/static"):
+        self.app = app
+        self.static_app = static_app
+        self.path = path.rstrip("/") + "/"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.path):
+            # Same scope changes as a Mount, so StaticFiles resolves the path below the prefix
+            # (the remaining path also works with Starlette versions that read the path below root_path)
+            prefix = self.path.rstrip("/")
+            static_scope = {**scope, "root_path": scope.get("root_path", "") + prefix, "path": scope["path"][len(prefix):]}
+            await self.static_app(static_scope, receive, send)
+            return
+        await self.app(scope, receive, send)
@@ -0,0 +1,51 @@
+#authentication.py
+#Pure ASGI authentication middleware.
+#Public routes are matched against one precompiled pattern and passed through untouched. For other
+#routes a bearer token, if present, is decoded once and shared with get_current_user through a
+#ContextVar; whether a route requires a login is still decided by its get_current_user dependency.
+
+import re
+from contextvars import ContextVar
+from jose import JWTError, jwt
+from typing import Dict, Iterable, Optional, Tuple
+
+_token_claims: ContextVar[Optional[Tuple[str, Dict]]] = ContextVar("token_claims", default=None)
+
+class RouteTable:
+    def __init__(self, public_prefixes: Iterable[str], public_paths: Iterable[str] = ()):
+        self.public_paths = frozenset(public_paths)
+        self.public_prefixes = re.compile("|".join(re.escape(prefix) for prefix in public_prefixes) or r"(?!)")
+
+    def is_public(self, path: str) -> bool:
+        return path in self.public_paths or self.public_prefixes.match(path) is not None
+
+def decode_token(token: str, secret_key: str, algorithm: str) -> Dict:
+    """Claims of a JWT, reusing the result of the middleware for the current request. Raises JWTError."""
+    cached = _token_claims.get()
+    if cached is not None and cached[0] == token:
+        return cached[1]
+    return jwt.decode(token, secret_key, algorithms=[algorithm])
+
+class AuthenticationMiddleware:
+    def __init__(self, app, route_table: RouteTable, secret_key: str, algorithm: str):
+        self.app = app
+        self.route_table = route_table
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.route_table.is_public(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and token:
+                    try:
+                        _token_claims.set((token, jwt.decode(token, self.secret_key, algorithms=[self.algorithm])))
+                    except JWTError:
+                        # Left to the route: public ones ignore the token, protected ones reject it
+                        pass
+                break
+        await self.app(scope, receive, send)
@@ -0,0 +1,28 @@
+#backfill_public_snapshots.py
+#One-off migration: writes the PUBLIC#{magic link} snapshot of every published conversation that has
+#none, i.e. conversations published before the snapshots existed. Public pages are only served from
+#snapshots, so run it once after deploying them; it is safe to run again.
+#run with: python -m utilities.backfill_public_snapshots (with the app settings in the environment or .env)
+
+import asyncio, logging
+import main
+
+logger = logging.getLogger(__name__)
+
+async def backfill() -> int:
+    repository = main.repository
+    await repository.connect()
+    written = 0
+    try:
+        async for conversation in repository.conversations.iter_published():
+            link = main.public_id(conversation)
+            if await repository.public_conversations.get(link) is None:
+                await repository.public_conversations.upsert(main.build_public_snapshot(conversation))
+                written += 1
+    finally:
+        await repository.close()
+    return written
+
+if __name__ == "__main__":
+    written = asyncio.run(backfill())
+    print(f"Wrote {written} public conversation snapshots")
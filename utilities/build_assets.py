@@ -0,0 +1,100 @@
+#build_assets.py
+#Build step for the frontend: copies the static assets to static/dist with a content hash in the
+#file name, writes .gz and .br versions of text assets and a manifest.json that maps the source path
+#to the hashed one. Imports between ES modules are rewritten to the hashed names.
+#run with: python utilities/build_assets.py
+
+import gzip, hashlib, json, os, re, shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+ASSET_DIRS = ("css", "js", "images")
+COMPRESSIBLE = (".css", ".js", ".svg", ".json")
+
+# import ... from './x.js', export ... from './x.js', import './x.js' and import('./x.js')
+IMPORT_PATTERN = re.compile(r"""((?:\bfrom|\bimport)\s*\(?\s*)(['"])(\.{1,2}/[^'"]+)\2""")
+CSS_URL_PATTERN = re.compile(r"""(url\(\s*)(['"]?)(?!data:|https?:|/)([^'")]+)\2(\s*\))""")
+
+def _hashed_name(path: str, content: bytes) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:10]}{ext}"
+
+def _relative(path: str, target: str) -> str:
+    """Reference from the asset at `path` to the asset at `target`, both relative to static/."""
+    relative = os.path.relpath(target, os.path.dirname(path)).replace(os.sep, "/")
+    return relative if relative.startswith(".") else "./" + relative
+
+def _references(path: str, text: str):
+    pattern = CSS_URL_PATTERN if path.endswith(".css") else IMPORT_PATTERN
+    for match in pattern.finditer(text):
+        yield os.path.normpath(os.path.join(os.path.dirname(path), match.group(3))).replace(os.sep, "/")
+
+def _rewrite(path: str, text: str, manifest: dict) -> str:
+    def replace(match):
+        target = os.path.normpath(os.path.join(os.path.dirname(path), match.group(3))).replace(os.sep, "/")
+        if target not in manifest:
+            return match.group(0)
+        rewritten = match.group(1) + match.group(2) + _relative(path, manifest[target]) + match.group(2)
+        return rewritten + match.group(4) if path.endswith(".css") else rewritten
+    pattern = CSS_URL_PATTERN if path.endswith(".css") else IMPORT_PATTERN
+    return pattern.sub(replace, text)
+
+def _write(path: str, content: bytes):
+    target = os.path.join(DIST_DIR, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as f:
+        f.write(content)
+    if path.endswith(COMPRESSIBLE):
+        with open(target + ".gz", "wb") as f:
+            f.write(gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(target + ".br", "wb") as f:
+                f.write(brotli.compress(content, quality=11))
+
+def build() -> dict:
+    sources = {}
+    for asset_dir in ASSET_DIRS:
+        for root, _, files in os.walk(os.path.join(STATIC_DIR, asset_dir)):
+            for name in files:
+                if name.startswith("."):
+                    continue
+                full_path = os.path.join(root, name)
+                sources[os.path.relpath(full_path, STATIC_DIR).replace(os.sep, "/")] = full_path
+
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    manifest = {}
+    visiting = set()
+
+    def process(path: str):
+        # A module's hash covers the hashed names of its imports, so dependencies are built first
+        if path in manifest or path not in sources:
+            return
+        if path in visiting:
+            raise ValueError(f"Circular import between static assets: {path}")
+        visiting.add(path)
+        with open(sources[path], "rb") as f:
+            content = f.read()
+        if path.endswith((".js", ".css")):
+            text = content.decode("utf-8")
+            for reference in _references(path, text):
+                process(reference)
+            content = _rewrite(path, text, manifest).encode("utf-8")
+        manifest[path] = _hashed_name(path, content)
+        _write(manifest[path], content)
+        visiting.discard(path)
+
+    for path in sorted(sources):
+        process(path)
+
+    with open(os.path.join(DIST_DIR, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+if __name__ == "__main__":
+    manifest = build()
+    print(f"Built {len(manifest)} assets into {DIST_DIR}")
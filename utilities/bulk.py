@@ -0,0 +1,53 @@
+#bulk.py
+#Runs an operation on many conversations of one user as transactional batches in their CHAT#{user_id}
+#partition: a few batches at a time, each of at most batch_size items. A batch is all or nothing, so
+#when one of its operations fails (a conversation that is gone, a version that changed) that item is
+#reported with the status of the failure and the batch is retried without it. Every item gets its
+#own result.
+
+import asyncio, logging
+from prometheus_client import Counter
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from utilities.repository import BatchOperationFailed
+
+logger = logging.getLogger(__name__)
+
+BULK_ITEMS = Counter(
+    "bulk_items_total",
+    "Items of bulk conversation operations, by operation and status code",
+    ["operation", "status"]
+)
+
+async def run_batches(operation: str, items: List[Any], execute: Callable[[List[Any]], Awaitable[List[Any]]],
+                      batch_size: int = 100, concurrency: int = 4) -> List[Tuple[Any, int, Optional[Any]]]:
+    """(item, status code, result of execute for it) for every item, in the order of items.
+
+    execute runs one transactional batch and returns a result per item, or raises
+    BatchOperationFailed naming the item that failed.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results: List[Optional[Tuple[Any, int, Optional[Any]]]] = [None] * len(items)
+
+    async def run(indexes: List[int]):
+        async with semaphore:
+            while indexes:
+                try:
+                    outcomes = await execute([items[i] for i in indexes])
+                except BatchOperationFailed as e:
+                    failed = indexes.pop(e.index)
+                    results[failed] = (items[failed], e.status_code or 500, None)
+                    continue
+                except Exception as e:
+                    logger.error(f"Error running a {operation} batch of {len(indexes)} items: {str(e)}")
+                    for i in indexes:
+                        results[i] = (items[i], 500, None)
+                    return
+                for i, outcome in zip(indexes, outcomes):
+                    results[i] = (items[i], 200, outcome)
+                return
+
+    await asyncio.gather(*(run(list(range(start, min(start + batch_size, len(items)))))
+                           for start in range(0, len(items), batch_size)))
+    for _, status_code, _ in results:
+        BULK_ITEMS.labels(operation, str(status_code)).inc()
+    return results
@@ -0,0 +1,95 @@
+#catalog.py
+#In-process copies of the model catalog stored in the "models" container (see utilities/models.py)
+#and of the system message library in the "system messages" container.
+#Both change rarely, so they are refreshed at most every CATALOG_TTL_SECONDS.
+#With gunicorn --preload they are loaded once in the master and shared by the workers; treat the
+#returned documents as read-only, writing to them would copy their memory pages into each worker.
+#With a shared cache (CACHE_BACKEND=redis or sqlite) those copies are pinned and do not expire:
+#they are reloaded when their cache key is invalidated, e.g.
+#  python -m utilities.sharedcache catalog:models catalog:system_messages
+#after changing the containers. With CACHE_BACKEND=memory nothing tells the workers about a change,
+#so the copies are not pinned and a change is picked up within CATALOG_TTL_SECONDS, or on a restart.
+
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+class _Catalog:
+    def __init__(self, loader: Callable[[], Awaitable[List[Dict[str, Any]]]], ttl: float = 300):
+        self.loader = loader
+        self.ttl = ttl
+        # Set once loaded in the gunicorn master: only invalidate() makes the copy stale
+        self.pinned = False
+        self._loaded_at = 0.0
+
+    def load(self, documents: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    async def refresh(self):
+        self.load(await self.loader())
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """Reload on the next lookup."""
+        self._loaded_at = 0.0
+
+    async def _ensure_fresh(self):
+        if not self._loaded_at or (not self.pinned and time.monotonic() - self._loaded_at > self.ttl):
+            await self.refresh()
+
+class ModelCatalog(_Catalog):
+    def __init__(self, loader: Callable[[], Awaitable[List[Dict[str, Any]]]], ttl: float = 300):
+        super().__init__(loader, ttl)
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._ordered: List[Dict[str, Any]] = []
+
+    def load(self, models: List[Dict[str, Any]]):
+        # Models are looked up by the value the frontend sends, which normally equals the id
+        self._models = {}
+        self._ordered = list(models)
+        for model in models:
+            self._models[model["id"]] = model
+            if model.get("value"):
+                self._models[model["value"]] = model
+
+    async def get(self, model: str) -> Optional[Dict[str, Any]]:
+        await self._ensure_fresh()
+        return self._models.get(model)
+
+    async def list(self, include_hidden: bool = False) -> List[Dict[str, Any]]:
+        """All models in catalog order; without include_hidden only those with show_in_prod = 'Yes'."""
+        await self._ensure_fresh()
+        return [model for model in self._ordered if include_hidden or model.get("show_in_prod") == "Yes"]
+
+    @staticmethod
+    def cost(model_doc: Optional[Dict[str, Any]], input_tokens: int, output_tokens: int,
+             cached_input_tokens: int = 0) -> float:
+        """Cost in USD implied by cost_per_1m_tokens_input/output.
+
+        Cached input tokens are priced at cost_per_1m_tokens_cached_input when the model has one.
+        """
+        if not model_doc:
+            return 0.0
+        input_price = float(model_doc.get("cost_per_1m_tokens_input") or 0)
+        cached_price = float(model_doc.get("cost_per_1m_tokens_cached_input") or input_price)
+        return ((input_tokens - cached_input_tokens) * input_price
+                + cached_input_tokens * cached_price
+                + output_tokens * float(model_doc.get("cost_per_1m_tokens_output") or 0)) / 1_000_000
+
+class SystemMessageLibrary(_Catalog):
+    def __init__(self, loader: Callable[[], Awaitable[List[Dict[str, Any]]]], ttl: float = 300):
+        super().__init__(loader, ttl)
+        self._messages: List[Dict[str, Any]] = []
+
+    def load(self, messages: List[Dict[str, Any]]):
+        # The loader returns the active messages ordered by category and displayOrder
+        self._messages = list(messages)
+
+    async def active(self) -> List[Dict[str, Any]]:
+        await self._ensure_fresh()
+        return self._messages
+
+    async def categories(self) -> List[str]:
+        return sorted({message["category"] for message in await self.active()})
+
+    async def by_category(self, category: str) -> List[Dict[str, Any]]:
+        return [message for message in await self.active() if message.get("category") == category]
@@ -0,0 +1,142 @@
+#compression.py
+#ASGI middleware that compresses responses with brotli (when the brotli package is installed) or gzip.
+#Bodies are compressed chunk by chunk, so streaming responses keep streaming.
+#Every response of a compressible type says Vary: Accept-Encoding, compressed or not, and the ETag of
+#a compressed response is made weak: its bytes differ from the identity response with the same ETag.
+#
+#Settings: COMPRESSION_MINIMUM_SIZE, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY
+
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content types worth compressing; images, archives and fonts are compressed already
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/x-ndjson",
+                      "application/xml", "image/svg+xml")
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Quality of each coding in an Accept-Encoding header: "gzip, br;q=0" is {"gzip": 1.0, "br": 0.0}."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, *params = [token.strip() for token in part.split(";")]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = min(1.0, max(0.0, float(value)))
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+def preferred_encodings(accept_encoding: str, available: Sequence[str]) -> List[str]:
+    """The available codings the client accepts, highest quality first; ties keep the order of available."""
+    accepted = accepted_encodings(accept_encoding)
+    # A coding that is not listed takes the quality of "*", if there is one
+    qualities = {encoding: accepted.get(encoding, accepted.get("*", 0.0)) for encoding in available}
+    return sorted((encoding for encoding in available if qualities[encoding] > 0), key=lambda e: -qualities[e])
+
+def _accepted_encoding(accept_encoding: str) -> Optional[str]:
+    preferred = preferred_encodings(accept_encoding, ("br", "gzip") if brotli is not None else ("gzip",))
+    return preferred[0] if preferred else None
+
+def _vary_on_accept_encoding(headers: list) -> list:
+    vary = [value for name, value in headers if name.lower() == b"vary"]
+    fields = [field.strip() for value in vary for field in value.split(b",") if field.strip()]
+    if any(field == b"*" or field.lower() == b"accept-encoding" for field in fields):
+        return headers
+    headers = [(name, value) for name, value in headers if name.lower() != b"vary"]
+    headers.append((b"vary", b", ".join(fields + [b"Accept-Encoding"])))
+    return headers
+
+def _weak_etag(headers: list) -> list:
+    return [(name, b"W/" + value if name.lower() == b"etag" and not value.startswith(b"W/") else value)
+            for name, value in headers]
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        # Intermediate chunks are flushed so that the client receives them without waiting for the end
+        if self._brotli is not None:
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if final else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1000, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = _accepted_encoding(accept_encoding)
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = {name.lower(): value for name, value in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                elif encoding is None or message["status"] in (204, 304):
+                    passthrough = True
+                    await send({**message, "headers": _vary_on_accept_encoding(message.get("headers", []))})
+                else:
+                    # Wait for the first body chunk to decide; small bodies are not worth it
+                    start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = _vary_on_accept_encoding(start_message.get("headers", []))
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send({**start_message, "headers": headers})
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers = [(name, value) for name, value in _weak_etag(headers) if name.lower() != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode("latin-1")))
+                compressed = compressor.compress(body, final=not more_body)
+                if not more_body:
+                    headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                await send({**start_message, "headers": headers})
+                await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+                return
+            await send({"type": "http.response.body", "body": compressor.compress(body, final=not more_body),
+                        "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
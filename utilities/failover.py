@@ -0,0 +1,237 @@
+#failover.py
+#Failover and hedged requests for the /chat endpoint.
+#A model can list fallback models in its catalog entry ("fallback_models": ["gpt-4o-mini"]) or in
+#LLM_FALLBACK_CHAINS ('{"deepseek-chat": ["gpt-4o-mini"]}'). Each provider has a circuit breaker,
+#so a vendor that keeps failing is skipped until LLM_BREAKER_RESET_SECONDS have passed.
+#
+#Hedging (LLM_HEDGE_ENABLED=true) sends a backup request when the first one is slower than the
+#p95 latency of the model, and answers with whichever finishes first.
+#
+#Every call is made inside admit(model), so a fallback or backup model is only called once its own
+#rate limits admit the request. A fallback that is rate limited is skipped.
+
+import asyncio, json, logging, os, time
+from collections import deque
+from contextlib import asynccontextmanager
+from prometheus_client import Counter, Gauge
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, List, Optional
+from utilities.providers import ChatResult, select_provider
+from utilities.ratelimit import RateLimited
+
+logger = logging.getLogger(__name__)
+
+LLM_FALLBACKS = Counter(
+    "llm_fallbacks_total",
+    "Requests answered by a fallback model instead of the requested one",
+    ["requested_model", "model"]
+)
+LLM_HEDGES = Counter(
+    "llm_hedged_requests_total",
+    "Backup requests sent because the first request exceeded the hedge delay",
+    ["model", "winner"]
+)
+LLM_CIRCUIT_OPEN = Gauge(
+    "llm_circuit_open",
+    "1 while the circuit breaker of a provider is open",
+    ["provider"],
+    multiprocess_mode="max"
+)
+
+class ProvidersUnavailable(Exception):
+    """Every model in the fallback chain is unavailable or failed."""
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and lets one trial request through
+    once `reset_timeout` seconds have passed."""
+
+    def __init__(self, provider: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self._trial_running = False
+        if self.opened_at is not None:
+            logger.info(f"Circuit breaker closed for provider: {self.provider}")
+            self.opened_at = None
+            LLM_CIRCUIT_OPEN.labels(self.provider).set(0)
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit breaker opened for provider: {self.provider}")
+            self.opened_at = time.monotonic()
+            LLM_CIRCUIT_OPEN.labels(self.provider).set(1)
+
+    def release(self):
+        """Give up a trial slot without a verdict, e.g. when a hedged request was cancelled."""
+        self._trial_running = False
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls of one model."""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, latency: float):
+        self.samples.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def _is_provider_failure(error: Exception) -> bool:
+    # Rejected requests (bad parameters, context too long) say nothing about the health of the vendor
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int) and 400 <= status_code < 500 and status_code not in (408, 409, 429):
+        return False
+    return True
+
+@asynccontextmanager
+async def _unlimited(model: str):
+    yield {}
+
+class FailoverRouter:
+    def __init__(self, providers: Dict[str, Any], catalog_lookup: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]):
+        self.providers = providers
+        self.catalog_lookup = catalog_lookup
+        self.fallback_chains: Dict[str, List[str]] = json.loads(os.getenv("LLM_FALLBACK_CHAINS", "{}"))
+        self.failure_threshold = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+        self.reset_timeout = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+        self.hedge_enabled = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+        self.hedge_min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        self.hedge_min_delay = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "1"))
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, LatencyWindow] = {}
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        if provider not in self.breakers:
+            self.breakers[provider] = CircuitBreaker(provider, self.failure_threshold, self.reset_timeout)
+        return self.breakers[provider]
+
+    async def chain(self, model: str) -> List[str]:
+        """The requested model followed by its fallbacks, without duplicates or unknown providers."""
+        fallbacks = None
+        try:
+            model_doc = await self.catalog_lookup(model)
+            fallbacks = (model_doc or {}).get("fallback_models")
+        except Exception as e:
+            logger.error(f"Error reading fallback models from the catalog: {str(e)}")
+        if not fallbacks:
+            fallbacks = self.fallback_chains.get(model, [])
+        chain = []
+        for candidate in [model] + list(fallbacks):
+            if candidate not in chain and select_provider(candidate) in self.providers:
+                chain.append(candidate)
+        return chain
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        window = self.latencies.get(model)
+        if not self.hedge_enabled or window is None or len(window.samples) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, window.percentile(0.95))
+
+    async def _attempt(self, model: str, admit, messages, system_prompt, temperature, max_tokens) -> ChatResult:
+        provider = select_provider(model)
+        breaker = self.breaker(provider)
+        try:
+            async with admit(model) as usage:
+                result = await self.providers[provider].complete(model, messages, system_prompt, temperature, max_tokens)
+                usage["tokens"] = result.input_tokens + result.output_tokens
+        except (asyncio.CancelledError, RateLimited):
+            breaker.release()
+            raise
+        except Exception as e:
+            if _is_provider_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        breaker.record_success()
+        self.latencies.setdefault(model, LatencyWindow()).add(result.latency)
+        return result
+
+    async def _hedged(self, model: str, backup_model: str, delay: float, *args) -> ChatResult:
+        primary = asyncio.create_task(self._attempt(model, *args))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self.breaker(select_provider(backup_model)).allow():
+            return await primary
+
+        backup = asyncio.create_task(self._attempt(backup_model, *args))
+        pending = {primary, backup}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        LLM_HEDGES.labels(model, "primary" if task is primary else "backup").inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def complete(self, model: str, messages: List[Dict[str, Any]], system_prompt: str,
+                       temperature: float, max_tokens: int,
+                       admit: Callable[[str], AsyncContextManager[Dict[str, Any]]] = _unlimited) -> ChatResult:
+        """The answer of the first model of the chain that succeeds.
+
+        admit(model) is entered around each call; it yields a dict whose "tokens" is set to the
+        tokens the call used. RateLimited from the requested model is raised as is; once every
+        model of the chain has failed or was skipped, ProvidersUnavailable is raised from the last error.
+        """
+        chain = await self.chain(model)
+        args = (admit, messages, system_prompt, temperature, max_tokens)
+        last_error: Optional[Exception] = None
+        for index, candidate in enumerate(chain):
+            if not self.breaker(select_provider(candidate)).allow():
+                logger.warning(f"Skipping model {candidate}: circuit breaker open")
+                continue
+            try:
+                delay = self.hedge_delay(candidate)
+                if delay is not None:
+                    backup_model = chain[index + 1] if index + 1 < len(chain) else candidate
+                    result = await self._hedged(candidate, backup_model, delay, *args)
+                else:
+                    result = await self._attempt(candidate, *args)
+            except RateLimited as e:
+                if candidate == model:
+                    raise
+                logger.warning(f"Skipping model {candidate}: {str(e)}")
+                last_error = e
+                continue
+            except Exception as e:
+                logger.error(f"Error calling model {candidate}: {str(e)}")
+                last_error = e
+                continue
+            if result.model != model:
+                LLM_FALLBACKS.labels(model, result.model).inc()
+            return result
+        raise ProvidersUnavailable(f"No provider available for model: {model}") from last_error
@@ -0,0 +1,140 @@
+#logs.py
+#Non-blocking logging: request handlers only put records on a queue, and a background
+#thread serializes them as JSON lines and writes them to logs/myapp.log.
+
+import atexit, json, logging, os, queue, random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_DIR = 'logs'
+LOG_FILE = os.path.join(LOG_DIR, 'myapp.log')
+
+# Attributes every LogRecord has; anything else was passed through `extra` and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0"))
+
+class _Cut:
+    """Stands for the part of a payload that was not copied."""
+
+    def __repr__(self):
+        return "..."
+
+_CUT = _Cut()
+
+def _snapshot(value, budget: list):
+    """A copy of value with about budget[0] characters of its strings; the rest is cut, not read."""
+    if budget[0] <= 0:
+        return _CUT
+    if isinstance(value, str):
+        budget[0] -= len(value)
+        return value if budget[0] >= 0 else value[:len(value) + budget[0]] + "..."
+    if isinstance(value, (int, float, bool, type(None))):
+        budget[0] -= 1
+        return value
+    if isinstance(value, dict):
+        copy = {}
+        for key, item in value.items():
+            if budget[0] <= 0:
+                copy["..."] = _CUT
+                break
+            budget[0] -= len(str(key))
+            copy[key] = _snapshot(item, budget)
+        return copy
+    if isinstance(value, (list, tuple)):
+        copy = []
+        for item in value:
+            if budget[0] <= 0:
+                copy.append(_CUT)
+                break
+            budget[0] -= 1
+            copy.append(_snapshot(item, budget))
+        return copy
+    return _snapshot(repr(value), budget)
+
+class Payload:
+    """A capped copy of a potentially large object; it is only rendered in the listener thread.
+
+    The copy is taken when the record is created, at a cost bounded by the limit rather than by the
+    size of the object, so the caller may change the object afterwards.
+    """
+
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit: int = PAYLOAD_MAX_CHARS):
+        self.value = _snapshot(value, [limit])
+        self.limit = limit
+
+    def __str__(self):
+        # Bounded by the copy: its strings hold at most limit characters between them
+        return self.value if isinstance(self.value, str) else repr(self.value)
+
+def log_payload(logger: logging.Logger, label: str, value):
+    """Log a prompt or provider response at DEBUG level, sampled by LOG_PAYLOAD_SAMPLE_RATE."""
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < PAYLOAD_SAMPLE_RATE:
+        logger.debug("%s: %s", label, Payload(value), stacklevel=2)
+
+# Arguments that may be handed to the listener thread as they are
+_SAFE_ARGUMENTS = (Payload, str, int, float, bool, type(None))
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'path': record.pathname,
+            'line': record.lineno
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text or record.exc_info:
+            entry['exception'] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves JSON serialization and file writes to the listener thread and never blocks."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Other arguments may be changed by the caller, or not be thread-safe, once the handler returns,
+        # and tracebacks reference live frames, so both are rendered here. Payloads and immutable
+        # arguments are left to the listener thread.
+        if not isinstance(record.msg, str) or (record.args and not (
+                isinstance(record.args, tuple) and all(isinstance(arg, _SAFE_ARGUMENTS) for arg in record.args))):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Dropping a record is better than stalling the event loop behind the disk
+            pass
+
+def setup_logging() -> QueueListener:
+    # Create logs directory if it doesn't exist
+    os.makedirs(LOG_DIR, exist_ok=True)
+
+    file_handler = RotatingFileHandler(
+        LOG_FILE,
+        maxBytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backupCount=int(os.getenv("LOG_BACKUP_COUNT", "10"))
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
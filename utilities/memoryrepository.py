@@ -0,0 +1,399 @@
+#memoryrepository.py
+#In-memory stand-in for CosmosRepository with the same async interface.
+#Used for local development and tests: set REPOSITORY_BACKEND=memory.
+#Failures raise the azure.cosmos exceptions the Cosmos DB SDK raises for them (404 on a missing
+#document, 409 on an existing one, 412 on an _etag mismatch), so callers take the same error paths.
+
+import copy, json, time, uuid
+from azure.cosmos import exceptions
+from typing import Any, Callable, Dict, List, Optional
+from utilities.repository import (BatchOperationFailed, ConcurrencyConflict, ProjectionRepository,
+                                  conversation_partition_key, projection_partition_key,
+                                  public_conversation_partition_key)
+
+def _stamp(item: Dict[str, Any]) -> Dict[str, Any]:
+    # Mimic the system properties Cosmos DB adds on every write
+    item = copy.deepcopy(item)
+    item['_etag'] = f'"{uuid.uuid4()}"'
+    item['_ts'] = int(time.time())
+    return item
+
+def _conditional(write, *args, **kwargs):
+    # Same mapping as repository._conditional
+    try:
+        return write(*args, **kwargs)
+    except (exceptions.CosmosAccessConditionFailedError, exceptions.CosmosResourceExistsError) as e:
+        raise ConcurrencyConflict(str(e))
+
+class MemoryContainer:
+    """A dict of documents keyed by (partition key, id), with a change feed of the latest versions."""
+
+    def __init__(self):
+        self.items: Dict[tuple, Dict[str, Any]] = {}
+        self.sequence = 0
+        self.changes: Dict[tuple, int] = {}
+
+    def all(self) -> List[Dict[str, Any]]:
+        return [copy.deepcopy(item) for item in self.items.values()]
+
+    def partition(self, partition_key: str) -> List[Dict[str, Any]]:
+        return [copy.deepcopy(item) for (pk, _), item in self.items.items() if pk == partition_key]
+
+    def get(self, partition_key: str, item_id: str) -> Optional[Dict[str, Any]]:
+        item = self.items.get((partition_key, item_id))
+        return copy.deepcopy(item) if item is not None else None
+
+    def create(self, partition_key: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        if (partition_key, item['id']) in self.items:
+            raise exceptions.CosmosResourceExistsError(status_code=409, message=f"Item {item['id']} already exists")
+        return self.upsert(partition_key, item)
+
+    def replace(self, partition_key: str, item: Dict[str, Any], etag: Optional[str] = None) -> Dict[str, Any]:
+        key = (partition_key, item['id'])
+        if key not in self.items:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"Item {item['id']} not found")
+        if etag is not None and self.items[key]['_etag'] != etag:
+            raise exceptions.CosmosAccessConditionFailedError(
+                status_code=412, message=f"Item {item['id']} was changed concurrently")
+        return self.upsert(partition_key, item)
+
+    def upsert(self, partition_key: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        key = (partition_key, item['id'])
+        stored = _stamp(item)
+        self.items[key] = stored
+        self.sequence += 1
+        self.changes[key] = self.sequence
+        return copy.deepcopy(stored)
+
+    def delete(self, partition_key: str, item_id: str) -> None:
+        if self.items.pop((partition_key, item_id), None) is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"Item {item_id} not found")
+        # Like the Cosmos DB change feed, deletes are not reported
+        self.changes.pop((partition_key, item_id), None)
+
+    def transaction(self, operations: List[Callable[[], Any]]) -> List[Any]:
+        """Run operations all or nothing, like a transactional batch."""
+        items, sequence, changes = dict(self.items), self.sequence, dict(self.changes)
+        results = []
+        for index, operation in enumerate(operations):
+            try:
+                results.append(operation())
+            except exceptions.CosmosHttpResponseError as e:
+                self.items, self.sequence, self.changes = items, sequence, changes
+                raise BatchOperationFailed(index, e.status_code, str(e))
+        return results
+
+    def changed_since(self, sequence: int) -> List[tuple]:
+        """(sequence, document) of the documents written after sequence, oldest first."""
+        changed = sorted((s, key) for key, s in self.changes.items() if s > sequence)
+        return [(s, copy.deepcopy(self.items[key])) for s, key in changed]
+
+class MemoryUserRepository:
+    def __init__(self, container: MemoryContainer):
+        self.container = container
+
+    async def get_by_email(self, email: str, user_only: bool = False) -> Optional[Dict[str, Any]]:
+        for user in self.container.all():
+            if user.get('email') == email and (not user_only or user.get('type') == 'user'):
+                return user
+        return None
+
+    async def create(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        return self.container.create(user['partitionKey'], user)
+
+    async def replace(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        return self.container.replace(user['partitionKey'], user)
+
+    async def delete(self, user: Dict[str, Any]) -> None:
+        self.container.delete(user['partitionKey'], user['id'])
+
+    async def count(self) -> int:
+        return len(self.container.items)
+
+    async def ping(self) -> None:
+        return None
+
+class MemoryTokenRepository:
+    def __init__(self, container: MemoryContainer):
+        self.container = container
+
+    async def get(self, token: str, token_type: str) -> Optional[Dict[str, Any]]:
+        token_doc = self.container.get(token, token)
+        if token_doc is None or token_doc.get('type') != token_type:
+            return None
+        return token_doc
+
+    async def create(self, token_doc: Dict[str, Any]) -> Dict[str, Any]:
+        return self.container.create(token_doc['id'], token_doc)
+
+    async def delete(self, token: str) -> None:
+        self.container.delete(token, token)
+
+    async def list_expired(self, current_time: str) -> List[Dict[str, Any]]:
+        return [t for t in self.container.all() if t.get('expires_at', '') < current_time]
+
+class MemoryConversationRepository:
+    def __init__(self, container: MemoryContainer):
+        self.container = container
+
+    def _conversations(self, user_id: str) -> List[Dict[str, Any]]:
+        conversations = [c for c in self.container.partition(conversation_partition_key(user_id))
+                         if c.get('type') == 'conversation']
+        conversations.sort(key=lambda c: c.get('created_at', ''), reverse=True)
+        return conversations
+
+    async def create(self, conversation: Dict[str, Any]) -> Dict[str, Any]:
+        return self.container.create(conversation['partitionKey'], conversation)
+
+    async def get(self, user_id: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        return self.container.get(conversation_partition_key(user_id), conversation_id)
+
+    async def replace(self, conversation: Dict[str, Any], etag: Optional[str] = None) -> Dict[str, Any]:
+        return _conditional(self.container.replace, conversation['partitionKey'], conversation, etag=etag)
+
+    def _patch(self, user_id: str, conversation_id: str, fields: Dict[str, Any], version: Optional[str]) -> Dict[str, Any]:
+        partition_key = conversation_partition_key(user_id)
+        conversation = self.container.get(partition_key, conversation_id)
+        if conversation is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"Item {conversation_id} not found")
+        # Like the filter predicate of a Cosmos DB patch
+        if version is not None and (conversation.get('version') or '0') != version:
+            raise exceptions.CosmosAccessConditionFailedError(
+                status_code=412, message=f"Conversation {conversation_id} is no longer version {version}")
+        return self.container.replace(partition_key, {**conversation, **fields})
+
+    async def patch(self, user_id: str, conversation_id: str, fields: Dict[str, Any],
+                    version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        try:
+            return _conditional(self._patch, user_id, conversation_id, fields, version)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+    async def iter_all(self, user_id: str, page_size: int = 20):
+        for conversation in self._conversations(user_id):
+            yield conversation
+
+    async def create_many(self, user_id: str, conversations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return self.container.transaction([
+            lambda conversation=conversation: self.container.create(conversation['partitionKey'], conversation)
+            for conversation in conversations
+        ])
+
+    async def patch_many(self, user_id: str, changes: List[tuple]) -> List[Dict[str, Any]]:
+        return self.container.transaction([
+            lambda change=change: self._patch(user_id, *change) for change in changes
+        ])
+
+    async def delete_many(self, user_id: str, conversation_ids: List[str]) -> None:
+        partition_key = conversation_partition_key(user_id)
+        self.container.transaction([
+            lambda conversation_id=conversation_id: self.container.delete(partition_key, conversation_id)
+            for conversation_id in conversation_ids
+        ])
+
+    async def delete(self, user_id: str, conversation_id: str) -> None:
+        self.container.delete(conversation_partition_key(user_id), conversation_id)
+
+    async def get_publication(self, user_id: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        results = await self.get_publications(user_id, [conversation_id])
+        return results[0] if results else None
+
+    async def get_publications(self, user_id: str, conversation_ids: List[str]) -> List[Dict[str, Any]]:
+        return [{key: c.get(key) for key in ('id', 'published', 'public_id', 'version')}
+                for c in await self.get_many(user_id, conversation_ids)]
+
+    async def get_many(self, user_id: str, conversation_ids: List[str]) -> List[Dict[str, Any]]:
+        return [c for c in self._conversations(user_id) if c['id'] in conversation_ids]
+
+    async def get_messages(self, user_id: str, conversation_id: str) -> List[Dict[str, Any]]:
+        conversation = self.container.get(conversation_partition_key(user_id), conversation_id)
+        if conversation is None or conversation.get('type') != 'conversation':
+            return []
+        return [{'messages': conversation.get('messages', []), 'version': conversation.get('version')}]
+
+    async def list_metadata(self, user_id: str) -> List[Dict[str, Any]]:
+        results = []
+        for c in self._conversations(user_id):
+            metadata = {key: value for key, value in c.items() if key != 'messages'}
+            metadata['messages'] = c['id']
+            metadata['message_count'] = sum(1 for m in c.get('messages', []) if m.get('role') != 'system')
+            results.append(metadata)
+        return results
+
+    async def list_folders(self, user_id: str) -> List[str]:
+        folders = []
+        for c in self._conversations(user_id):
+            if c.get('folder') not in folders:
+                folders.append(c.get('folder'))
+        return folders
+
+    async def list_for_search(self, user_id: str) -> List[Dict[str, Any]]:
+        fields = ['id', 'name', 'folder', 'updated_at', 'messages', 'partitionKey']
+        return [{key: c.get(key) for key in fields} for c in self._conversations(user_id)]
+
+    async def find_by_name(self, user_id: str, name: str, folder: str) -> List[Dict[str, Any]]:
+        return [{'id': c['id']} for c in self._conversations(user_id)
+                if c.get('name') == name and c.get('folder') == folder]
+
+    async def list_ids(self, user_id: str) -> List[str]:
+        return [c['id'] for c in self.container.partition(conversation_partition_key(user_id))]
+
+    async def iter_published(self, page_size: int = 20):
+        for conversation in self.container.all():
+            if conversation.get('type') == 'conversation' and conversation.get('published') is True:
+                yield conversation
+
+    async def change_pages(self, continuation: Optional[str] = None, max_item_count: int = 100):
+        changed = self.container.changed_since(int(continuation or 0))
+        if not changed:
+            yield [], continuation or "0"
+        for start in range(0, len(changed), max_item_count):
+            page = changed[start:start + max_item_count]
+            yield [document for _, document in page], str(page[-1][0])
+
+class MemoryPublicConversationRepository:
+    def __init__(self, container: MemoryContainer):
+        self.container = container
+
+    async def get(self, public_id: str) -> Optional[Dict[str, Any]]:
+        return self.container.get(public_conversation_partition_key(public_id), public_id)
+
+    async def upsert(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        return self.container.upsert(snapshot['partitionKey'], snapshot)
+
+    async def delete(self, public_id: str) -> None:
+        for item in (public_id, 'views'):
+            try:
+                self.container.delete(public_conversation_partition_key(public_id), item)
+            except exceptions.CosmosResourceNotFoundError:
+                pass
+
+    async def add_views(self, public_id: str, count: int) -> None:
+        partition_key = public_conversation_partition_key(public_id)
+        if self.container.get(partition_key, public_id) is None:
+            # Unpublished or deleted
+            return
+        views = self.container.get(partition_key, 'views') or {
+            'id': 'views', 'partitionKey': partition_key, 'type': 'public_conversation_views', 'views': 0
+        }
+        views['views'] += count
+        self.container.upsert(partition_key, views)
+
+class MemoryProjectionRepository:
+    def __init__(self, container: MemoryContainer):
+        self.container = container
+
+    def _save(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        if document.get('_etag'):
+            return _conditional(self.container.replace, document['partitionKey'], document, etag=document['_etag'])
+        return _conditional(self.container.create, document['partitionKey'], document)
+
+    async def list_entries(self, user_id: str) -> List[Dict[str, Any]]:
+        return [entry['metadata'] for entry in self.container.partition(projection_partition_key(user_id))
+                if entry.get('type') == 'conversation_entry']
+
+    async def get_entry(self, user_id: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        return self.container.get(projection_partition_key(user_id), f'entry-{conversation_id}')
+
+    async def save_entry(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        return self._save(entry)
+
+    async def delete_entry(self, user_id: str, conversation_id: str) -> None:
+        try:
+            self.container.delete(projection_partition_key(user_id), f'entry-{conversation_id}')
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+
+    async def upsert_search_entry(self, entry: Dict[str, Any]) -> None:
+        self.container.upsert(entry['partitionKey'], entry)
+
+    async def delete_search_entry(self, user_id: str, conversation_id: str) -> None:
+        try:
+            self.container.delete(projection_partition_key(user_id), f'search-{conversation_id}')
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+
+    async def search(self, user_id: str, term: str) -> List[Dict[str, Any]]:
+        term = term.lower()
+        results = []
+        for entry in self.container.partition(projection_partition_key(user_id)):
+            if entry.get('type') != 'search_entry':
+                continue
+            if (term in (entry.get('name') or '').lower() or term in (entry.get('folder') or '').lower()
+                    or any(term in content.lower() for content in entry.get('contents', []))):
+                results.append({'id': entry['conversation_id'], 'name': entry.get('name'), 'folder': entry.get('folder'),
+                                'updated_at': entry.get('updated_at'), 'message_count': entry.get('message_count'),
+                                'contents': entry.get('contents', [])})
+        return results
+
+    async def get_checkpoint(self, name: str) -> Optional[Dict[str, Any]]:
+        return self.container.get(ProjectionRepository.CHECKPOINT_PARTITION, name)
+
+    async def save_checkpoint(self, checkpoint: Dict[str, Any]) -> Dict[str, Any]:
+        return self._save(checkpoint)
+
+    async def clear(self) -> None:
+        for (partition_key, item_id), item in list(self.container.items.items()):
+            if item.get('type') in ('conversation_entry', 'search_entry', 'conversation_index'):
+                self.container.delete(partition_key, item_id)
+
+class MemoryModelRepository:
+    def __init__(self, container: MemoryContainer):
+        self.container = container
+
+    async def list(self, include_hidden: bool = False) -> List[Dict[str, Any]]:
+        models = [m for m in self.container.all() if m.get('type') == 'llm_model'
+                  and (include_hidden or m.get('show_in_prod') == 'Yes')]
+        models.sort(key=lambda m: (m.get('vendor', ''), m.get('label', '')))
+        return models
+
+class MemorySystemMessageRepository:
+    def __init__(self, container: MemoryContainer):
+        self.container = container
+
+    async def list_active(self) -> List[Dict[str, Any]]:
+        messages = [m for m in self.container.all() if m.get('isActive') is True]
+        messages.sort(key=lambda m: (m.get('category', ''), m.get('displayOrder', 0)))
+        return messages
+
+    async def list_categories(self) -> List[str]:
+        return sorted({m.get('category') for m in await self.list_active()})
+
+    async def list_by_category(self, category: str) -> List[Dict[str, Any]]:
+        return [m for m in await self.list_active() if m.get('category') == category]
+
+class MemoryRepository:
+    """Drop-in replacement for CosmosRepository that keeps all documents in process memory."""
+
+    def __init__(self):
+        self.containers = {name: MemoryContainer() for name in
+                           ("users", "conversations", "tokens", "models", "system messages", "projections")}
+        self.users = MemoryUserRepository(self.containers["users"])
+        self.conversations = MemoryConversationRepository(self.containers["conversations"])
+        self.public_conversations = MemoryPublicConversationRepository(self.containers["conversations"])
+        self.projections = MemoryProjectionRepository(self.containers["projections"])
+        self.tokens = MemoryTokenRepository(self.containers["tokens"])
+        self.models = MemoryModelRepository(self.containers["models"])
+        self.system_messages = MemorySystemMessageRepository(self.containers["system messages"])
+
+    async def connect(self):
+        return None
+
+    async def close(self):
+        return None
+
+    async def ping(self):
+        return None
+
+    def seed(self, container: str, items: List[Dict[str, Any]], partition_key_field: str = 'id'):
+        """Load fixture documents, e.g. the model catalog from utilities/models.py."""
+        for item in items:
+            self.containers[container].upsert(item.get(partition_key_field, item['id']), item)
+
+    def load_seed_file(self, path: str):
+        """Load a JSON file of the form {"container name": [documents]}; documents without a
+        partitionKey field are partitioned by id."""
+        with open(path) as f:
+            fixtures = json.load(f)
+        for container, items in fixtures.items():
+            self.seed(container, items, partition_key_field='partitionKey')
@@ -0,0 +1,147 @@
+#metrics.py
+#Prometheus metrics shared by main.py and the utilities modules.
+#With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR so /metrics aggregates all of them.
+
+import os, time
+from contextvars import ContextVar
+from prometheus_client import CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest, REGISTRY
+from typing import Optional
+
+RU_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+COSMOS_REQUEST_CHARGE = Histogram(
+    "cosmos_request_charge",
+    "Request units consumed by a single Cosmos DB call",
+    ["route", "container", "operation", "cross_partition"],
+    buckets=RU_BUCKETS
+)
+COSMOS_LATENCY = Histogram(
+    "cosmos_request_latency_seconds",
+    "Latency of a single Cosmos DB call",
+    ["route", "container", "operation", "cross_partition"],
+    buckets=LATENCY_BUCKETS
+)
+COSMOS_ITEMS = Counter(
+    "cosmos_items_returned_total",
+    "Documents returned by Cosmos DB calls",
+    ["route", "container", "operation"]
+)
+COSMOS_ROUTE_CHARGE = Histogram(
+    "cosmos_route_request_charge",
+    "Request units consumed by all Cosmos DB calls of one HTTP request",
+    ["route"],
+    buckets=RU_BUCKETS
+)
+
+LLM_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300)
+
+LLM_REQUESTS = Counter(
+    "llm_requests_total",
+    "Calls to LLM providers",
+    ["provider", "model", "outcome"]
+)
+LLM_LATENCY = Histogram(
+    "llm_request_latency_seconds",
+    "Total latency of an LLM provider call",
+    ["provider", "model"],
+    buckets=LLM_LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens reported in the usage of LLM responses",
+    ["provider", "model", "direction"]
+)
+LLM_COST = Counter(
+    "llm_cost_usd_total",
+    "Cost in USD implied by the model catalog prices",
+    ["provider", "model"]
+)
+
+def record_llm_call(result, cost: float):
+    LLM_REQUESTS.labels(result.provider, result.model, "success").inc()
+    LLM_LATENCY.labels(result.provider, result.model).observe(result.latency)
+    LLM_TOKENS.labels(result.provider, result.model, "input").inc(result.input_tokens)
+    LLM_TOKENS.labels(result.provider, result.model, "output").inc(result.output_tokens)
+    LLM_TOKENS.labels(result.provider, result.model, "cached_input").inc(result.cached_input_tokens)
+    LLM_COST.labels(result.provider, result.model).inc(cost)
+
+class CosmosUsage:
+    """Cosmos DB usage accumulated over one HTTP request."""
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope
+        self.calls = 0
+        self.request_charge = 0.0
+        self.duration = 0.0
+
+    @property
+    def route(self) -> str:
+        # The router stores the matched route in the scope before the endpoint runs
+        route = (self.scope or {}).get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+    def server_timing(self) -> str:
+        return f'cosmos;dur={self.duration * 1000:.1f};desc="{self.calls} calls, {self.request_charge:.2f} RU"'
+
+_request_usage: ContextVar[Optional[CosmosUsage]] = ContextVar("cosmos_request_usage", default=None)
+
+def start_request(scope: dict) -> CosmosUsage:
+    usage = CosmosUsage(scope)
+    _request_usage.set(usage)
+    return usage
+
+def finish_request(usage: CosmosUsage):
+    if usage.calls:
+        COSMOS_ROUTE_CHARGE.labels(usage.route).observe(usage.request_charge)
+
+class CosmosUsageMiddleware:
+    """Pure ASGI middleware that attributes Cosmos DB usage to the route of each request and,
+    if enabled, reports it in a Server-Timing header."""
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        usage = start_request(scope)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and self.server_timing and usage.calls:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", usage.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            finish_request(usage)
+
+def record_cosmos_call(container: str, operation: str, request_charge: float, started: float,
+                       item_count: int, cross_partition: bool):
+    duration = time.perf_counter() - started
+    usage = _request_usage.get()
+    route = usage.route if usage is not None else "background"
+    labels = (route, container, operation, str(cross_partition).lower())
+    COSMOS_REQUEST_CHARGE.labels(*labels).observe(request_charge)
+    COSMOS_LATENCY.labels(*labels).observe(duration)
+    if item_count:
+        COSMOS_ITEMS.labels(route, container, operation).inc(item_count)
+    if usage is not None:
+        usage.calls += 1
+        usage.request_charge += request_charge
+        usage.duration += duration
+
+def render_metrics():
+    """Return (body, content type) for the /metrics endpoint."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,261 @@
+#projections.py
+#Read models of the conversations, kept up to date from the change feed of the conversations container:
+#  - one index entry per conversation with its sidebar metadata, in the PROJ#{user_id} partition, so
+#    listing conversations and folders is a single-partition query over small documents; a single index
+#    document per user would grow with every conversation and make concurrent writes of the same user
+#    conflict with each other
+#  - one search entry per conversation holding only the text the search endpoint matches against
+#  - the public snapshot of published conversations (see PublicConversationRepository)
+#They live in their own "projections" container (partition key /partitionKey); written into the
+#conversations container they would show up in its change feed again.
+#
+#The handlers apply a write to the projections right away, so a user sees their own changes; the
+#change feed processor repairs whatever that missed and rebuilds the projections from scratch.
+#The change feed does not report deletes, so the handlers also remove deleted conversations.
+#
+#Settings: PROJECTIONS_ENABLED, PROJECTIONS_POLL_SECONDS, PROJECTIONS_LEASE_SECONDS
+#Rebuild with: python -m utilities.projections --rebuild (with the Cosmos DB settings of the app)
+
+import asyncio, logging, os, socket, time
+from prometheus_client import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from utilities.repository import ConcurrencyConflict, ProjectionRepository, projection_partition_key
+
+logger = logging.getLogger(__name__)
+
+PROJECTION_CHANGES = Counter(
+    "projection_changes_total",
+    "Conversation writes read from the change feed, by whether the projections had to be updated",
+    ["result"]
+)
+
+METADATA_FIELDS = ('id', 'partitionKey', 'user_id', 'name', 'folder', 'published', 'magiclink',
+                   'created_at', 'updated_at', 'type', 'version')
+
+def conversation_metadata(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    """The sidebar entry of a conversation, shaped like the rows of list_metadata."""
+    metadata = {key: conversation.get(key) for key in METADATA_FIELDS}
+    metadata['messages'] = conversation['id']
+    metadata['message_count'] = sum(1 for m in conversation.get('messages', []) if m.get('role') != 'system')
+    metadata['source_etag'] = conversation.get('_etag')
+    metadata['source_ts'] = conversation.get('_ts', 0)
+    return metadata
+
+def search_entry(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': f"search-{conversation['id']}",
+        'partitionKey': projection_partition_key(conversation['user_id']),
+        'type': 'search_entry',
+        'conversation_id': conversation['id'],
+        'name': conversation.get('name') or '',
+        'folder': conversation.get('folder') or '',
+        'updated_at': conversation.get('updated_at'),
+        'message_count': sum(1 for m in conversation.get('messages', []) if m.get('role') != 'system'),
+        'contents': [str(m.get('content', '')) for m in conversation.get('messages', [])]
+    }
+
+def index_entry(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': f"entry-{conversation['id']}",
+        'partitionKey': projection_partition_key(conversation['user_id']),
+        'type': 'conversation_entry',
+        'user_id': conversation['user_id'],
+        'conversation_id': conversation['id'],
+        'metadata': conversation_metadata(conversation)
+    }
+
+def index_conversations(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The metadata of the index entries, newest first like list_metadata."""
+    conversations = [dict(m) for m in entries]
+    for metadata in conversations:
+        metadata.pop('source_etag', None)
+        metadata.pop('source_ts', None)
+    conversations.sort(key=lambda m: m.get('created_at') or '', reverse=True)
+    return conversations
+
+def index_folders(entries: List[Dict[str, Any]]) -> List[str]:
+    """The distinct folders of the index entries, like list_folders."""
+    return list(dict.fromkeys(m.get('folder') for m in entries))
+
+class ConversationProjector:
+    def __init__(self, repository, public_snapshot: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+                 on_change: Optional[Callable[[str], Awaitable[None]]] = None, retries: int = 5):
+        self.repository = repository
+        self.public_snapshot = public_snapshot
+        self.on_change = on_change
+        self.retries = retries
+
+    @property
+    def projections(self):
+        # Looked up on use; the Cosmos DB repository creates its containers in the lifespan hook
+        return self.repository.projections
+
+    async def _update_entry(self, conversation: Dict[str, Any]) -> bool:
+        entry = index_entry(conversation)
+        metadata = entry['metadata']
+        for _ in range(self.retries):
+            current = await self.projections.get_entry(conversation['user_id'], conversation['id'])
+            if current is not None:
+                # The feed may deliver a version older than the one a handler has just applied
+                if (current['metadata'].get('source_etag') == metadata['source_etag']
+                        or current['metadata'].get('source_ts', 0) > metadata['source_ts']):
+                    return False
+                entry['_etag'] = current['_etag']
+            else:
+                entry.pop('_etag', None)
+            try:
+                await self.projections.save_entry(entry)
+                return True
+            except ConcurrencyConflict:
+                # Another worker applied a version of the same conversation; compare with that one
+                continue
+        raise ConcurrencyConflict(f"Index entry of conversation {conversation['id']} kept changing")
+
+    async def apply(self, conversation: Dict[str, Any], sync_snapshot: bool = True) -> bool:
+        """Bring the projections up to date with a written conversation; False if they already were."""
+        return await self.apply_many(conversation['user_id'], [conversation], sync_snapshot) > 0
+
+    async def apply_many(self, user_id: str, conversations: List[Dict[str, Any]], sync_snapshot: bool = True) -> int:
+        """apply for written conversations of one user; returns how many were applied."""
+        applied = 0
+        for conversation in conversations:
+            if not await self._update_entry(conversation):
+                continue
+            applied += 1
+            await self.projections.upsert_search_entry(search_entry(conversation))
+            if sync_snapshot and self.public_snapshot is not None and conversation.get('published'):
+                await self.public_snapshot(conversation)
+        if applied and self.on_change is not None:
+            await self.on_change(user_id)
+        return applied
+
+    async def remove(self, user_id: str, conversation_id: str):
+        await self.remove_many(user_id, [conversation_id])
+
+    async def remove_many(self, user_id: str, conversation_ids: List[str]):
+        for conversation_id in conversation_ids:
+            await self.projections.delete_entry(user_id, conversation_id)
+            await self.projections.delete_search_entry(user_id, conversation_id)
+
+class ChangeFeedProcessor:
+    """Feeds the conversation change feed to the projector, from a checkpoint kept in the projections container.
+
+    Every worker runs one, but only the holder of the lease on the checkpoint reads the feed;
+    the others take over when it stops renewing the lease.
+    """
+
+    def __init__(self, repository, projector: ConversationProjector, name: str = 'conversations',
+                 poll_interval: float = 1, lease_seconds: float = 30, batch_size: int = 100):
+        self.repository = repository
+        self.projector = projector
+        self.name = name
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.batch_size = batch_size
+        self._task = None
+
+    @property
+    def owner(self) -> str:
+        # Not fixed at construction: with gunicorn --preload the processor is created before the fork
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    async def _lease(self) -> Optional[Dict[str, Any]]:
+        """The checkpoint, if this process holds or could take its lease."""
+        checkpoint = await self.repository.projections.get_checkpoint(self.name) or {
+            'id': self.name,
+            'partitionKey': ProjectionRepository.CHECKPOINT_PARTITION,
+            'type': 'checkpoint',
+            'continuation': None
+        }
+        remaining = checkpoint.get('lease_until', 0) - time.time()
+        if checkpoint.get('owner') not in (None, self.owner) and remaining > 0:
+            return None
+        # Renewed once half of it has passed, not on every poll
+        if checkpoint.get('owner') == self.owner and remaining > self.lease_seconds / 2:
+            return checkpoint
+        return await self._save(checkpoint)
+
+    async def _save(self, checkpoint: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        checkpoint['owner'] = self.owner
+        checkpoint['lease_until'] = time.time() + self.lease_seconds
+        try:
+            return await self.repository.projections.save_checkpoint(checkpoint)
+        except ConcurrencyConflict:
+            # Another worker took the lease
+            return None
+
+    async def run_once(self) -> int:
+        """Apply the changes since the checkpoint; returns the number of conversations read."""
+        checkpoint = await self._lease()
+        if checkpoint is None:
+            return 0
+        count = 0
+        async for documents, continuation in self.repository.conversations.change_pages(
+                checkpoint.get('continuation'), self.batch_size):
+            for document in documents:
+                if document.get('type') != 'conversation':
+                    continue
+                count += 1
+                applied = await self.projector.apply(document)
+                PROJECTION_CHANGES.labels("applied" if applied else "current").inc()
+            if continuation == checkpoint.get('continuation'):
+                continue
+            checkpoint['continuation'] = continuation
+            checkpoint = await self._save(checkpoint)
+            if checkpoint is None:
+                break
+        return count
+
+    async def rebuild(self) -> int:
+        """Drop the projections and replay the change feed from the beginning."""
+        checkpoint = await self._lease()
+        if checkpoint is None:
+            raise RuntimeError(f"The change feed of {self.name} is being processed by another worker")
+        await self.repository.projections.clear()
+        checkpoint['continuation'] = None
+        if await self._save(checkpoint) is None:
+            raise RuntimeError(f"Lost the lease on the {self.name} change feed")
+        return await self.run_once()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error processing the {self.name} change feed: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+async def _rebuild():
+    from utilities.repository import create_repository
+    repository = create_repository()
+    await repository.connect()
+    try:
+        # Public snapshots are rendered by main.py and refreshed by its handlers; only the index and search entries are rebuilt
+        processor = ChangeFeedProcessor(repository, ConversationProjector(repository))
+        print(f"Replayed {await processor.rebuild()} conversations")
+    finally:
+        await repository.close()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true", help="drop the projections and replay the change feed from the beginning")
+    if parser.parse_args().rebuild:
+        asyncio.run(_rebuild())
+    else:
+        parser.print_help()
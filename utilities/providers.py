@@ -0,0 +1,224 @@
+#providers.py
+#Adapters that hide the differences between the LLM vendor SDKs used by the /chat endpoint.
+#Every adapter returns a ChatResult with the response text, token usage and timings.
+#
+#Prompt caching: long system prompts and conversation prefixes are sent in a stable order and,
+#for Claude, marked with cache_control breakpoints. Set PROMPT_CACHE_ENABLED=false to turn it off.
+
+import hashlib, os, time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+from utilities import metrics
+
+@dataclass
+class ChatResult:
+    text: str
+    provider: str
+    model: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_input_tokens: int = 0
+    latency: float = 0.0
+
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+# Providers only cache prefixes of roughly 1024 tokens or more, about 4 characters per token
+PROMPT_CACHE_MIN_CHARS = int(os.getenv("PROMPT_CACHE_MIN_CHARS", "4096"))
+
+def _prompt_chars(system_prompt: str, messages: List[Dict[str, Any]]) -> int:
+    return len(system_prompt or "") + sum(len(str(m.get("content", ""))) for m in messages)
+
+class ProviderAdapter:
+    provider = ""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def complete(self, model: str, messages: List[Dict[str, Any]], system_prompt: str,
+                       temperature: float, max_tokens: int) -> ChatResult:
+        started = time.perf_counter()
+        try:
+            result = await self._complete(model, list(messages), system_prompt, temperature, max_tokens)
+        except Exception:
+            metrics.LLM_REQUESTS.labels(self.provider, model, "error").inc()
+            raise
+        result.latency = time.perf_counter() - started
+        return result
+
+    async def _complete(self, model, messages, system_prompt, temperature, max_tokens) -> ChatResult:
+        raise NotImplementedError
+
+class OpenAIAdapter(ProviderAdapter):
+    """OpenAI and the OpenAI compatible APIs of DeepSeek and Llama."""
+
+    def __init__(self, provider: str, client):
+        super().__init__(client)
+        self.provider = provider
+
+    async def _complete(self, model, messages, system_prompt, temperature, max_tokens) -> ChatResult:
+        lowered = model.lower()
+        if "-mini" in lowered:
+            # o1-mini only support the value 1 in the temperature parameter, and max_token is max_completion_tokens
+            messages = messages[1:-1]  # o1 does not accept the system role, and the last message is duplicated
+            kwargs = {"temperature": 1, "max_completion_tokens": max_tokens}
+        elif "o1" in lowered:
+            # o1-preview does not support the temperature parameter, and max_token is max_completion_tokens
+            messages = messages[1:-1]
+            kwargs = {"max_completion_tokens": max_tokens}
+        else:
+            messages = messages[:-1]  # The last message is duplicated
+            kwargs = {"temperature": temperature, "max_tokens": max_tokens}
+
+        # OpenAI caches identical prefixes automatically; the cache key routes requests that share
+        # a system prompt to the same cache shard
+        if PROMPT_CACHE_ENABLED and self.provider == "openai" and messages and messages[0].get("role") == "system":
+            prefix = f"{model}\n{messages[0].get('content', '')}".encode("utf-8")
+            kwargs["extra_body"] = {"prompt_cache_key": hashlib.sha256(prefix).hexdigest()[:32]}
+
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            **kwargs
+        )
+        usage = response.usage
+        details = getattr(usage, "prompt_tokens_details", None)
+        # OpenAI reports cached tokens in prompt_tokens_details, DeepSeek as prompt_cache_hit_tokens
+        cached_tokens = getattr(details, "cached_tokens", 0) or getattr(usage, "prompt_cache_hit_tokens", 0) or 0
+        return ChatResult(
+            text=response.choices[0].message.content,
+            provider=self.provider,
+            model=model,
+            input_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            output_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            cached_input_tokens=cached_tokens
+        )
+
+class AnthropicAdapter(ProviderAdapter):
+    provider = "anthropic"
+
+    async def _complete(self, model, messages, system_prompt, temperature, max_tokens) -> ChatResult:
+        # Claude does not accept the system role, and the last message is duplicated
+        messages = messages[1:-1]
+        system = system_prompt
+        if PROMPT_CACHE_ENABLED:
+            system, messages = self._mark_cache_breakpoints(system_prompt, messages)
+        response = await self.client.messages.create(
+            model=model,
+            messages=messages,
+            system=system,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        usage = response.usage
+        cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        return ChatResult(
+            text=response.content[0].text,
+            provider=self.provider,
+            model=model,
+            # input_tokens only counts the tokens after the last cache breakpoint
+            input_tokens=(getattr(usage, "input_tokens", 0) or 0) + cache_read + cache_write,
+            output_tokens=getattr(usage, "output_tokens", 0) or 0,
+            cached_input_tokens=cache_read
+        )
+
+    @staticmethod
+    def _mark_cache_breakpoints(system_prompt: str, messages: List[Dict[str, Any]]):
+        """Put cache_control breakpoints after the system prompt and after the newest message.
+
+        The next turn sends the same prefix plus two messages, so it reads everything up to the
+        previous breakpoint from the cache.
+        """
+        system = system_prompt
+        if len(system_prompt or "") >= PROMPT_CACHE_MIN_CHARS:
+            system = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+        if messages and _prompt_chars(system_prompt, messages) >= PROMPT_CACHE_MIN_CHARS:
+            last = messages[-1]
+            messages = messages[:-1] + [{
+                "role": last["role"],
+                "content": [{"type": "text", "text": last["content"], "cache_control": {"type": "ephemeral"}}]
+            }]
+        return system, messages
+
+class GeminiAdapter(ProviderAdapter):
+    provider = "google"
+
+    async def _complete(self, model, messages, system_prompt, temperature, max_tokens) -> ChatResult:
+        # Format everything as a single prompt
+        prompt = ""
+
+        # Add system prompt if provided
+        if system_prompt and system_prompt.strip():
+            prompt += f"System: {system_prompt}\n\n"
+
+        # Add conversation history, skipping the newest user message.
+        # The system prompt and history come first so that consecutive turns share a cacheable prefix.
+        for msg in messages[:-1]:
+            role = "User" if msg["role"] == "user" else "Assistant"
+            prompt += f"{role}: {msg['content']}\n\n"
+
+        # Add the current query
+        prompt += f"User: {messages[-1]['content']}\n\nAssistant:"
+
+        response = await self.client.aio.models.generate_content(
+            model=model,
+            contents=prompt
+        )
+        usage = response.usage_metadata
+        return ChatResult(
+            text=response.text,
+            provider=self.provider,
+            model=model,
+            input_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+            output_tokens=getattr(usage, "candidates_token_count", 0) or 0,
+            cached_input_tokens=getattr(usage, "cached_content_token_count", 0) or 0
+        )
+
+def honours_temperature(model: str) -> bool:
+    """False for the o1 models, which OpenAIAdapter calls with temperature 1 or none at all."""
+    lowered = model.lower()
+    return select_provider(model) != "openai" or not ("-mini" in lowered or "o1" in lowered)
+
+def select_provider(model: str) -> Optional[str]:
+    """Map a model name to its provider, in the order the /chat endpoint has always checked them."""
+    lowered = model.lower()
+    if "gemini" in lowered:
+        return "google"
+    if "-mini" in lowered or "o1" in lowered or "gpt" in lowered:
+        return "openai"
+    if "deepseek" in lowered:
+        return "deepseek"
+    if "llama" in lowered:
+        return "llama"
+    if "claude" in lowered:
+        return "anthropic"
+    return None
+
+class ProviderRegistry:
+    """Adapters keyed by provider, built on first use.
+
+    The vendor SDKs are imported inside the factories, so a worker that never talks to Gemini
+    never pays for importing google.genai, and startup does not create any client at all.
+    """
+
+    def __init__(self, factories: Dict[str, Callable[[], ProviderAdapter]]):
+        self.factories = factories
+        self.adapters: Dict[str, ProviderAdapter] = {}
+
+    def __contains__(self, provider: str) -> bool:
+        return provider in self.factories
+
+    def __getitem__(self, provider: str) -> ProviderAdapter:
+        adapter = self.adapters.get(provider)
+        if adapter is None:
+            adapter = self.adapters[provider] = self.factories[provider]()
+        return adapter
+
+    def get(self, provider: str) -> Optional[ProviderAdapter]:
+        return self[provider] if provider in self else None
+
+    def loaded(self) -> List[str]:
+        return list(self.adapters)
+
+    def clear(self):
+        """Drop the adapters; the transport registry owns and closes their connection pools."""
+        self.adapters.clear()
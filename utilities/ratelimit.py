@@ -0,0 +1,253 @@
+#ratelimit.py
+#Admission control for the /chat endpoint.
+#Every request takes a slot from the token buckets and a concurrency slot of its user, and every model
+#it calls, the requested one or a fallback, takes a slot from the token buckets of the model and a
+#concurrency slot of its provider. Requests over a limit wait in FIFO order until
+#RATE_LIMIT_MAX_WAIT_SECONDS; after that they are rejected with 429 and a Retry-After header.
+#
+#Model limits come from the rpm_limit/tpm_limit fields of the model catalog. User limits:
+#  RATE_LIMIT_USER_RPM, RATE_LIMIT_USER_TPM, RATE_LIMIT_USER_CONCURRENCY
+#Provider concurrency: RATE_LIMIT_PROVIDER_CONCURRENCY (LLM_[PROVIDER_]POOL_SIZE by default)
+#
+#All limits are kept in the memory of each worker process, so with WEB_CONCURRENCY workers a user or
+#a model gets up to that many times the configured rate and concurrency. Set the values per worker.
+#The state of a user is dropped once they have been idle for RATE_LIMIT_USER_IDLE_SECONDS, by which
+#time their buckets have refilled.
+
+import asyncio, math, os, time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from prometheus_client import Gauge, Histogram
+from typing import Any, Callable, Dict, List, Optional
+
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "llm_admission_queue_depth",
+    "Requests waiting for a rate limit or concurrency slot",
+    ["scope"],
+    multiprocess_mode="livesum"
+)
+ADMISSION_WAIT = Histogram(
+    "llm_admission_wait_seconds",
+    "Time a request waited for admission",
+    ["scope", "outcome"],
+    buckets=WAIT_BUCKETS
+)
+
+class RateLimited(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded for {scope}, retry after {math.ceil(retry_after)} seconds")
+        self.scope = scope
+        self.retry_after = retry_after
+
+def estimate_tokens(system_prompt: str, messages: List[Dict[str, Any]], max_tokens: int) -> int:
+    """Upper bound used before the call: about 4 characters per prompt token, plus the whole output budget."""
+    chars = len(system_prompt or "") + sum(len(str(m.get("content", ""))) for m in messages)
+    return chars // 4 + int(max_tokens)
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available; a request larger than the bucket waits for a full bucket."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.refill_per_second)
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def refund(self, amount: float):
+        # A negative refund charges tokens the estimate missed; the bucket then starts in debt
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class Limit:
+    """Requests per minute and tokens per minute for one key, with a FIFO queue in front of them."""
+
+    def __init__(self, scope: str, rpm: Optional[float], tpm: Optional[float]):
+        self.scope = scope
+        self.requests = TokenBucket(rpm, rpm / 60) if rpm else None
+        self.tokens = TokenBucket(tpm, tpm / 60) if tpm else None
+        # asyncio.Lock wakes waiters in arrival order, which keeps the queue fair
+        self.queue = asyncio.Lock()
+
+    def wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    async def acquire(self, tokens: int, deadline: float):
+        async with self.queue:
+            while True:
+                wait = self.wait_time(tokens)
+                if wait <= 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    raise RateLimited(self.scope, wait)
+                await asyncio.sleep(wait)
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+
+    def release(self, tokens: int):
+        """Give back what acquire took, for a request that was not admitted after all."""
+        if self.requests:
+            self.requests.refund(1)
+        if self.tokens:
+            self.tokens.refund(tokens)
+
+    def settle(self, estimated: int, actual: int):
+        if self.tokens:
+            self.tokens.refund(estimated - actual)
+
+class UserState:
+    """Budget and concurrency slots of one user, and how many requests are using them."""
+
+    def __init__(self, rpm: float, tpm: float, concurrency: int):
+        self.limit = Limit("user", rpm, tpm)
+        self.slots = asyncio.Semaphore(concurrency)
+        self.active = 0
+        self.last_used = time.monotonic()
+
+class AdmissionController:
+    def __init__(self):
+        self.max_wait = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "30"))
+        self.user_rpm = float(os.getenv("RATE_LIMIT_USER_RPM", "30"))
+        self.user_tpm = float(os.getenv("RATE_LIMIT_USER_TPM", "200000"))
+        self.user_concurrency = int(os.getenv("RATE_LIMIT_USER_CONCURRENCY", "4"))
+        # Per-minute buckets are full again after a minute without requests
+        self.user_idle_ttl = float(os.getenv("RATE_LIMIT_USER_IDLE_SECONDS", "120"))
+        # Least recently used first
+        self.users: "OrderedDict[str, UserState]" = OrderedDict()
+        self.model_limits: Dict[str, Limit] = {}
+        self.provider_slots: Dict[str, asyncio.Semaphore] = {}
+
+    def _user(self, user: str) -> UserState:
+        now = time.monotonic()
+        for key, state in list(self.users.items()):
+            if now - state.last_used < self.user_idle_ttl:
+                break
+            if not state.active:
+                del self.users[key]
+        state = self.users.get(user)
+        if state is None:
+            state = self.users[user] = UserState(self.user_rpm, self.user_tpm, self.user_concurrency)
+        self.users.move_to_end(user)
+        state.last_used = now
+        return state
+
+    def _model_limit(self, model: str, model_doc: Optional[Dict[str, Any]]) -> Limit:
+        rpm = (model_doc or {}).get("rpm_limit")
+        tpm = (model_doc or {}).get("tpm_limit")
+        limit = self.model_limits.get(model)
+        # Rebuild the buckets when the catalog changes the limits
+        if limit is None or (limit.requests and limit.requests.capacity) != (rpm or None) \
+                or (limit.tokens and limit.tokens.capacity) != (tpm or None):
+            limit = self.model_limits[model] = Limit("model", rpm, tpm)
+        return limit
+
+    def _provider_slots(self, provider: str) -> asyncio.Semaphore:
+        if provider not in self.provider_slots:
+            default = os.getenv(f"LLM_{provider.upper()}_POOL_SIZE", os.getenv("LLM_POOL_SIZE", "20"))
+            size = int(os.getenv(f"RATE_LIMIT_{provider.upper()}_CONCURRENCY",
+                                 os.getenv("RATE_LIMIT_PROVIDER_CONCURRENCY", default)))
+            self.provider_slots[provider] = asyncio.Semaphore(size)
+        return self.provider_slots[provider]
+
+    async def _wait(self, scope: str, awaitable, deadline: float, release: Optional[Callable[[], None]] = None):
+        """Wait for awaitable until deadline.
+
+        If it still succeeds after the request gave up (timeout or cancellation), release undoes it.
+        asyncio.wait_for could drop such a result before Python 3.12 and leak a semaphore slot.
+        """
+        def undo(task):
+            if release is not None and not task.cancelled() and task.exception() is None:
+                release()
+
+        started = time.monotonic()
+        ADMISSION_QUEUE_DEPTH.labels(scope).inc()
+        task = asyncio.ensure_future(awaitable)
+        try:
+            done, _ = await asyncio.wait({task}, timeout=max(0.0, deadline - started))
+            if not done:
+                raise RateLimited(scope, self.max_wait)
+            task.result()
+        except BaseException as e:
+            if task.done():
+                undo(task)
+            else:
+                task.cancel()
+                task.add_done_callback(undo)
+            if isinstance(e, RateLimited):
+                ADMISSION_WAIT.labels(scope, "rejected").observe(time.monotonic() - started)
+            raise
+        finally:
+            ADMISSION_QUEUE_DEPTH.labels(scope).dec()
+        ADMISSION_WAIT.labels(scope, "admitted").observe(time.monotonic() - started)
+
+    @asynccontextmanager
+    async def admit_user(self, user: str, tokens: int):
+        """Wait for the budget and a concurrency slot of the user, then run the body.
+
+        Yields a dict; set "tokens" to the tokens the request actually used so the buckets are corrected.
+        """
+        deadline = time.monotonic() + self.max_wait
+        state = self._user(user)
+        state.active += 1
+        try:
+            await self._wait("user", state.limit.acquire(tokens, deadline), deadline, lambda: state.limit.release(tokens))
+            try:
+                await self._wait("user_concurrency", state.slots.acquire(), deadline, state.slots.release)
+            except BaseException:
+                # Rejected or cancelled while waiting for a slot: the budget taken above is not spent
+                state.limit.release(tokens)
+                raise
+            usage = {"tokens": tokens}
+            try:
+                yield usage
+            finally:
+                state.slots.release()
+                state.limit.settle(tokens, usage["tokens"])
+        finally:
+            state.active -= 1
+            state.last_used = time.monotonic()
+            if self.users.get(user) is state:
+                self.users.move_to_end(user)
+
+    @asynccontextmanager
+    async def admit_model(self, provider: str, model: str, model_doc: Optional[Dict[str, Any]], tokens: int):
+        """Wait for the budget of the model and a concurrency slot of its provider, then run the body.
+
+        Yields a dict like admit_user.
+        """
+        deadline = time.monotonic() + self.max_wait
+        model_limit = self._model_limit(model, model_doc)
+        await self._wait("model", model_limit.acquire(tokens, deadline), deadline, lambda: model_limit.release(tokens))
+        provider_slots = self._provider_slots(provider)
+        try:
+            await self._wait("provider_concurrency", provider_slots.acquire(), deadline, provider_slots.release)
+        except BaseException:
+            model_limit.release(tokens)
+            raise
+        usage = {"tokens": tokens}
+        try:
+            yield usage
+        finally:
+            provider_slots.release()
+            model_limit.settle(tokens, usage["tokens"])
@@ -0,0 +1,619 @@
+#repository.py
+#Async data-access layer for the Cosmos DB containers used by main.py.
+#One CosmosRepository is created per worker and connected in the FastAPI lifespan hook,
+#so every request shares the same aiohttp connection pool.
+
+import os, re, time
+import aiohttp
+from azure.core import MatchConditions
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.cosmos import exceptions
+from azure.cosmos.aio import CosmosClient
+from typing import Any, Dict, List, Optional
+from utilities.metrics import record_cosmos_call
+
+DATABASE_NAME = "chat_app"
+
+# Cosmos DB system properties that should not be exposed to the client
+SYSTEM_PROPERTIES = ['_rid', '_self', '_etag', '_attachments', '_ts']
+
+class ConcurrencyConflict(Exception):
+    """A conditional write lost against a concurrent one (HTTP 412 from Cosmos DB)."""
+
+class BatchOperationFailed(Exception):
+    """An operation of a transactional batch failed, so none of the batch was applied."""
+
+    def __init__(self, index: int, status_code: int, message: str = ""):
+        super().__init__(message or f"Operation {index} of the batch failed with {status_code}")
+        self.index = index
+        self.status_code = status_code
+
+def _request_charge(headers) -> float:
+    try:
+        return float((headers or {}).get('x-ms-request-charge', 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+class InstrumentedContainer:
+    """Wraps an async ContainerProxy and records RU charge, latency and item counts of every call."""
+
+    def __init__(self, container, name: str):
+        self.container = container
+        self.name = name
+
+    async def _point(self, operation: str, method, **kwargs):
+        captured = {}
+        started = time.perf_counter()
+        try:
+            return await method(response_hook=lambda headers, _: captured.update(headers or {}), **kwargs)
+        finally:
+            record_cosmos_call(self.name, operation, _request_charge(captured), started,
+                               1 if operation == "read" else 0, False)
+
+    async def _paged(self, operation: str, method, cross_partition: bool, **kwargs):
+        # The SDK calls the hook with the headers of every page it fetches, also of each partition of
+        # a fan-out query; the client's last_response_headers belong to whichever request finished last
+        charges = []
+        started = time.perf_counter()
+        item_count = 0
+        try:
+            pager = method(response_hook=lambda headers, _: charges.append(_request_charge(headers)), **kwargs)
+            async for page in pager.by_page():
+                items = [item async for item in page]
+                item_count += len(items)
+                for item in items:
+                    yield item
+        finally:
+            record_cosmos_call(self.name, operation, sum(charges), started, item_count, cross_partition)
+
+    def query_items(self, query: str, **kwargs):
+        cross_partition = kwargs.get("partition_key") is None
+        return self._paged("query", self.container.query_items, cross_partition, query=query, **kwargs)
+
+    async def change_feed_pages(self, continuation: Optional[str] = None, **kwargs):
+        """Pages of the change feed as (items, continuation token to resume after them)."""
+        charges = []
+        started = time.perf_counter()
+        item_count = 0
+        try:
+            pager = self.container.query_items_change_feed(
+                response_hook=lambda headers, _: charges.append(_request_charge(headers)), **kwargs)
+            pages = pager.by_page(continuation)
+            async for page in pages:
+                items = [item async for item in page]
+                item_count += len(items)
+                # The token of the whole feed, covering every partition key range. The etag header the
+                # hook sees is the LSN of the one range the page came from, before the SDK replaces it.
+                yield items, pages.continuation_token
+        finally:
+            record_cosmos_call(self.name, "change_feed", sum(charges), started, item_count, True)
+
+    def read_all_items(self, **kwargs):
+        return self._paged("read_all", self.container.read_all_items, True, **kwargs)
+
+    async def read_item(self, **kwargs):
+        return await self._point("read", self.container.read_item, **kwargs)
+
+    async def create_item(self, **kwargs):
+        return await self._point("create", self.container.create_item, **kwargs)
+
+    async def replace_item(self, **kwargs):
+        return await self._point("replace", self.container.replace_item, **kwargs)
+
+    async def upsert_item(self, **kwargs):
+        return await self._point("upsert", self.container.upsert_item, **kwargs)
+
+    async def patch_item(self, **kwargs):
+        return await self._point("patch", self.container.patch_item, **kwargs)
+
+    async def delete_item(self, **kwargs):
+        return await self._point("delete", self.container.delete_item, **kwargs)
+
+    async def execute_item_batch(self, **kwargs):
+        return await self._point("batch", self.container.execute_item_batch, **kwargs)
+
+def user_partition_key(user_id: str) -> str:
+    return f'USER#{user_id}'
+
+def conversation_partition_key(user_id: str) -> str:
+    return f'CHAT#{user_id}'
+
+def public_conversation_partition_key(public_id: str) -> str:
+    return f'PUBLIC#{public_id}'
+
+def projection_partition_key(user_id: str) -> str:
+    return f'PROJ#{user_id}'
+
+async def _conditional(write, etag: Optional[str], **kwargs):
+    # Optimistic concurrency: the write only succeeds if the document still has this _etag
+    if etag is not None:
+        kwargs.update(etag=etag, match_condition=MatchConditions.IfNotModified)
+    try:
+        return await write(**kwargs)
+    except (exceptions.CosmosAccessConditionFailedError, exceptions.CosmosResourceExistsError) as e:
+        raise ConcurrencyConflict(str(e))
+
+# Versions are generated by main.py as hex strings; conversations written before they existed are version "0"
+VERSION_PATTERN = re.compile(r'[0-9a-f]{1,32}')
+
+def _version_predicate(version: str) -> str:
+    # Patch preconditions are SQL filters without parameters, so only well-formed versions are inlined
+    if version == '0':
+        return "FROM c WHERE NOT IS_DEFINED(c.version)"
+    if not VERSION_PATTERN.fullmatch(version):
+        raise ConcurrencyConflict(f"Malformed version {version!r}")
+    return f"FROM c WHERE c.version = '{version}'"
+
+def _set_operations(fields: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"op": "set", "path": f"/{key}", "value": value} for key, value in fields.items()]
+
+async def _query(container, query: str, parameters: Optional[List[Dict[str, Any]]] = None,
+                 partition_key: Optional[str] = None) -> List[Dict[str, Any]]:
+    # Without a partition key the async SDK fans the query out over all partitions
+    kwargs = {"parameters": parameters or []}
+    if partition_key is not None:
+        kwargs["partition_key"] = partition_key
+    return [item async for item in container.query_items(query=query, **kwargs)]
+
+class UserRepository:
+    def __init__(self, container):
+        self.container = container
+
+    async def get_by_email(self, email: str, user_only: bool = False) -> Optional[Dict[str, Any]]:
+        query = "SELECT * FROM c WHERE c.email = @email"
+        if user_only:
+            query += " AND c.type = 'user'"
+        users = await _query(self.container, query, [{"name": "@email", "value": email}])
+        return users[0] if users else None
+
+    async def create(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.container.create_item(body=user)
+
+    async def replace(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.container.replace_item(item=user["id"], body=user)
+
+    async def delete(self, user: Dict[str, Any]) -> None:
+        await self.container.delete_item(item=user["id"], partition_key=user_partition_key(user["id"]))
+
+    async def count(self) -> int:
+        result = await _query(self.container, "SELECT VALUE COUNT(1) FROM c")
+        return result[0] if result else 0
+
+    async def ping(self) -> None:
+        # Reading a single item is enough to validate connectivity
+        await _query(self.container, "SELECT TOP 1 c.id FROM c")
+
+class TokenRepository:
+    # Tokens are partitioned by their own id, so lookups are point reads
+    def __init__(self, container):
+        self.container = container
+
+    async def get(self, token: str, token_type: str) -> Optional[Dict[str, Any]]:
+        try:
+            token_doc = await self.container.read_item(item=token, partition_key=token)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+        if token_doc.get("type") != token_type:
+            return None
+        return token_doc
+
+    async def create(self, token_doc: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.container.create_item(body=token_doc)
+
+    async def delete(self, token: str) -> None:
+        await self.container.delete_item(item=token, partition_key=token)
+
+    async def list_expired(self, current_time: str) -> List[Dict[str, Any]]:
+        query = "SELECT * FROM c WHERE c.expires_at < @current_time"
+        return await _query(self.container, query, [{"name": "@current_time", "value": current_time}])
+
+class ConversationRepository:
+    # All conversations of a user live in the CHAT#{user_id} partition
+    # Cosmos DB limit on the operations of a transactional batch
+    MAX_BATCH_OPERATIONS = 100
+
+    def __init__(self, container):
+        self.container = container
+
+    async def create(self, conversation: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.container.create_item(body=conversation)
+
+    async def get(self, user_id: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return await self.container.read_item(
+                item=conversation_id,
+                partition_key=conversation_partition_key(user_id)
+            )
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+    async def replace(self, conversation: Dict[str, Any], etag: Optional[str] = None) -> Dict[str, Any]:
+        """Replace a conversation; with an etag only if it is still the stored version."""
+        return await _conditional(self.container.replace_item, etag, item=conversation["id"], body=conversation)
+
+    async def patch(self, user_id: str, conversation_id: str, fields: Dict[str, Any],
+                    version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Set fields of a conversation without reading or rewriting the rest of it.
+
+        With a version, only if that is still the stored one. Returns the patched conversation,
+        or None if there is none.
+        """
+        kwargs = {}
+        if version is not None:
+            kwargs["filter_predicate"] = _version_predicate(version)
+        try:
+            return await _conditional(self.container.patch_item, None, item=conversation_id,
+                                      partition_key=conversation_partition_key(user_id),
+                                      patch_operations=_set_operations(fields), **kwargs)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+    async def delete(self, user_id: str, conversation_id: str) -> None:
+        await self.container.delete_item(
+            item=conversation_id,
+            partition_key=conversation_partition_key(user_id)
+        )
+
+    async def get_publication(self, user_id: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        results = await self.get_publications(user_id, [conversation_id])
+        return results[0] if results else None
+
+    async def get_publications(self, user_id: str, conversation_ids: List[str]) -> List[Dict[str, Any]]:
+        # Only the fields publishing depends on, without the messages a point read would return
+        query = """
+        SELECT c.id, c.published, c.public_id, c.version
+        FROM c
+        WHERE c.type = 'conversation'
+        AND ARRAY_CONTAINS(@ids, c.id)
+        """
+        return await _query(self.container, query, [{"name": "@ids", "value": conversation_ids}],
+                            partition_key=conversation_partition_key(user_id))
+
+    async def get_many(self, user_id: str, conversation_ids: List[str]) -> List[Dict[str, Any]]:
+        query = """
+        SELECT *
+        FROM c
+        WHERE c.type = 'conversation'
+        AND ARRAY_CONTAINS(@ids, c.id)
+        """
+        return await _query(self.container, query, [{"name": "@ids", "value": conversation_ids}],
+                            partition_key=conversation_partition_key(user_id))
+
+    async def iter_all(self, user_id: str, page_size: int = 20):
+        """Every conversation of a user, fetched page_size at a time, so only one page is held in memory."""
+        query = "SELECT * FROM c WHERE c.type = 'conversation'"
+        async for item in self.container.query_items(query=query, partition_key=conversation_partition_key(user_id),
+                                                     max_item_count=page_size):
+            yield item
+
+    async def _batch(self, user_id: str, operations: List[tuple]) -> List[Dict[str, Any]]:
+        try:
+            results = await self.container.execute_item_batch(
+                batch_operations=operations,
+                partition_key=conversation_partition_key(user_id)
+            )
+        except exceptions.CosmosBatchOperationError as e:
+            # The failed operation has its own status; the others are reported as 424 Failed Dependency
+            raise BatchOperationFailed(e.error_index, e.operation_responses[e.error_index].get("statusCode"), str(e))
+        return [result.get("resourceBody") for result in results]
+
+    async def create_many(self, user_id: str, conversations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Create conversations in one transactional batch: all of them, or none if one fails (409 if it exists)."""
+        return await self._batch(user_id, [("create", (conversation,)) for conversation in conversations])
+
+    async def patch_many(self, user_id: str, changes: List[tuple]) -> List[Dict[str, Any]]:
+        """Patch conversations in one transactional batch: all of them, or none if one fails.
+
+        changes are (conversation id, fields, version or None) as for patch; at most
+        MAX_BATCH_OPERATIONS of them. Returns the patched conversations in the same order.
+        """
+        operations = []
+        for conversation_id, fields, version in changes:
+            options = {"filter_predicate": _version_predicate(version)} if version is not None else {}
+            operations.append(("patch", (conversation_id, _set_operations(fields)), options))
+        return await self._batch(user_id, operations)
+
+    async def delete_many(self, user_id: str, conversation_ids: List[str]) -> None:
+        """Delete conversations in one transactional batch: all of them, or none if one fails."""
+        await self._batch(user_id, [("delete", (conversation_id,)) for conversation_id in conversation_ids])
+
+    async def get_messages(self, user_id: str, conversation_id: str) -> List[Dict[str, Any]]:
+        query = """
+        SELECT c.messages, c.version
+        FROM c
+        WHERE c.type = 'conversation'
+        AND c.id = @id
+        """
+        return await _query(self.container, query, [{"name": "@id", "value": conversation_id}],
+                            partition_key=conversation_partition_key(user_id))
+
+    async def list_metadata(self, user_id: str) -> List[Dict[str, Any]]:
+        query = """
+        SELECT
+         c.id, c.partitionKey, c.user_id, c.name, c.folder, c.published, c.magiclink,
+         c.created_at, c.updated_at, c.type, c.version,
+         c.id as messages, c._rid, c._self, c._etag, c._attachments, c._ts, ARRAY_LENGTH(
+        ARRAY(
+            SELECT VALUE m
+            FROM m IN c.messages
+            WHERE m.role != 'system'
+        )
+    ) as message_count
+        FROM c
+        WHERE c.type = 'conversation'
+        ORDER BY c.created_at DESC
+        """
+        return await _query(self.container, query, partition_key=conversation_partition_key(user_id))
+
+    async def list_folders(self, user_id: str) -> List[str]:
+        query = """
+        SELECT DISTINCT VALUE c.folder
+        FROM c
+        WHERE c.type = 'conversation'
+        """
+        return await _query(self.container, query, partition_key=conversation_partition_key(user_id))
+
+    async def list_for_search(self, user_id: str) -> List[Dict[str, Any]]:
+        query = """
+        SELECT c.id, c.name, c.folder, c.updated_at, c.messages, c.partitionKey
+        FROM c
+        WHERE c.type = 'conversation'
+        """
+        return await _query(self.container, query, partition_key=conversation_partition_key(user_id))
+
+    async def find_by_name(self, user_id: str, name: str, folder: str) -> List[Dict[str, Any]]:
+        query = """
+        SELECT c.id
+        FROM c
+        WHERE c.type = 'conversation'
+        AND c.name = @name
+        AND c.folder = @folder
+        """
+        parameters = [
+            {"name": "@name", "value": name},
+            {"name": "@folder", "value": folder}
+        ]
+        return await _query(self.container, query, parameters,
+                            partition_key=conversation_partition_key(user_id))
+
+    async def list_ids(self, user_id: str) -> List[str]:
+        query = "SELECT VALUE c.id FROM c"
+        return await _query(self.container, query, partition_key=conversation_partition_key(user_id))
+
+    async def iter_published(self, page_size: int = 20):
+        """Every published conversation of every user, page_size at a time; a cross-partition query."""
+        query = "SELECT * FROM c WHERE c.type = 'conversation' and c.published = true"
+        async for item in self.container.query_items(query=query, max_item_count=page_size):
+            yield item
+
+    async def change_pages(self, continuation: Optional[str] = None, max_item_count: int = 100):
+        """The change feed from continuation, or from the beginning without one.
+
+        Yields (documents, continuation) per page. The feed holds the latest version of every
+        created or replaced document, in order within a partition; deletes are not reported.
+        """
+        kwargs = {"max_item_count": max_item_count}
+        if not continuation:
+            kwargs["start_time"] = "Beginning"
+        async for items, token in self.container.change_feed_pages(continuation, **kwargs):
+            yield items, token
+
+class PublicConversationRepository:
+    # Snapshots of published conversations, each in its own PUBLIC#{id} partition of the
+    # conversations container, so public pages are served by point reads outside the user partitions.
+    # The id is the magic link; the snapshot records the partition key and id of the conversation.
+    VIEWS_ID = 'views'
+
+    def __init__(self, container):
+        self.container = container
+
+    async def get(self, public_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return await self.container.read_item(
+                item=public_id,
+                partition_key=public_conversation_partition_key(public_id)
+            )
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+    async def upsert(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.container.upsert_item(body=snapshot)
+
+    async def delete(self, public_id: str) -> None:
+        for item in (public_id, self.VIEWS_ID):
+            try:
+                await self.container.delete_item(
+                    item=item,
+                    partition_key=public_conversation_partition_key(public_id)
+                )
+            except exceptions.CosmosResourceNotFoundError:
+                pass
+
+    async def add_views(self, public_id: str, count: int) -> None:
+        # Kept in a separate document so that refreshing the snapshot does not reset the count
+        partition_key = public_conversation_partition_key(public_id)
+        increment = [{"op": "incr", "path": "/views", "value": count}]
+        try:
+            await self.container.patch_item(item=self.VIEWS_ID, partition_key=partition_key,
+                                            patch_operations=increment)
+        except exceptions.CosmosResourceNotFoundError:
+            # The first views of the page. The read fails the batch if the snapshot was deleted, so a
+            # late flush does not leave a view count behind a page that was unpublished or deleted.
+            views = {'id': self.VIEWS_ID, 'partitionKey': partition_key, 'type': 'public_conversation_views', 'views': count}
+            try:
+                await self.container.execute_item_batch(
+                    batch_operations=[("read", (public_id,)), ("create", (views,))],
+                    partition_key=partition_key
+                )
+            except exceptions.CosmosBatchOperationError as e:
+                if e.error_index == 0:
+                    return
+                if e.operation_responses[e.error_index].get("statusCode") != 409:
+                    raise
+                await self.container.patch_item(item=self.VIEWS_ID, partition_key=partition_key,
+                                                patch_operations=increment)
+
+class ProjectionRepository:
+    # Read models maintained by utilities/projections.py, in the "projections" container:
+    # an index entry and a search entry per conversation in the PROJ#{user_id} partition,
+    # and the change feed checkpoints in the CHECKPOINT partition.
+    CHECKPOINT_PARTITION = 'CHECKPOINT'
+
+    def __init__(self, container):
+        self.container = container
+
+    async def _read(self, item: str, partition_key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return await self.container.read_item(item=item, partition_key=partition_key)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+    async def _save(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        # Documents read before carry an _etag and are replaced only if unchanged; new ones are created
+        if document.get('_etag'):
+            return await _conditional(self.container.replace_item, document['_etag'], item=document['id'], body=document)
+        return await _conditional(self.container.create_item, None, body=document)
+
+    async def list_entries(self, user_id: str) -> List[Dict[str, Any]]:
+        """The metadata of every conversation in the index of a user."""
+        query = "SELECT VALUE c.metadata FROM c WHERE c.type = 'conversation_entry'"
+        return await _query(self.container, query, partition_key=projection_partition_key(user_id))
+
+    async def get_entry(self, user_id: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        return await self._read(f'entry-{conversation_id}', projection_partition_key(user_id))
+
+    async def save_entry(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._save(entry)
+
+    async def delete_entry(self, user_id: str, conversation_id: str) -> None:
+        try:
+            await self.container.delete_item(item=f'entry-{conversation_id}',
+                                             partition_key=projection_partition_key(user_id))
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+
+    async def upsert_search_entry(self, entry: Dict[str, Any]) -> None:
+        await self.container.upsert_item(body=entry)
+
+    async def delete_search_entry(self, user_id: str, conversation_id: str) -> None:
+        try:
+            await self.container.delete_item(item=f'search-{conversation_id}',
+                                             partition_key=projection_partition_key(user_id))
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+
+    async def search(self, user_id: str, term: str) -> List[Dict[str, Any]]:
+        query = """
+        SELECT c.conversation_id AS id, c.name, c.folder, c.updated_at, c.message_count, c.contents
+        FROM c
+        WHERE c.type = 'search_entry'
+        AND (CONTAINS(c.name, @term, true)
+            OR CONTAINS(c.folder, @term, true)
+            OR EXISTS(SELECT VALUE m FROM m IN c.contents WHERE CONTAINS(m, @term, true)))
+        """
+        return await _query(self.container, query, [{"name": "@term", "value": term}],
+                            partition_key=projection_partition_key(user_id))
+
+    async def get_checkpoint(self, name: str) -> Optional[Dict[str, Any]]:
+        return await self._read(name, self.CHECKPOINT_PARTITION)
+
+    async def save_checkpoint(self, checkpoint: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._save(checkpoint)
+
+    async def clear(self) -> None:
+        """Delete every index and search entry, before a rebuild from the start of the feed."""
+        # conversation_index: the single index document per user of earlier versions
+        query = ("SELECT c.id, c.partitionKey FROM c "
+                 "WHERE c.type IN ('conversation_entry', 'search_entry', 'conversation_index')")
+        for item in await _query(self.container, query):
+            try:
+                await self.container.delete_item(item=item['id'], partition_key=item['partitionKey'])
+            except exceptions.CosmosResourceNotFoundError:
+                pass
+
+class ModelRepository:
+    def __init__(self, container):
+        self.container = container
+
+    async def list(self, include_hidden: bool = False) -> List[Dict[str, Any]]:
+        if include_hidden:
+            query = "SELECT * FROM c WHERE c.type = 'llm_model' order by c.vendor, c.label"
+        else:
+            query = "SELECT * FROM c WHERE c.type = 'llm_model' AND c.show_in_prod = 'Yes' order by c.vendor, c.label"
+        return await _query(self.container, query)
+
+class SystemMessageRepository:
+    def __init__(self, container):
+        self.container = container
+
+    async def list_active(self) -> List[Dict[str, Any]]:
+        query = "SELECT * FROM c WHERE c.isActive = true ORDER BY c.category, c.displayOrder"
+        return await _query(self.container, query)
+
+    async def list_categories(self) -> List[str]:
+        query = "SELECT DISTINCT c.category FROM c WHERE c.isActive = true ORDER BY c.category"
+        return [item['category'] for item in await _query(self.container, query)]
+
+    async def list_by_category(self, category: str) -> List[Dict[str, Any]]:
+        query = "SELECT * FROM c WHERE c.isActive = true AND c.category = @category ORDER BY c.displayOrder"
+        return await _query(self.container, query, [{"name": "@category", "value": category}])
+
+class CosmosRepository:
+    """Owns the async CosmosClient and exposes one typed repository per container."""
+
+    def __init__(self, connection_string: str, pool_size: int = 100, keepalive_timeout: float = 30):
+        self.connection_string = connection_string
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+        self._client = None
+        self.users = self.conversations = self.tokens = self.models = self.system_messages = None
+        self.public_conversations = self.projections = None
+
+    async def connect(self):
+        # A single aiohttp session keeps connections to the Cosmos gateway alive between requests
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+            limit=self.pool_size,
+            keepalive_timeout=self.keepalive_timeout
+        ))
+        self._client = CosmosClient.from_connection_string(
+            self.connection_string,
+            transport=AioHttpTransport(session=self._session, session_owner=False)
+        )
+        await self._client.__aenter__()
+        database = self._client.get_database_client(DATABASE_NAME)
+        container = lambda name: InstrumentedContainer(database.get_container_client(name), name)
+        self.users = UserRepository(container("users"))
+        self.conversations = ConversationRepository(container("conversations"))
+        self.public_conversations = PublicConversationRepository(container("conversations"))
+        self.projections = ProjectionRepository(container("projections"))
+        self.tokens = TokenRepository(container("tokens"))
+        self.models = ModelRepository(container("models"))
+        self.system_messages = SystemMessageRepository(container("system messages"))
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def ping(self):
+        await self.users.ping()
+
+def create_repository():
+    """Build the repository selected by REPOSITORY_BACKEND ("cosmos" or "memory")."""
+    backend = os.getenv("REPOSITORY_BACKEND", "cosmos").lower()
+    if backend == "memory":
+        from utilities.memoryrepository import MemoryRepository
+        repository = MemoryRepository()
+        # Fixture documents, e.g. the ones written by benchmarks/seed.py
+        if os.getenv("REPOSITORY_SEED_FILE"):
+            repository.load_seed_file(os.getenv("REPOSITORY_SEED_FILE"))
+        return repository
+    return CosmosRepository(
+        os.getenv("COSMOS_CONNECTION_STRING"),
+        pool_size=int(os.getenv("COSMOS_POOL_SIZE", "100")),
+        keepalive_timeout=float(os.getenv("COSMOS_KEEPALIVE_TIMEOUT", "30"))
+    )
@@ -0,0 +1,79 @@
+#responsecache.py
+#Exact-match cache for /chat responses.
+#Only used for deterministic requests (temperature 0, on a model that honours it) or when the client
+#opts in, so a resent prompt is answered from memory instead of costing a full provider call. Answers
+#of a fallback model are not stored.
+
+import hashlib, json, time
+from collections import OrderedDict
+from prometheus_client import Counter
+from typing import Any, Dict, List, Optional
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    "llm_response_cache_requests_total",
+    "Lookups in the /chat response cache",
+    ["result"]
+)
+
+class MemoryCacheStore:
+    """In-process store with LRU eviction, per-entry TTL and a bound on entries and bytes."""
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: float):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, value, size)
+        self.size += size
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    async def delete(self, key: str):
+        if key in self._entries:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self.size -= size
+
+class ResponseCache:
+    def __init__(self, store, ttl: float = 3600):
+        self.store = store
+        self.ttl = ttl
+
+    @staticmethod
+    def key(model: str, system_prompt: str, messages: List[Dict[str, Any]],
+            temperature: float, max_tokens: int) -> str:
+        # Only role and content matter; whitespace differences from the textarea are ignored
+        normalized = [{"role": m.get("role"), "content": str(m.get("content", "")).strip()} for m in messages]
+        material = json.dumps(
+            [model, (system_prompt or "").strip(), normalized, float(temperature), int(max_tokens)],
+            sort_keys=True, separators=(",", ":"), ensure_ascii=False
+        )
+        return "chat:" + hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = await self.store.get(key)
+        RESPONSE_CACHE_REQUESTS.labels("hit" if value is not None else "miss").inc()
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, response: Dict[str, Any]):
+        await self.store.set(key, json.dumps(response), self.ttl)
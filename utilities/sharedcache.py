@@ -0,0 +1,331 @@
+#sharedcache.py
+#Two-level cache for the lookups every worker repeats: users, the model catalog, the system message
+#library and the conversation lists. L1 is a small in-process MemoryCacheStore per worker, L2 is
+#shared by all workers. Writers invalidate a key in both levels and publish it, so the other
+#workers drop their L1 copy instead of serving it until it expires.
+#
+#Every key has a generation in L2 that an invalidation increments. A value is written back with the
+#generation read before it was loaded and is only served while that is still the current one, so a
+#load that overlaps an invalidation (in this worker or another one) cannot put its stale result back.
+#
+#Without an L2 nothing would tell the other workers about a write, so CACHE_BACKEND=memory caches
+#nothing and every lookup goes to the loader.
+#
+#Settings:
+#  CACHE_BACKEND         memory (no caching, the default), redis or sqlite
+#  CACHE_REDIS_URL       any server speaking the Redis protocol (needs the redis package)
+#  CACHE_SQLITE_PATH     database file shared by the workers of a single host
+#  CACHE_TTL_SECONDS, CACHE_L1_TTL_SECONDS, CACHE_L1_MAX_ENTRIES
+#A local stand-in for Redis is in benchmarks/fake_redis.py.
+#Keys can be invalidated from outside the app with: python -m utilities.sharedcache KEY...
+
+import asyncio, json, logging, os, sqlite3, threading, time
+import orjson
+from prometheus_client import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from utilities.responsecache import MemoryCacheStore
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_REQUESTS = Counter(
+    "shared_cache_requests_total",
+    "Lookups in the two-level cache by key prefix and the level that answered them",
+    ["cache", "result"]
+)
+
+INVALIDATION_CHANNEL = "cache-invalidation"
+GENERATION_PREFIX = "generation:"
+# Seconds a generation is kept after its last invalidation; longer than any CACHE_TTL_SECONDS
+GENERATION_RETENTION = 24 * 3600
+
+class RedisCacheStore:
+    """L2 on a Redis protocol server; invalidations travel over pub/sub."""
+
+    def __init__(self, url: str, channel: str = INVALIDATION_CHANNEL):
+        self.url = url
+        self.channel = channel
+        self.client = None
+
+    async def start(self):
+        # Optional dependency, only needed with CACHE_BACKEND=redis
+        import redis.asyncio as redis
+        # RESP2, which every Redis protocol server speaks; redis-py 8 asks for RESP3 otherwise
+        self.client = redis.from_url(self.url, decode_responses=True, protocol=2)
+
+    async def get(self, key: str) -> Tuple[Optional[str], int]:
+        """The value of key, if it was written in the current generation, and that generation."""
+        value, generation = await self.client.mget(key, f"{GENERATION_PREFIX}{key}")
+        generation = int(generation or 0)
+        if value is None:
+            return None, generation
+        written, _, value = value.partition(":")
+        return (value if int(written) == generation else None), generation
+
+    async def set(self, key: str, value: str, ttl: float, generation: int):
+        await self.client.set(key, f"{generation}:{value}", px=int(ttl * 1000))
+
+    async def delete(self, *keys: str):
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.incr(f"{GENERATION_PREFIX}{key}")
+            # Outlives any value written in an older generation, which then cannot come back
+            pipeline.expire(f"{GENERATION_PREFIX}{key}", GENERATION_RETENTION)
+        pipeline.delete(*keys)
+        await pipeline.execute()
+
+    async def publish(self, keys: List[str]):
+        await self.client.publish(self.channel, json.dumps(keys))
+
+    async def listen(self, on_invalidate: Callable[[List[str]], Awaitable[None]]):
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        await on_invalidate(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation subscription lost: {str(e)}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+class SQLiteCacheStore:
+    """L2 in a SQLite file shared by the workers of one host.
+
+    SQLite has no pub/sub, so invalidations are rows in a log table that every worker polls.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.5, log_retention: float = 60):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.log_retention = log_retention
+        self.connection = None
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, parameters=()):
+        with self._lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    async def _run(self, sql: str, parameters=()):
+        return await asyncio.to_thread(self._execute, sql, parameters)
+
+    async def start(self):
+        # Opened in each worker after the fork; connections must not be shared between processes
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self._execute("PRAGMA table_info(entries)")]
+        if columns and "generation" not in columns:
+            # Written by a version without generations; it only holds cached values
+            self._execute("DROP TABLE entries")
+        self._execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, generation INTEGER, expires_at REAL)")
+        self._execute("CREATE TABLE IF NOT EXISTS generations (key TEXT PRIMARY KEY, generation INTEGER, updated_at REAL)")
+        self._execute("CREATE TABLE IF NOT EXISTS invalidations (id INTEGER PRIMARY KEY AUTOINCREMENT, keys TEXT, created_at REAL)")
+
+    async def get(self, key: str) -> Tuple[Optional[str], int]:
+        """The value of key, if it was written in the current generation, and that generation."""
+        rows = await self._run(
+            "SELECT e.value, COALESCE(g.generation, 0) FROM (SELECT ? AS key) k "
+            "LEFT JOIN generations g ON g.key = k.key "
+            "LEFT JOIN entries e ON e.key = k.key AND e.expires_at > ? AND e.generation = COALESCE(g.generation, 0)",
+            (key, time.time()))
+        return rows[0][0], rows[0][1]
+
+    async def set(self, key: str, value: str, ttl: float, generation: int):
+        await self._run("INSERT OR REPLACE INTO entries (key, value, generation, expires_at) VALUES (?, ?, ?, ?)",
+                        (key, value, generation, time.time() + ttl))
+
+    def _delete(self, keys):
+        now = time.time()
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.executemany(
+                    "INSERT INTO generations (key, generation, updated_at) VALUES (?, 1, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET generation = generation + 1, updated_at = excluded.updated_at",
+                    [(key, now) for key in keys])
+                self.connection.execute(f"DELETE FROM entries WHERE key IN ({','.join('?' * len(keys))})", keys)
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    async def delete(self, *keys: str):
+        await asyncio.to_thread(self._delete, keys)
+
+    async def publish(self, keys: List[str]):
+        await self._run("INSERT INTO invalidations (keys, created_at) VALUES (?, ?)", (json.dumps(keys), time.time()))
+
+    async def listen(self, on_invalidate: Callable[[List[str]], Awaitable[None]]):
+        last_id = (await self._run("SELECT COALESCE(MAX(id), 0) FROM invalidations"))[0][0]
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                rows = await self._run("SELECT id, keys FROM invalidations WHERE id > ? ORDER BY id", (last_id,))
+                for row_id, keys in rows:
+                    last_id = row_id
+                    await on_invalidate(json.loads(keys))
+                now = time.time()
+                await self._run("DELETE FROM invalidations WHERE created_at < ?", (now - self.log_retention,))
+                await self._run("DELETE FROM entries WHERE expires_at < ?", (now,))
+                await self._run("DELETE FROM generations WHERE updated_at < ?", (now - GENERATION_RETENTION,))
+            except sqlite3.Error as e:
+                logger.error(f"Error polling cache invalidations: {str(e)}")
+
+    async def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+class TieredCache:
+    def __init__(self, l1: MemoryCacheStore, l2=None, ttl: float = 300, l1_ttl: float = 30):
+        self.l1 = l1
+        self.l2 = l2
+        self.ttl = ttl
+        self.l1_ttl = l1_ttl
+        self._listener = None
+        self._subscribers: Dict[str, List[Callable[[], None]]] = {}
+        # key -> [loads in flight, invalidations seen while they ran]
+        self._loading: Dict[str, List[int]] = {}
+
+    def on_invalidate(self, key: str, callback: Callable[[], None]):
+        """Call callback whenever key is invalidated, in this worker or, with an L2, in another one."""
+        self._subscribers.setdefault(key, []).append(callback)
+
+    def _notify(self, keys: List[str]):
+        for key in keys:
+            for callback in self._subscribers.get(key, []):
+                callback()
+
+    async def start(self):
+        if self.l2 is not None:
+            await self.l2.start()
+            self._listener = asyncio.create_task(self.l2.listen(self._drop_local))
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self.l2 is not None:
+            await self.l2.close()
+
+    def _invalidated(self, keys):
+        for key in keys:
+            loading = self._loading.get(key)
+            if loading is not None:
+                loading[1] += 1
+
+    async def _drop_local(self, keys: List[str]):
+        self._invalidated(keys)
+        for key in keys:
+            await self.l1.delete(key)
+        self._notify(keys)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        """The cached value of key, or the result of loader, which is then cached. None is not cached."""
+        cache = key.split(":", 1)[0]
+        if self.l2 is None:
+            SHARED_CACHE_REQUESTS.labels(cache, "uncached").inc()
+            return await loader()
+
+        value = await self.l1.get(key)
+        if value is not None:
+            SHARED_CACHE_REQUESTS.labels(cache, "l1").inc()
+            return orjson.loads(value)
+
+        loading = self._loading.setdefault(key, [0, 0])
+        loading[0] += 1
+        invalidations = loading[1]
+        try:
+            generation = None
+            try:
+                value, generation = await self.l2.get(key)
+            except Exception as e:
+                # A slow or missing L2 degrades to a database read, never to an error
+                logger.error(f"Error reading {key} from the shared cache: {str(e)}")
+            if value is not None:
+                SHARED_CACHE_REQUESTS.labels(cache, "l2").inc()
+                if loading[1] == invalidations:
+                    await self.l1.set(key, value, min(self.l1_ttl, ttl or self.ttl))
+                return orjson.loads(value)
+
+            SHARED_CACHE_REQUESTS.labels(cache, "miss").inc()
+            result = await loader()
+            # Invalidated while loading: the result may predate the write, so it is returned but not kept
+            if result is None or loading[1] != invalidations:
+                return result
+            value = orjson.dumps(result).decode("utf-8")
+            await self.l1.set(key, value, min(self.l1_ttl, ttl or self.ttl))
+            if generation is not None:
+                try:
+                    await self.l2.set(key, value, ttl or self.ttl, generation)
+                except Exception as e:
+                    logger.error(f"Error writing {key} to the shared cache: {str(e)}")
+            return result
+        finally:
+            loading[0] -= 1
+            if not loading[0]:
+                del self._loading[key]
+
+    async def invalidate(self, *keys: str):
+        self._invalidated(keys)
+        for key in keys:
+            await self.l1.delete(key)
+        self._notify(list(keys))
+        if self.l2 is not None and keys:
+            try:
+                await self.l2.delete(*keys)
+                await self.l2.publish(list(keys))
+            except Exception as e:
+                logger.error(f"Error invalidating {', '.join(keys)} in the shared cache: {str(e)}")
+
+def create_cache() -> TieredCache:
+    """Build the cache selected by CACHE_BACKEND ("memory", "redis" or "sqlite")."""
+    backend = os.getenv("CACHE_BACKEND", "memory").lower()
+    if backend == "redis":
+        l2 = RedisCacheStore(os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"))
+    elif backend == "sqlite":
+        l2 = SQLiteCacheStore(os.getenv("CACHE_SQLITE_PATH", "cache.sqlite3"))
+    elif backend == "memory":
+        l2 = None
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+    return TieredCache(
+        MemoryCacheStore(max_entries=int(os.getenv("CACHE_L1_MAX_ENTRIES", "10000"))),
+        l2,
+        ttl=float(os.getenv("CACHE_TTL_SECONDS", "300")),
+        l1_ttl=float(os.getenv("CACHE_L1_TTL_SECONDS", "30"))
+    )
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+
+    async def invalidate(keys: List[str]):
+        cache = create_cache()
+        if cache.l2 is None:
+            sys.exit("CACHE_BACKEND=memory has no shared cache to invalidate. The workers pick up changes to the "
+                     f"catalogs within CATALOG_TTL_SECONDS ({os.getenv('CATALOG_TTL_SECONDS', '300')} s); "
+                     "restart them to apply changes sooner.")
+        await cache.start()
+        try:
+            await cache.invalidate(*keys)
+        finally:
+            await cache.close()
+
+    load_dotenv(override=True)
+    if len(sys.argv) < 2:
+        sys.exit("usage: python -m utilities.sharedcache KEY...")
+    asyncio.run(invalidate(sys.argv[1:]))
+    print(f"Invalidated {', '.join(sys.argv[1:])}")
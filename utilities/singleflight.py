@@ -0,0 +1,44 @@
+#singleflight.py
+#Coalesces identical concurrent reads: while a call for a key is in flight, later callers wait for
+#its result instead of sending their own Cosmos DB query.
+
+import asyncio, copy
+from prometheus_client import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+SINGLEFLIGHT_CALLS = Counter(
+    "singleflight_calls_total",
+    "Reads that started a backend call (leader) or shared one already in flight (shared)",
+    ["read", "result"]
+)
+
+class _Call:
+    __slots__ = ("task", "shared")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.shared = False
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Tuple[Hashable, ...], _Call] = {}
+
+    async def do(self, key: Tuple[Hashable, ...], fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() once per key at a time. The first element of the key names the read in metrics.
+
+        The backend call runs in its own task, so a caller that disconnects does not cancel it for
+        the others. When a result is shared every caller gets its own deep copy, because handlers
+        modify the documents they return.
+        """
+        call = self._calls.get(key)
+        if call is not None:
+            SINGLEFLIGHT_CALLS.labels(key[0], "shared").inc()
+            call.shared = True
+            return copy.deepcopy(await asyncio.shield(call.task))
+
+        SINGLEFLIGHT_CALLS.labels(key[0], "leader").inc()
+        call = _Call(asyncio.ensure_future(fn()))
+        self._calls[key] = call
+        call.task.add_done_callback(lambda _: self._calls.pop(key, None))
+        result = await asyncio.shield(call.task)
+        return copy.deepcopy(result) if call.shared else result
@@ -0,0 +1,131 @@
+#transport.py
+#Shared HTTP transport for the LLM provider SDKs.
+#Each provider gets one long-lived httpx connection pool per worker, so completions reuse
+#warm TLS connections instead of paying a handshake per request.
+#
+#Settings (per provider values override the global ones, e.g. LLM_DEEPSEEK_POOL_SIZE):
+#  LLM_POOL_SIZE, LLM_KEEPALIVE_CONNECTIONS, LLM_KEEPALIVE_EXPIRY,
+#  LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT, LLM_HTTP2
+
+import importlib.util, os
+import httpx
+from prometheus_client import Gauge
+from typing import Any, Dict, List
+
+HTTP_POOL_IN_FLIGHT = Gauge(
+    "llm_http_requests_in_flight",
+    "Requests to an LLM provider that have not finished streaming their response",
+    ["provider"],
+    multiprocess_mode="livesum"
+)
+HTTP_POOL_CONNECTIONS = Gauge(
+    "llm_http_pool_connections",
+    "Connections currently held in the provider connection pool",
+    ["provider"],
+    multiprocess_mode="livesum"
+)
+HTTP_POOL_MAX_CONNECTIONS = Gauge(
+    "llm_http_pool_max_connections",
+    "Configured size of the provider connection pool",
+    ["provider"],
+    multiprocess_mode="livesum"
+)
+
+def _setting(provider: str, name: str, default: str) -> str:
+    return os.getenv(f"LLM_{provider.upper()}_{name}", os.getenv(f"LLM_{name}", default))
+
+class TransportConfig:
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.pool_size = int(_setting(provider, "POOL_SIZE", "20"))
+        self.keepalive_connections = int(_setting(provider, "KEEPALIVE_CONNECTIONS", str(self.pool_size)))
+        self.keepalive_expiry = float(_setting(provider, "KEEPALIVE_EXPIRY", "120"))
+        self.connect_timeout = float(_setting(provider, "CONNECT_TIMEOUT", "5"))
+        self.read_timeout = float(_setting(provider, "READ_TIMEOUT", "600"))
+        # HTTP/2 needs the optional h2 package
+        self.http2 = (_setting(provider, "HTTP2", "true").lower() == "true"
+                      and importlib.util.find_spec("h2") is not None)
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+class _TrackedStream(httpx.AsyncByteStream):
+    def __init__(self, stream, on_close):
+        self.stream = stream
+        self.on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self.on_close()
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """AsyncHTTPTransport that reports in-flight requests and pool size per provider."""
+
+    def __init__(self, provider: str, **kwargs):
+        super().__init__(**kwargs)
+        self.provider = provider
+
+    def pool_connections(self) -> int:
+        return len(getattr(self._pool, "connections", ()))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        HTTP_POOL_IN_FLIGHT.labels(self.provider).inc()
+        closed = False
+
+        def on_close():
+            nonlocal closed
+            if not closed:
+                closed = True
+                HTTP_POOL_IN_FLIGHT.labels(self.provider).dec()
+                HTTP_POOL_CONNECTIONS.labels(self.provider).set(self.pool_connections())
+
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            on_close()
+            raise
+        response.stream = _TrackedStream(response.stream, on_close)
+        return response
+
+class TransportRegistry:
+    """One httpx.AsyncClient per provider, created on first use and closed in the lifespan hook."""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: List[InstrumentedTransport] = []
+
+    def client_args(self, provider: str) -> Dict[str, Any]:
+        """httpx.AsyncClient arguments, for SDKs that build their own client (google-genai)."""
+        config = TransportConfig(provider)
+        HTTP_POOL_MAX_CONNECTIONS.labels(provider).set(config.pool_size)
+        transport = InstrumentedTransport(provider, limits=config.limits, http2=config.http2)
+        self._transports.append(transport)
+        return {"transport": transport, "timeout": config.timeout}
+
+    def client(self, provider: str) -> httpx.AsyncClient:
+        if provider not in self._clients:
+            self._clients[provider] = httpx.AsyncClient(**self.client_args(provider))
+        return self._clients[provider]
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+        transports, self._transports = self._transports, []
+        for transport in transports:
+            await transport.aclose()
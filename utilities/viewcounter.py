@@ -0,0 +1,68 @@
+#viewcounter.py
+#View counts of public conversations are added up in memory and written in batches every
+#VIEW_FLUSH_INTERVAL_SECONDS, instead of one Cosmos DB write per page view. The views of a page that
+#is unpublished or deleted are discarded; the repository does not count views of a page that is gone.
+
+import asyncio, logging
+from collections import Counter
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+class ViewCounter:
+    def __init__(self, flush_one: Callable[[str, int], Awaitable[None]], interval: float = 30,
+                 max_pending: int = 1000, concurrency: int = 10):
+        self.flush_one = flush_one
+        self.interval = interval
+        self.max_pending = max_pending
+        self.concurrency = concurrency
+        self.pending: Counter = Counter()
+        self._wakeup = None
+        self._task = None
+
+    def record(self, public_id: str):
+        self.pending[public_id] += 1
+        # Many distinct pages: flush early so the batch stays small
+        if len(self.pending) >= self.max_pending and self._wakeup is not None:
+            self._wakeup.set()
+
+    def discard(self, public_id: str):
+        self.pending.pop(public_id, None)
+
+    async def flush(self):
+        pending, self.pending = self.pending, Counter()
+        items = list(pending.items())
+        for start in range(0, len(items), self.concurrency):
+            batch = items[start:start + self.concurrency]
+            results = await asyncio.gather(*(self.flush_one(public_id, count) for public_id, count in batch),
+                                           return_exceptions=True)
+            for (public_id, count), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    # Keep the views for the next flush
+                    logger.error(f"Error writing view count of {public_id}: {str(result)}")
+                    self.pending[public_id] += count
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            # Created on the loop that runs the app; a module-level Event would be bound to the first one
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
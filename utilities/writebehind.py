@@ -0,0 +1,147 @@
+#writebehind.py
+#Write-behind buffer for conversation autosaves. The client saves the whole conversation after
+#every turn; updates of the same conversation that arrive within WRITE_BEHIND_SECONDS of each other
+#are coalesced into one replace, written at the latest WRITE_BEHIND_MAX_SECONDS after the first.
+#Pending updates are flushed in the lifespan hook on shutdown.
+#
+#The buffer is per worker: the worker that took an update serves it back until it is written
+#(read-your-writes), and writes it with the _etag of the version it was based on. If that version
+#was replaced meanwhile, the update is dropped, not merged: the document is marked conflicted and
+#the next read or update of it through this worker is refused once, so the client reloads it.
+#An update taken while the previous one is being written is based on that write: flushes of a
+#document run one at a time, and the next one is written with the _etag the previous one returned.
+
+import asyncio, copy, logging, time, weakref
+from prometheus_client import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from utilities.repository import ConcurrencyConflict
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_UPDATES = Counter(
+    "write_behind_updates_total",
+    "Conversation updates taken by the write-behind buffer, by what happened to them",
+    ["result"]
+)
+
+class _Pending:
+    def __init__(self, document: Dict[str, Any], etag: Optional[str]):
+        self.document = document
+        self.etag = etag
+        self.first_at = time.monotonic()
+        self.timer = None
+        # Taken while the previous update was being written; its etag is the one that write returns
+        self.chained = False
+
+class WriteBehindBuffer:
+    def __init__(self, write: Callable[[Dict[str, Any], Optional[str]], Awaitable[Optional[str]]],
+                 delay: float = 2, max_delay: float = 10, retry_delay: float = 5):
+        self.write = write
+        self.delay = delay
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.pending: Dict[Hashable, _Pending] = {}
+        self.writing: Dict[Hashable, _Pending] = {}
+        self.conflicts = set()
+        # One flush at a time per document; a lock goes away with the last flush waiting on it
+        self._locks = weakref.WeakValueDictionary()
+        self._tasks = set()
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """The pending version of a document, with the _etag of the stored version it replaces."""
+        pending = self.pending.get(key) or self.writing.get(key)
+        if pending is None:
+            return None
+        return {**copy.deepcopy(pending.document), '_etag': pending.etag}
+
+    def keys(self) -> List[Hashable]:
+        """The keys of the documents with a pending update."""
+        return list(self.pending)
+
+    def take_conflict(self, key: Hashable) -> bool:
+        """Whether the last buffered update of key was dropped because of a conflict; clears the mark."""
+        if key in self.conflicts:
+            self.conflicts.discard(key)
+            return True
+        return False
+
+    def put(self, key: Hashable, document: Dict[str, Any], etag: Optional[str]):
+        """Buffer a full replacement of the document stored with this _etag."""
+        pending = self.pending.get(key)
+        if pending is None:
+            pending = self.pending[key] = _Pending(document, etag)
+            pending.chained = key in self.writing
+            WRITE_BEHIND_UPDATES.labels("buffered").inc()
+        else:
+            # Replaces the buffered update, which is never written
+            pending.document = document
+            WRITE_BEHIND_UPDATES.labels("coalesced").inc()
+        self._schedule(key, pending, min(self.delay, pending.first_at + self.max_delay - time.monotonic()))
+
+    def _schedule(self, key: Hashable, pending: _Pending, delay: float):
+        if pending.timer is not None:
+            pending.timer.cancel()
+        pending.timer = asyncio.get_running_loop().call_later(max(0.0, delay), self._spawn_flush, key)
+
+    def _spawn_flush(self, key: Hashable):
+        task = asyncio.create_task(self.flush(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, key: Hashable):
+        """Write the pending update of key now, if there is one."""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        async with lock:
+            pending = self.pending.pop(key, None)
+            if pending is None:
+                return
+            if pending.timer is not None:
+                pending.timer.cancel()
+            self.writing[key] = pending
+            try:
+                etag = await self.write(pending.document, pending.etag)
+                WRITE_BEHIND_UPDATES.labels("written").inc()
+                following = self.pending.get(key)
+                if following is not None and following.chained:
+                    following.etag = etag
+                    following.chained = False
+            except ConcurrencyConflict:
+                # Written over by another worker or request; retrying would overwrite that change
+                logger.warning(f"Dropped buffered update of {key}: the stored version changed")
+                WRITE_BEHIND_UPDATES.labels("conflict").inc()
+                self.conflicts.add(key)
+                # So is an update taken meanwhile, which was based on the dropped one
+                following = self.pending.get(key)
+                if following is not None and following.chained:
+                    self.discard(key)
+                    self.conflicts.add(key)
+            except Exception as e:
+                logger.error(f"Error writing buffered update of {key}: {str(e)}")
+                WRITE_BEHIND_UPDATES.labels("failed").inc()
+                following = self.pending.get(key)
+                if following is None:
+                    # Retry later
+                    pending.timer = None
+                    self.pending[key] = pending
+                    self._schedule(key, pending, self.retry_delay)
+                elif following.chained:
+                    # The newer update replaces this one over the version this one was based on
+                    following.etag = pending.etag
+                    following.chained = False
+            finally:
+                del self.writing[key]
+
+    def discard(self, key: Hashable):
+        """Drop the pending update of a document that was deleted."""
+        self.conflicts.discard(key)
+        pending = self.pending.pop(key, None)
+        if pending is not None and pending.timer is not None:
+            pending.timer.cancel()
+
+    async def flush_all(self):
+        for key in list(self.pending):
+            await self.flush(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)